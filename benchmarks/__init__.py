@@ -0,0 +1,6 @@
+"""
+Benchmarks for todoman.
+
+These are not part of the test suite; each module can be run directly with
+``python -m benchmarks.<name> --help``.
+"""
@@ -0,0 +1,300 @@
+"""
+Measures cache refresh and query performance on large collections.
+
+For each size, a synthetic vdir is generated (or reused from ``--workdir``),
+and the following are timed:
+
+* A cold refresh, with an empty cache.
+* A warm refresh, when nothing has changed.
+* A partial refresh, after editing some files.
+* The common ``Cache.todos`` filter combinations.
+
+Throughput, latency and peak memory are reported, and can be saved as JSON.
+Peak memory is the process' maximum RSS, unless ``--tracemalloc`` is used, in
+which case allocations are traced per phase (at a considerable cost in speed).
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import re
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from benchmarks import vdir
+from todoman.model import Database
+
+SIZES = [1000, 10000, 100000]
+
+# Name -> keyword arguments to Cache.todos.
+QUERIES = OrderedDict([
+    ('default', {}),
+    ('any status', {'status': ['ANY']}),
+    ('one list', {'lists': ['List 0']}),
+    ('priority', {'priority': 4}),
+    ('due in 24h', {'due': 24}),
+    ('startable', {'startable': True}),
+    ('category', {'category': 'work'}),
+    ('grep', {'grep': 'milk'}),
+    ('start before', {'start': (True, datetime.now() + timedelta(days=7))}),
+    ('sort by due', {'sort': ['due', '-priority']}),
+    (
+        'combined',
+        {
+            'lists': ['List 0', 'List 1'],
+            'priority': 5,
+            'due': 24 * 7,
+            'startable': True,
+        },
+    ),
+])
+
+SUMMARY_RE = re.compile(r'^SUMMARY:.*$', re.MULTILINE)
+
+
+def _max_rss():
+    """Returns the process' maximum RSS, in bytes."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+class Phase:
+    def __init__(self):
+        self.seconds = None
+        self.peak_bytes = None
+
+
+@contextmanager
+def measure(trace):
+    """Measures the duration and peak memory of the wrapped code."""
+    phase = Phase()
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        yield phase
+    finally:
+        phase.seconds = time.perf_counter() - start
+        if trace:
+            phase.peak_bytes = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        else:
+            phase.peak_bytes = _max_rss()
+
+
+def prepare_vdir(workdir, size, lists, seed):
+    """
+    Generates a vdir, or reuses one previously generated in ``workdir``.
+    """
+    root = os.path.join(workdir, 'vdir-{}-{}-{}'.format(size, lists, seed))
+    marker = os.path.join(root, '.complete')
+    if os.path.exists(marker):
+        return sorted(vdir.list_path(root, i) for i in range(lists))
+
+    shutil.rmtree(root, ignore_errors=True)
+    paths = vdir.generate(root, size, lists, seed)
+    open(marker, 'w').close()
+    return paths
+
+
+def edit_files(paths, count, seed):
+    """
+    Changes the summary of ``count`` random files, and bumps their mtime.
+
+    The edits are deterministic, so that re-running this keeps a reused vdir
+    identical.
+    """
+    files = sorted(
+        os.path.join(path, entry)
+        for path in paths
+        for entry in os.listdir(path)
+        if entry.endswith('.ics')
+    )
+    rng = random.Random(seed)
+    edited = rng.sample(files, min(count, len(files)))
+    now = time.time()
+    for i, path in enumerate(edited):
+        with open(path, newline='') as f:
+            content = f.read()
+        content = SUMMARY_RE.sub('SUMMARY:Edited todo {}\r'.format(i), content)
+        with open(path, 'w', newline='') as f:
+            f.write(content)
+        # Make sure the change is picked up, even with coarse mtimes.
+        os.utime(path, (now + 1, now + 1))
+    return len(edited)
+
+
+def _refresh_result(phase, todos):
+    return OrderedDict([
+        ('seconds', phase.seconds),
+        ('todos_per_second', todos / phase.seconds if todos else None),
+        ('peak_bytes', phase.peak_bytes),
+    ])
+
+
+def benchmark_size(workdir, size, lists, seed, edits, repeat, trace):
+    paths = prepare_vdir(workdir, size, lists, seed)
+    cache_path = os.path.join(workdir, 'cache-{}.sqlite3'.format(size))
+    if os.path.exists(cache_path):
+        os.remove(cache_path)
+
+    results = OrderedDict([('todos', size)])
+
+    with measure(trace) as phase:
+        db = Database(paths, cache_path)
+    results['cold_refresh'] = _refresh_result(phase, size)
+
+    with measure(trace) as phase:
+        db.update_cache()
+    results['warm_refresh'] = _refresh_result(phase, size)
+
+    edited = edit_files(paths, edits, seed)
+    with measure(trace) as phase:
+        db.update_cache()
+    results['partial_refresh'] = _refresh_result(phase, edited)
+    results['partial_refresh']['edited'] = edited
+
+    queries = OrderedDict()
+    for name, kwargs in QUERIES.items():
+        samples = []
+        for _ in range(repeat):
+            with measure(trace) as phase:
+                count = sum(1 for _ in db.todos(**kwargs))
+            samples.append(phase.seconds)
+        queries[name] = OrderedDict([
+            ('rows', count),
+            ('min_seconds', min(samples)),
+            ('median_seconds', statistics.median(samples)),
+            (
+                'rows_per_second',
+                count / statistics.median(samples) if count else None,
+            ),
+            ('peak_bytes', phase.peak_bytes),
+        ])
+    results['queries'] = queries
+
+    db.cache._conn.close()
+    os.remove(cache_path)
+    return results
+
+
+def report(results, file=sys.stdout):
+    for size in results['sizes']:
+        print('\n{} todos'.format(size['todos']), file=file)
+        for name in ('cold_refresh', 'warm_refresh', 'partial_refresh'):
+            phase = size[name]
+            print(
+                '  {:<20} {:>9.3f}s {:>12} {:>8.1f}MiB'.format(
+                    name.replace('_', ' '),
+                    phase['seconds'],
+                    '{:.0f}/s'.format(phase['todos_per_second'])
+                    if phase['todos_per_second'] else '',
+                    phase['peak_bytes'] / 2**20,
+                ),
+                file=file,
+            )
+        for name, query in size['queries'].items():
+            print(
+                '  {:<20} {:>9.3f}s {:>12} {:>8} rows'.format(
+                    name,
+                    query['median_seconds'],
+                    '{:.0f}/s'.format(query['rows_per_second'])
+                    if query['rows_per_second'] else '',
+                    query['rows'],
+                ),
+                file=file,
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip(),
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        '--sizes',
+        type=lambda s: [int(size) for size in s.split(',')],
+        default=SIZES,
+        help='Comma-separated collection sizes (default: {}).'.format(
+            ','.join(str(size) for size in SIZES)
+        ),
+    )
+    parser.add_argument('--lists', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument(
+        '--edits',
+        type=int,
+        default=100,
+        help='Number of files to edit before the partial refresh.',
+    )
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=5,
+        help='Number of times to run each query.',
+    )
+    parser.add_argument(
+        '--tracemalloc',
+        action='store_true',
+        help='Trace allocations to measure the peak memory of each phase.',
+    )
+    parser.add_argument(
+        '--workdir',
+        metavar='PATH',
+        help='Keep generated vdirs here, and reuse them in later runs.',
+    )
+    parser.add_argument('--output', '-o', metavar='PATH')
+    args = parser.parse_args()
+
+    # Multi-VTODO files are read-only, and todoman warns about each of them.
+    logging.getLogger('todoman').setLevel(logging.ERROR)
+
+    from todoman import __version__
+
+    results = OrderedDict([
+        ('todoman', __version__),
+        ('python', platform.python_version()),
+        ('implementation', platform.python_implementation()),
+        ('platform', platform.platform()),
+        ('timestamp', time.time()),
+        ('lists', args.lists),
+        ('seed', args.seed),
+        ('tracemalloc', args.tracemalloc),
+        ('sizes', []),
+    ])
+
+    with tempfile.TemporaryDirectory(prefix='todoman-bench-') as tmpdir:
+        workdir = args.workdir or tmpdir
+        os.makedirs(workdir, exist_ok=True)
+        for size in args.sizes:
+            results['sizes'].append(
+                benchmark_size(
+                    workdir,
+                    size,
+                    args.lists,
+                    args.seed,
+                    args.edits,
+                    args.repeat,
+                    args.tracemalloc,
+                )
+            )
+
+    report(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""
+Measures the throughput of bulk completions with each durability mode.
+
+For each mode, a list of todos is generated, and then all of them are
+completed at once (as ``todo done 1 2 3 ...`` does), timing how long saving
+them takes.
+
+Syncing is what differs between modes, and its cost depends entirely on the
+filesystem: on a tmpfs (which ``/tmp`` often is), syncs are free. Use
+``--workdir`` to run the benchmark on the disk your todos live on.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+
+from todoman.durability import DURABILITY_MODES, NONE
+from todoman.model import Database, Todo
+
+COUNT = 1000
+
+
+def prepare(root, count):
+    """
+    Creates a database with a single list of ``count`` uncompleted todos.
+    """
+    shutil.rmtree(root, ignore_errors=True)
+    path = os.path.join(root, 'list')
+    os.makedirs(path)
+
+    db = Database([path], os.path.join(root, 'cache.sqlite3'))
+    todo_list = next(db.lists())
+    todos = []
+    for i in range(count):
+        todo = Todo(new=True, list=todo_list)
+        todo.summary = 'Todo {}'.format(i)
+        todos.append(todo)
+    db.save_all(todos, durability=NONE)
+
+    return db
+
+
+def benchmark_mode(workdir, mode, count):
+    root = os.path.join(workdir, mode)
+    db = prepare(root, count)
+    todos = list(db.todos())
+    for todo in todos:
+        todo.complete()
+
+    start = time.perf_counter()
+    db.save_all(todos, durability=mode)
+    seconds = time.perf_counter() - start
+
+    db.cache._conn.close()
+    shutil.rmtree(root)
+
+    return OrderedDict([
+        ('mode', mode),
+        ('todos', len(todos)),
+        ('seconds', seconds),
+        ('todos_per_second', len(todos) / seconds),
+    ])
+
+
+def report(results, file=sys.stdout):
+    print(
+        '\n{:<8} {:>7} {:>10} {:>12}'.format(
+            'mode',
+            'todos',
+            'seconds',
+            'todos/s',
+        ),
+        file=file,
+    )
+    for mode in results['modes']:
+        print(
+            '{:<8} {:>7} {:>9.3f}s {:>10.0f}/s'.format(
+                mode['mode'],
+                mode['todos'],
+                mode['seconds'],
+                mode['todos_per_second'],
+            ),
+            file=file,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip(),
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        '--count',
+        type=int,
+        default=COUNT,
+        help='Number of todos to complete (default: {}).'.format(COUNT),
+    )
+    parser.add_argument(
+        '--modes',
+        type=lambda s: s.split(','),
+        default=list(DURABILITY_MODES),
+        help='Comma-separated durability modes (default: {}).'.format(
+            ','.join(DURABILITY_MODES)
+        ),
+    )
+    parser.add_argument(
+        '--workdir',
+        metavar='PATH',
+        help='Run the benchmark in this directory.',
+    )
+    parser.add_argument('--output', '-o', metavar='PATH')
+    args = parser.parse_args()
+
+    from todoman import __version__
+
+    results = OrderedDict([
+        ('todoman', __version__),
+        ('python', platform.python_version()),
+        ('implementation', platform.python_implementation()),
+        ('platform', platform.platform()),
+        ('timestamp', time.time()),
+        ('modes', []),
+    ])
+
+    if args.workdir:
+        os.makedirs(args.workdir, exist_ok=True)
+    with tempfile.TemporaryDirectory(
+        prefix='todoman-bench-',
+        dir=args.workdir,
+    ) as workdir:
+        for mode in args.modes:
+            results['modes'].append(
+                benchmark_mode(workdir, mode, args.count)
+            )
+
+    report(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,264 @@
+"""
+Measures start-up time of the ``todo`` command line.
+
+Each entry point is run several times in a fresh interpreter against a
+synthetic vdir, and its wall time is recorded. Each entry point is also run
+once with ``-X importtime``, and import time is attributed to individual
+modules and top-level packages.
+
+Results are written as JSON, and two result files can be compared with
+``--compare``.
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+
+from benchmarks import vdir
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Name -> arguments. `new` must be last, since it modifies the vdir.
+ENTRY_POINTS = OrderedDict([
+    ('todo', []),
+    ('todo list', ['list']),
+    ('todo show', ['show', '1']),
+    ('todo _complete', ['_complete', 'ids']),
+    ('todo new', ['new', '-l', 'List 0', 'Benchmark todo']),
+])
+
+IMPORTTIME_RE = re.compile(
+    r'^import time:\s+(?P<self>\d+) \|\s+(?P<cumulative>\d+) \|'
+    r'(?P<indent> *)(?P<module>\S+)$'
+)
+
+
+def parse_importtime(stderr):
+    """
+    Parses the output of ``python -X importtime``.
+
+    :returns: A list of dicts with the keys ``module``, ``self_us``,
+        ``cumulative_us`` and ``depth``, in import order.
+    """
+    imports = []
+    for line in stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if not match:
+            continue
+        imports.append({
+            'module': match.group('module'),
+            'self_us': int(match.group('self')),
+            'cumulative_us': int(match.group('cumulative')),
+            'depth': (len(match.group('indent')) - 1) // 2,
+        })
+    return imports
+
+
+def by_package(imports):
+    """
+    Sums the self time of each import by top-level package.
+
+    Self times are used (rather than cumulative ones) so that nothing is
+    counted twice.
+    """
+    packages = {}
+    for entry in imports:
+        package = entry['module'].split('.')[0]
+        packages[package] = packages.get(package, 0) + entry['self_us']
+    return OrderedDict(
+        sorted(packages.items(), key=lambda item: item[1], reverse=True)
+    )
+
+
+def summarize(samples):
+    return OrderedDict([
+        ('min', min(samples)),
+        ('median', statistics.median(samples)),
+        ('mean', statistics.mean(samples)),
+        ('max', max(samples)),
+        ('samples', samples),
+    ])
+
+
+class Environment:
+    """A temporary vdir, configuration and cache to run todoman against."""
+
+    def __init__(self, root, todos, lists, seed):
+        self.root = root
+        vdir.generate(os.path.join(root, 'vdir'), todos, lists, seed)
+
+        self.config = os.path.join(root, 'todoman.conf')
+        with open(self.config, 'w') as f:
+            f.write(
+                '[main]\n'
+                'path = {}\n'
+                'cache_path = {}\n'
+                'date_format = %Y-%m-%d\n'
+                'time_format = %H:%M\n'
+                'default_list = List 0\n'.format(
+                    os.path.join(root, 'vdir', '*'),
+                    os.path.join(root, 'cache', 'cache.sqlite3'),
+                )
+            )
+
+        self.env = os.environ.copy()
+        self.env['PYTHONPATH'] = os.pathsep.join(
+            filter(bool, [ROOT, self.env.get('PYTHONPATH')])
+        )
+        self.env['TODOMAN_CONFIG'] = self.config
+        self.env['XDG_CACHE_HOME'] = os.path.join(root, 'cache')
+
+    def run(self, args, python_args=()):
+        argv = [sys.executable] + list(python_args) + ['-m', 'todoman']
+        start = time.perf_counter()
+        result = subprocess.run(
+            argv + args,
+            env=self.env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+        )
+        elapsed = time.perf_counter() - start
+        if result.returncode:
+            raise RuntimeError(
+                '{} failed:\n{}'.format(' '.join(args), result.stderr)
+            )
+        return elapsed, result.stderr
+
+
+def benchmark(todos, lists, runs, seed, entry_points=ENTRY_POINTS):
+    results = OrderedDict()
+    with tempfile.TemporaryDirectory(prefix='todoman-bench-') as root:
+        environment = Environment(root, todos, lists, seed)
+
+        # Populate both the configuration and todo caches.
+        cold, _ = environment.run(['list'])
+
+        for name, args in entry_points.items():
+            samples = [environment.run(args)[0] for _ in range(runs)]
+            _, stderr = environment.run(args, ['-X', 'importtime'])
+            imports = parse_importtime(stderr)
+
+            results[name] = OrderedDict([
+                ('args', args),
+                ('wall_s', summarize(samples)),
+                ('import_us', sum(entry['self_us'] for entry in imports)),
+                ('packages_us', by_package(imports)),
+                ('imports', imports),
+            ])
+
+    from todoman import __version__
+
+    return OrderedDict([
+        ('todoman', __version__),
+        ('python', platform.python_version()),
+        ('implementation', platform.python_implementation()),
+        ('platform', platform.platform()),
+        ('timestamp', time.time()),
+        ('todos', todos),
+        ('lists', lists),
+        ('runs', runs),
+        ('seed', seed),
+        ('cold_refresh_s', cold),
+        ('entry_points', results),
+    ])
+
+
+def report(results, top, file=sys.stdout):
+    print(
+        'todoman {todoman}, {implementation} {python}, {todos} todos in '
+        '{lists} lists, {runs} runs'.format(**results),
+        file=file,
+    )
+    print(
+        'cold `todo list`: {:.3f}s'.format(results['cold_refresh_s']),
+        file=file,
+    )
+    for name, result in results['entry_points'].items():
+        wall = result['wall_s']
+        print(
+            '\n{}: median {:.3f}s, min {:.3f}s, max {:.3f}s, '
+            'imports {:.3f}s'.format(
+                name,
+                wall['median'],
+                wall['min'],
+                wall['max'],
+                result['import_us'] / 1e6,
+            ),
+            file=file,
+        )
+        packages = list(result['packages_us'].items())[:top]
+        for package, us in packages:
+            print('  {:>8.1f}ms  {}'.format(us / 1e3, package), file=file)
+
+
+def compare(old, new, file=sys.stdout):
+    print(
+        'todoman {} -> {}'.format(old['todoman'], new['todoman']),
+        file=file,
+    )
+    for name, result in new['entry_points'].items():
+        if name not in old['entry_points']:
+            continue
+        before = old['entry_points'][name]
+        print(
+            '{:<12} wall {:+7.1%}  imports {:+7.1%}'.format(
+                name,
+                result['wall_s']['median'] / before['wall_s']['median'] - 1,
+                result['import_us'] / before['import_us'] - 1,
+            ),
+            file=file,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip(),
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('--todos', type=int, default=1000)
+    parser.add_argument('--lists', type=int, default=4)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument(
+        '--top',
+        type=int,
+        default=8,
+        help='Number of packages to show per entry point.',
+    )
+    parser.add_argument(
+        '--output',
+        '-o',
+        metavar='PATH',
+        help='Write results as JSON to this file.',
+    )
+    parser.add_argument(
+        '--compare',
+        metavar='PATH',
+        help='Compare results with a previously written JSON file.',
+    )
+    args = parser.parse_args()
+
+    results = benchmark(args.todos, args.lists, args.runs, args.seed)
+    report(results, args.top)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        print()
+        compare(old, results)
+
+
+if __name__ == '__main__':
+    main()
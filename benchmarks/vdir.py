@@ -0,0 +1,232 @@
+"""
+Generates reproducible synthetic vdirs for benchmarking.
+
+The generated todos try to resemble real-world collections: most have a
+summary and a due date, some have priorities, categories, start dates, long
+descriptions or recurrence rules, a fraction is completed or cancelled, and a
+few files contain more than one VTODO.
+"""
+import argparse
+import os
+import random
+from datetime import date, datetime, time, timedelta
+
+CATEGORIES = [
+    'errands',
+    'home',
+    'work',
+    'finance',
+    'health',
+    'family',
+    'garden',
+    'reading',
+]
+RRULES = [
+    'FREQ=DAILY',
+    'FREQ=WEEKLY',
+    'FREQ=WEEKLY;BYDAY=MO,WE,FR',
+    'FREQ=MONTHLY;BYMONTHDAY=1',
+    'FREQ=DAILY;COUNT=30',
+    'FREQ=WEEKLY;UNTIL=20300101T000000Z',
+]
+WORDS = (
+    'buy milk call bank fix sink write report review patch water plants '
+    'renew passport book flight pay rent clean garage send invoice update '
+    'resume walk dog plan trip read chapter backup laptop'
+).split()
+
+# Fraction of todos that have each property.
+DUE_RATIO = 0.6
+DUE_DATE_RATIO = 0.25  # Of those with a due date, how many are dates.
+START_RATIO = 0.2
+PRIORITY_RATIO = 0.5
+CATEGORIES_RATIO = 0.4
+DESCRIPTION_RATIO = 0.3
+LARGE_DESCRIPTION_RATIO = 0.05
+RRULE_RATIO = 0.1
+COMPLETED_RATIO = 0.15
+CANCELLED_RATIO = 0.05
+MULTI_VTODO_RATIO = 0.01
+
+
+def default_epoch():
+    """
+    All generated dates are relative to the epoch. By default, that's today,
+    so that filters like ``--due`` select a realistic share of todos, while
+    output is still stable within a day.
+    """
+    return datetime.combine(date.today(), time(9))
+
+
+def fold(line):
+    """Folds a content line as per RFC 5545, section 3.1."""
+    encoded = line.encode()
+    if len(encoded) <= 75:
+        return line + '\r\n'
+
+    chunks = []
+    limit = 75
+    while encoded:
+        cut = min(limit, len(encoded))
+        # Never split a multi-byte character:
+        while cut < len(encoded) and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        chunks.append(encoded[:cut].decode())
+        encoded = encoded[cut:]
+        limit = 74
+    return '\r\n '.join(chunks) + '\r\n'
+
+
+def escape(text):
+    return (
+        text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+        .replace('\n', '\\n')
+    )
+
+
+def _format_dt(dt):
+    return dt.strftime('%Y%m%dT%H%M%SZ')
+
+
+def _sentence(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize()
+
+
+def vtodo_lines(rng, index, now):
+    """Returns the content lines for a single random VTODO."""
+    uid = 'bench-{:08d}@todoman'.format(index)
+    created = now - timedelta(days=rng.randint(0, 365), minutes=index % 1440)
+    lines = [
+        'BEGIN:VTODO',
+        'UID:{}'.format(uid),
+        'SUMMARY:{}'.format(escape(_sentence(rng, rng.randint(2, 8)))),
+        'CREATED:{}'.format(_format_dt(created)),
+        'DTSTAMP:{}'.format(_format_dt(created)),
+        'LAST-MODIFIED:{}'.format(_format_dt(created)),
+        'SEQUENCE:{}'.format(rng.randint(0, 5)),
+    ]
+
+    due = None
+    if rng.random() < DUE_RATIO:
+        due = now + timedelta(
+            days=rng.randint(-60, 120),
+            hours=rng.randint(0, 23),
+        )
+        if rng.random() < DUE_DATE_RATIO:
+            lines.append('DUE;VALUE=DATE:{}'.format(due.strftime('%Y%m%d')))
+        else:
+            lines.append('DUE:{}'.format(_format_dt(due)))
+
+    if rng.random() < START_RATIO:
+        start = (due or now) - timedelta(days=rng.randint(1, 14))
+        lines.append('DTSTART:{}'.format(_format_dt(start)))
+
+    if rng.random() < PRIORITY_RATIO:
+        lines.append('PRIORITY:{}'.format(rng.randint(1, 9)))
+
+    if rng.random() < CATEGORIES_RATIO:
+        categories = rng.sample(CATEGORIES, rng.randint(1, 3))
+        lines.append('CATEGORIES:{}'.format(','.join(categories)))
+
+    if rng.random() < DESCRIPTION_RATIO:
+        if rng.random() < LARGE_DESCRIPTION_RATIO / DESCRIPTION_RATIO:
+            paragraphs = rng.randint(20, 60)
+        else:
+            paragraphs = rng.randint(1, 3)
+        description = '\n'.join(
+            _sentence(rng, rng.randint(5, 25)) + '.'
+            for _ in range(paragraphs)
+        )
+        lines.append('DESCRIPTION:{}'.format(escape(description)))
+
+    if due and rng.random() < RRULE_RATIO:
+        lines.append('RRULE:{}'.format(rng.choice(RRULES)))
+
+    status = rng.random()
+    if status < COMPLETED_RATIO:
+        completed = created + timedelta(days=rng.randint(0, 30))
+        lines.append('STATUS:COMPLETED')
+        lines.append('COMPLETED:{}'.format(_format_dt(completed)))
+        lines.append('PERCENT-COMPLETE:100')
+    elif status < COMPLETED_RATIO + CANCELLED_RATIO:
+        lines.append('STATUS:CANCELLED')
+    else:
+        lines.append('STATUS:NEEDS-ACTION')
+        if rng.random() < 0.1:
+            lines.append('PERCENT-COMPLETE:{}'.format(rng.randint(1, 99)))
+
+    lines.append('END:VTODO')
+    return uid, lines
+
+
+def calendar(vtodos):
+    """Wraps a list of VTODOs (as content lines) into a VCALENDAR."""
+    lines = ['BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:-//todoman//bench//EN']
+    for vtodo in vtodos:
+        lines.extend(vtodo)
+    lines.append('END:VCALENDAR')
+    return ''.join(fold(line) for line in lines)
+
+
+def list_path(root, index):
+    return os.path.join(root, 'list{:02d}'.format(index))
+
+
+def generate(root, count, lists=4, seed=0, epoch=None):
+    """
+    Generates a vdir with ``count`` todos spread over ``lists`` lists.
+
+    The output is fully determined by ``count``, ``lists``, ``seed`` and
+    ``epoch``.
+
+    :returns: A list of the generated list directories.
+    """
+    rng = random.Random(seed)
+    epoch = epoch or default_epoch()
+    paths = [list_path(root, i) for i in range(lists)]
+    for i, path in enumerate(paths):
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, 'displayname'), 'w') as f:
+            f.write('List {}'.format(i))
+        with open(os.path.join(path, 'color'), 'w') as f:
+            f.write('#{:06x}'.format(rng.randint(0, 0xFFFFFF)))
+
+    index = 0
+    while index < count:
+        if rng.random() < MULTI_VTODO_RATIO:
+            size = min(rng.randint(2, 4), count - index)
+        else:
+            size = 1
+
+        vtodos = []
+        for i in range(size):
+            uid, lines = vtodo_lines(rng, index + i, epoch)
+            vtodos.append(lines)
+        index += size
+
+        path = os.path.join(rng.choice(paths), '{}.ics'.format(uid))
+        with open(path, 'w', newline='') as f:
+            f.write(calendar(vtodos))
+
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('path', help='Directory to generate the vdir in.')
+    parser.add_argument('--todos', type=int, default=1000)
+    parser.add_argument('--lists', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument(
+        '--epoch',
+        type=lambda s: datetime.strptime(s, '%Y-%m-%d'),
+        default=None,
+        help='Date all generated dates are relative to (YYYY-MM-DD).',
+    )
+    args = parser.parse_args()
+
+    generate(args.path, args.todos, args.lists, args.seed, args.epoch)
+
+
+if __name__ == '__main__':
+    main()
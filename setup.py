@@ -13,11 +13,10 @@ setup(
     include_package_data=True,
     entry_points={
         'console_scripts': [
-            'todo = todoman.cli:cli',
+            'todo = todoman.__main__:main',
         ],
     },
     install_requires=[
-        'atomicwrites',
         'click>=7.0,<8.0',
         'click-log>=0.2.1',
         'configobj',
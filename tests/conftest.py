@@ -13,6 +13,17 @@ from todoman import model
 from todoman.formatters import DefaultFormatter, HumanizedFormatter
 
 
+@pytest.fixture(autouse=True)
+def xdg_cache_home(tmpdir_factory, monkeypatch):
+    """
+    Keeps the configuration cache from leaking between tests (or into the
+    user's actual cache directory).
+    """
+    path = tmpdir_factory.mktemp('xdg_cache')
+    monkeypatch.setattr('xdg.BaseDirectory.xdg_cache_home', str(path))
+    return path
+
+
 @pytest.fixture
 def default_database(tmpdir):
     return model.Database(
@@ -0,0 +1,106 @@
+import io
+
+from benchmarks import cache, durability, startup, vdir
+from todoman.model import Database
+
+
+def test_generate_vdir(tmpdir):
+    paths = vdir.generate(str(tmpdir.join('vdir')), 200, lists=3, seed=1)
+    assert len(paths) == 3
+
+    db = Database(paths, str(tmpdir.join('cache.sqlite3')))
+    todos = list(db.todos(status=['ANY']))
+    assert len(todos) == 200
+    assert {todo.list.name for todo in todos} == {
+        'List 0',
+        'List 1',
+        'List 2',
+    }
+    assert any(todo.is_recurring for todo in todos)
+    assert any(todo.is_completed for todo in todos)
+    assert any(len(todo.description) > 1000 for todo in todos)
+
+
+def test_generate_vdir_reproducible(tmpdir):
+    vdir.generate(str(tmpdir.join('a')), 50, seed=3)
+    vdir.generate(str(tmpdir.join('b')), 50, seed=3)
+
+    for path in tmpdir.join('a').visit('*.ics'):
+        other = tmpdir.join('b').join(path.relto(tmpdir.join('a')))
+        assert path.read() == other.read()
+
+
+def test_fold():
+    line = 'DESCRIPTION:' + 'ñ' * 100
+    folded = vdir.fold(line)
+
+    assert all(len(c.encode()) <= 75 for c in folded.split('\r\n'))
+    assert folded.replace('\r\n ', '') == line + '\r\n'
+
+
+def test_parse_importtime():
+    stderr = (
+        'import time: self [us] | cumulative | imported package\n'
+        'import time:       100 |        100 |   _io\n'
+        'import time:        50 |         50 |     encodings.aliases\n'
+        'import time:       200 |        250 |   encodings\n'
+        'harhar\n'
+    )
+    imports = startup.parse_importtime(stderr)
+
+    assert imports == [
+        {'module': '_io', 'self_us': 100, 'cumulative_us': 100, 'depth': 1},
+        {
+            'module': 'encodings.aliases',
+            'self_us': 50,
+            'cumulative_us': 50,
+            'depth': 2,
+        },
+        {
+            'module': 'encodings',
+            'self_us': 200,
+            'cumulative_us': 250,
+            'depth': 1,
+        },
+    ]
+    assert list(startup.by_package(imports).items()) == [
+        ('encodings', 250),
+        ('_io', 100),
+    ]
+
+
+def test_cache_benchmark(tmpdir):
+    results = cache.benchmark_size(
+        str(tmpdir),
+        size=100,
+        lists=2,
+        seed=0,
+        edits=10,
+        repeat=1,
+        trace=True,
+    )
+
+    assert results['todos'] == 100
+    assert results['partial_refresh']['edited'] == 10
+    assert results['queries']['any status']['rows'] == 100
+    assert set(results['queries']) == set(cache.QUERIES)
+    assert not tmpdir.join('cache-100.sqlite3').exists()
+
+    # The vdir is reused, and the edits are idempotent:
+    before = {p.basename: p.read() for p in tmpdir.visit('*.ics')}
+    cache.benchmark_size(str(tmpdir), 100, 2, 0, 10, 1, False)
+    assert before == {p.basename: p.read() for p in tmpdir.visit('*.ics')}
+
+
+def test_durability_benchmark(tmpdir):
+    results = [
+        durability.benchmark_mode(str(tmpdir), mode, 20)
+        for mode in ('full', 'batch', 'none')
+    ]
+
+    assert [result['todos'] for result in results] == [20, 20, 20]
+    assert not tmpdir.listdir()
+
+    output = io.StringIO()
+    durability.report({'modes': results}, output)
+    assert 'batch' in output.getvalue()
@@ -1,4 +1,6 @@
 import datetime
+import json
+import pstats
 import sys
 from os.path import exists, isdir
 from unittest import mock
@@ -12,7 +14,7 @@ from freezegun import freeze_time
 from hypothesis import given
 
 from tests.helpers import fs_case_sensitive, pyicu_sensitive
-from todoman.cli import cli, exceptions
+from todoman.cli import AppContext, cli, exceptions
 from todoman.model import Database, Todo
 
 # TODO: test --grep
@@ -459,6 +461,31 @@ def test_flush(tmpdir, runner, create, todo_factory, todos):
     assert all_todos[0].summary == 'bbb'
 
 
+def test_cache_errors(tmpdir, runner, create):
+    create('todo.ics', 'SUMMARY:Buy milk\n')
+    tmpdir.join('default').join('broken.ics').write(
+        'BEGIN:VCALENDAR\nBEGIN:VTODO\nSUMMARY:Buy eggs\n'
+    )
+    tmpdir.join('default').join('events.ics').write(
+        'BEGIN:VCALENDAR\nBEGIN:VEVENT\nEND:VEVENT\nEND:VCALENDAR\n'
+    )
+
+    result = runner.invoke(cli, ['cache', 'errors'])
+    assert not result.exception
+    assert 'broken.ics  error  ValueError: Found no components' in \
+        result.output
+    assert 'events.ics' not in result.output
+
+    result = runner.invoke(cli, ['cache', 'errors', '--all'])
+    assert 'events.ics  no-vtodo' in result.output
+
+    result = runner.invoke(cli, ['--porcelain', 'cache', 'errors'])
+    assert not result.exception
+    assert [
+        (entry['list'], entry['status']) for entry in json.loads(result.output)
+    ] == [('default', 'error')]
+
+
 def test_edit(runner, default_database, todos):
     todo = Todo(new=True)
     todo.list = next(default_database.lists())
@@ -756,6 +783,76 @@ def test_done_recurring(runner, todo_factory, todos):
     assert todo.rrule == rrule
 
 
+def test_done_catch_up(runner, todo_factory, todos):
+    now = datetime.datetime.now(tzlocal()).replace(microsecond=0)
+    # Naive datetimes are in local time:
+    overdue = now.replace(tzinfo=None) - datetime.timedelta(days=30, hours=1)
+    todo_factory(summary='overdue', rrule='FREQ=DAILY', due=overdue)
+    todo_factory(
+        summary='upcoming',
+        rrule='FREQ=DAILY',
+        due=now + datetime.timedelta(hours=1),
+    )
+    todo_factory(summary='once', due=overdue)
+
+    result = runner.invoke(cli, ['done', '--catch-up'])
+    assert not result.exception
+    assert 'overdue' in result.output
+    assert 'upcoming' not in result.output
+
+    pending = {todo.summary: todo for todo in todos()}
+    assert sorted(pending) == ['once', 'overdue', 'upcoming']
+    assert pending['overdue'].due == (
+        now - datetime.timedelta(hours=1) + datetime.timedelta(days=1)
+    )
+
+
+def test_done_catch_up_read_only(tmpdir, runner, todos):
+    tmpdir.join('default').join('shared.ics').write(
+        'BEGIN:VCALENDAR\n'
+        'BEGIN:VTODO\n'
+        'UID:a\n'
+        'SUMMARY:recurring\n'
+        'DUE;VALUE=DATE:20200101\n'
+        'RRULE:FREQ=DAILY\n'
+        'END:VTODO\n'
+        'BEGIN:VTODO\n'
+        'UID:b\n'
+        'SUMMARY:plain\n'
+        'END:VTODO\n'
+        'END:VCALENDAR\n'
+    )
+    original = tmpdir.join('default').join('shared.ics').read()
+
+    result = runner.invoke(cli, ['done', '--catch-up'])
+    assert not result.exception
+    assert 'Skipping recurring: Todo is in read-only mode' in result.output
+
+    assert tmpdir.join('default').join('shared.ics').read() == original
+    assert sorted(todo.summary for todo in todos()) == ['plain', 'recurring']
+
+
+def test_done_catch_up_ids(runner, todo_factory, todos):
+    due = datetime.datetime(2020, 1, 1, 10, tzinfo=tzlocal())
+    todo_factory(rrule='FREQ=WEEKLY', due=due)
+
+    result = runner.invoke(cli, ['done', '--catch-up', '1'])
+    assert not result.exception
+
+    (todo,) = todos()
+    assert todo.due > datetime.datetime.now(tzlocal())
+    assert todo.due - datetime.timedelta(weeks=1) < datetime.datetime.now(
+        tzlocal()
+    )
+    assert todo.due.weekday() == due.weekday()
+
+
+def test_done_no_todos(runner):
+    result = runner.invoke(cli, ['done'])
+    assert result.exception
+    assert 'No tasks specified' in result.output
+
+
 def test_cancel(runner, todo_factory, todos):
     todo = todo_factory()
 
@@ -766,6 +863,34 @@ def test_cancel(runner, todo_factory, todos):
     assert todo.status == 'CANCELLED'
 
 
+@pytest.mark.parametrize('command', ['done', 'cancel'])
+def test_durability(config, runner, todo_factory, todos, command):
+    todo_factory()
+    todo_factory()
+
+    with patch('os.fsync') as fsync:
+        result = runner.invoke(cli, [command, '1', '2'])
+    assert not result.exception
+    # Each file, and its directory.
+    assert fsync.call_count == 4
+
+    config.write('durability = batch\n', 'a')
+    with patch('os.fsync') as fsync:
+        result = runner.invoke(cli, [command, '1', '2'])
+    assert not result.exception
+    assert fsync.call_count == 3
+
+    with patch('os.fsync') as fsync:
+        result = runner.invoke(
+            cli,
+            [command, '--durability', 'none', '1', '2'],
+        )
+    assert not result.exception
+    assert fsync.call_count == 0
+
+    assert all(todo.status != 'NEEDS-ACTION' for todo in todos(status='ANY'))
+
+
 def test_id_printed_for_new(runner):
     result = runner.invoke(cli, ['new', '-l', 'default', 'show me an id'])
     assert not result.exception
@@ -974,3 +1099,274 @@ def test_invalid_default_priority(tmpdir, runner, create):
     result = runner.invoke(cli, ['new', '-l', 'default', 'aaa'])
     assert result.exception
     assert 'Bad default_priority setting' in result.output
+
+
+def test_profile(runner, create, tmpdir, monkeypatch):
+    create('test.ics', 'SUMMARY:harhar\n')
+    workdir = tmpdir.join('..').join('profile-cwd').ensure_dir()
+    monkeypatch.chdir(str(workdir))
+
+    result = runner.invoke(cli, ['--profile', 'list'])
+
+    assert not result.exception
+    assert 'harhar' in result.output
+    assert 'Ordered by: cumulative time' in result.output
+    assert 'Profile written to todoman.prof' in result.output
+    stats = pstats.Stats(str(workdir.join('todoman.prof')))
+    assert any(name == 'update_cache' for _, _, name in stats.stats)
+
+
+def test_profile_collapsed(runner, create, tmpdir):
+    create('test.ics', 'SUMMARY:harhar\n')
+    path = tmpdir.join('todoman.folded')
+
+    result = runner.invoke(cli, ['--profile-output', str(path)])
+
+    assert not result.exception
+    assert 'harhar' in result.output
+    stacks = path.read().splitlines()
+    assert stacks
+    for line in stacks:
+        stack, us = line.rsplit(' ', 1)
+        assert int(us) > 0
+    assert any('(update_cache)' in line for line in stacks)
+
+
+def test_profile_envvar(runner, tmpdir):
+    path = tmpdir.join('profile.pstats')
+
+    result = runner.invoke(cli, ['list'], env={'TODOMAN_PROFILE': str(path)})
+
+    assert not result.exception
+    assert path.check(file=True)
+
+
+def test_profile_nested(runner, tmpdir):
+    """Invocations from within the REPL don't restart profiling."""
+    path = tmpdir.join('profile.pstats')
+    ctx = AppContext()
+    ctx.profiler = mock.sentinel.profiler
+
+    result = runner.invoke(
+        cli,
+        ['--profile-output', str(path), 'list'],
+        obj=ctx,
+    )
+
+    assert not result.exception
+    assert not path.check()
+    assert ctx.profiler is mock.sentinel.profiler
+
+
+def test_timings(runner, create):
+    create('test.ics', 'SUMMARY:harhar\n')
+
+    result = runner.invoke(cli, ['--timings', 'list'])
+
+    assert not result.exception
+    assert 'harhar' in result.output
+    phases = [line.split()[0] for line in result.output.splitlines()[1:]]
+    assert phases == [
+        'config',
+        'glob',
+        'lists',
+        'expire',
+        'scan',
+        'parse',
+        'commit',
+        'query',
+        'hydrate',
+        'render',
+        'total',
+    ]
+
+
+def test_timings_porcelain(runner, create):
+    create('test.ics', 'SUMMARY:harhar\n')
+
+    result = runner.invoke(cli, ['--porcelain', '--timings', 'show', '1'])
+
+    assert not result.exception
+    # Output is the todo, followed by timings.
+    decoder = json.JSONDecoder()
+    todo, end = decoder.raw_decode(result.output)
+    timings = json.loads(result.output[end:])
+    assert todo['summary'] == 'harhar'
+    assert timings['phases'][-1] == {
+        'name': 'render',
+        'seconds': mock.ANY,
+        'count': 1,
+    }
+    assert timings['total'] > 0
+
+
+def test_agenda(runner, todo_factory):
+    today = datetime.datetime.now(tzlocal()).replace(
+        hour=12, minute=0, second=0, microsecond=0
+    )
+    todo_factory(summary='chore', due=today, rrule='FREQ=DAILY')
+    todo_factory(
+        summary='once',
+        due=today + datetime.timedelta(days=2, hours=1),
+    )
+    todo_factory(summary='far away', due=today + datetime.timedelta(days=30))
+
+    result = runner.invoke(cli, ['agenda'])
+    assert not result.exception
+    lines = result.output.splitlines()
+    assert len(lines) == 8
+    assert sum('chore' in line for line in lines) == 7
+    assert 'once' in lines[3]
+
+    result = runner.invoke(cli, ['agenda', 'default', '--to', 'in 2 days'])
+    assert not result.exception
+    # Whether today's occurrence is in the range depends on the time of day.
+    assert result.output.count('chore') in (2, 3)
+    assert '@default' not in result.output
+
+    # With no time_format, dates are parsed as midnight of that day.
+    tomorrow = today + datetime.timedelta(days=1)
+    result = runner.invoke(
+        cli,
+        [
+            'agenda',
+            '--from',
+            tomorrow.strftime('%Y-%m-%d'),
+            '--to',
+            (tomorrow + datetime.timedelta(days=1)).strftime('%Y-%m-%d'),
+        ],
+    )
+    assert not result.exception
+    assert len(result.output.splitlines()) == 1
+    assert 'chore' in result.output
+
+
+def test_agenda_porcelain(runner, todo_factory):
+    due = datetime.datetime.now(tzlocal()).replace(
+        hour=12, minute=0, second=0, microsecond=0
+    )
+    todo_factory(summary='chore', due=due, rrule='FREQ=DAILY')
+
+    result = runner.invoke(cli, ['--porcelain', 'agenda'])
+    assert not result.exception
+    occurrences = json.loads(result.output)
+    assert [o['occurrence'] for o in occurrences] == [
+        int(due.timestamp()) + day * 86400 for day in range(7)
+    ]
+    assert occurrences[0]['summary'] == 'chore'
+
+
+def test_import(runner, tmpdir, todos):
+    source = tmpdir.join('export.ics')
+    source.write(
+        'BEGIN:VCALENDAR\r\n'
+        'BEGIN:VTODO\r\n'
+        'UID:imported\r\n'
+        'SUMMARY:Imported\r\n'
+        'END:VTODO\r\n'
+        'END:VCALENDAR\r\n'
+    )
+
+    result = runner.invoke(
+        cli,
+        ['import', '--list', 'default', '--durability', 'full', str(source)],
+    )
+    assert not result.exception
+    assert result.output == 'Imported 1 tasks, replaced 0, skipped 0.\n'
+    assert [todo.summary for todo in todos()] == ['Imported']
+
+    result = runner.invoke(
+        cli,
+        ['import', '--list', 'default', '-'],
+        input=source.read() + 'BEGIN:VTODO\r\nDUE:soon\r\nEND:VTODO\r\n',
+    )
+    assert not result.exception
+    assert result.output.endswith(
+        'Imported 0 tasks, replaced 0, skipped 1. 1 tasks could not be read.\n'
+    )
+
+
+def test_export(runner, todo_factory, tmpdir):
+    todo_factory(summary='Pending')
+    todo_factory(summary='Done', status='COMPLETED')
+
+    result = runner.invoke(cli, ['export'])
+    assert not result.exception
+    assert 'SUMMARY:Pending' in result.output
+    assert 'Done' not in result.output
+
+    output = tmpdir.join('export.ndjson')
+    result = runner.invoke(
+        cli,
+        ['export', '--format', 'ndjson', '--status', 'ANY', '-o', str(output)],
+    )
+    assert not result.exception
+    assert not result.output
+    summaries = [json.loads(line)['summary'] for line in output.readlines()]
+    assert sorted(summaries) == ['Done', 'Pending']
+
+
+def test_browse(tmpdir, runner, create):
+    create('test.ics', 'SUMMARY:Buy milk\n')
+
+    with patch('todoman.interactive.TodoBrowser.browse') as browse:
+        result = runner.invoke(cli, ['browse', '--grep', 'milk'])
+
+    assert not result.exception
+    assert browse.call_count == 1
+
+
+def test_cache_ttl(tmpdir, runner, create, config):
+    config.write('cache_ttl = 3600\n', 'a')
+    create('one.ics', 'SUMMARY:One\n')
+    assert 'One' in runner.invoke(cli, ['list']).output
+
+    create('two.ics', 'SUMMARY:Two\n')
+
+    # Read-only commands use the cache as is:
+    result = runner.invoke(cli, ['list'])
+    assert not result.exception
+    assert 'Two' not in result.output
+    assert 'Two' not in runner.invoke(cli).output
+
+    # Others refresh it first:
+    result = runner.invoke(cli, ['done', '2'])
+    assert not result.exception
+    assert 'Two' in result.output
+
+
+def test_repl_reuses_database(tmpdir, runner, create):
+    """
+    Within the REPL, the group callback runs again for each command, with the
+    same context object.
+    """
+    ctx = AppContext()
+    create('one.ics', 'SUMMARY:One\n')
+    result = runner.invoke(cli, ['list'], obj=ctx)
+    assert 'One' in result.output
+
+    db = ctx.db
+    formatter = ctx.formatter
+    now = formatter.now
+
+    create('two.ics', 'SUMMARY:Two\n')
+    result = runner.invoke(cli, ['list'], obj=ctx)
+    assert not result.exception
+    assert 'Two' in result.output
+    assert ctx.db is db
+    assert ctx.formatter is formatter
+    assert formatter.now > now
+
+
+def test_repl_after_flush(runner, create):
+    ctx = AppContext()
+    create('one.ics', 'SUMMARY:One\nSTATUS:COMPLETED\n')
+    create('two.ics', 'SUMMARY:Two\n')
+
+    result = runner.invoke(cli, ['flush'], input='y\n', obj=ctx)
+    assert not result.exception
+
+    result = runner.invoke(cli, ['list', '--status', 'ANY'], obj=ctx)
+    assert not result.exception
+    assert 'One' not in result.output
+    assert 'Two' in result.output
@@ -0,0 +1,114 @@
+import json
+
+import pytest
+
+from todoman.completion import cache_path, candidates, main, views
+
+
+@pytest.fixture
+def cache(default_database, todo_factory):
+    todo_factory(summary='Buy milk', location='Shop', categories=['home'])
+    todo_factory(
+        summary='Fix 100% of bugs',
+        location='Office',
+        categories=['work', 'Home office'],
+    )
+    todo_factory(summary='Done already', status='COMPLETED', location='Shop')
+    return str(default_database.cache.cache_path)
+
+
+def test_ids(cache):
+    assert candidates(cache, 'ids') == [
+        (1, '@default Buy milk'),
+        (2, '@default Fix 100% of bugs'),
+    ]
+    assert candidates(cache, 'ids', '2') == [(2, '@default Fix 100% of bugs')]
+    assert candidates(cache, 'ids', '3') == []
+
+
+def test_lists(cache, tmpdir):
+    assert candidates(cache, 'lists') == [
+        ('default', str(tmpdir.join('default'))),
+    ]
+    assert candidates(cache, 'lists', 'DEF') == [
+        ('default', str(tmpdir.join('default'))),
+    ]
+    assert candidates(cache, 'lists', 'x') == []
+
+
+def test_locations(cache):
+    assert candidates(cache, 'locations') == [
+        ('Office', '1 tasks'),
+        ('Shop', '2 tasks'),
+    ]
+    assert candidates(cache, 'locations', 's') == [('Shop', '2 tasks')]
+
+
+def test_categories(cache):
+    assert candidates(cache, 'categories') == [
+        ('Home office', '1 tasks'),
+        ('home', '1 tasks'),
+        ('work', '1 tasks'),
+    ]
+    assert candidates(cache, 'categories', 'ho') == [
+        ('Home office', '1 tasks'),
+        ('home', '1 tasks'),
+    ]
+
+
+def test_prefix_is_escaped(cache):
+    assert candidates(cache, 'locations', '%') == []
+    assert candidates(cache, 'locations', '_hop') == []
+
+
+def test_unreadable_cache(tmpdir):
+    assert candidates(str(tmpdir.join('missing.sqlite3')), 'ids') == []
+
+    tmpdir.join('empty.sqlite3').write('')
+    assert candidates(str(tmpdir.join('empty.sqlite3')), 'ids') == []
+
+
+def test_cache_path(tmpdir, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmpdir))
+    assert cache_path() == str(tmpdir.join('todoman', 'cache.sqlite3'))
+
+    tmpdir.mkdir('todoman').join('config.json').write(json.dumps({
+        'key': {},
+        'config': {'main': {'cache_path': '/somewhere/cache.sqlite3'}},
+    }))
+    assert cache_path() == '/somewhere/cache.sqlite3'
+
+    tmpdir.join('todoman', 'config.json').write('{')
+    assert cache_path() == str(tmpdir.join('todoman', 'cache.sqlite3'))
+
+
+def test_main(cache, capsys, monkeypatch):
+    monkeypatch.setattr('todoman.completion.cache_path', lambda: cache)
+
+    assert main(['locations', 'S']) == 0
+    assert capsys.readouterr().out == 'Shop\t2 tasks\n'
+
+    assert main(['things']) == 2
+    assert 'Usage: todo _complete {categories|ids|lists|locations|views}' \
+        in capsys.readouterr().err
+
+
+def test_views(tmpdir, capsys, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmpdir))
+    assert views() == []
+
+    tmpdir.mkdir('todoman').join('config.json').write(json.dumps({
+        'key': {},
+        'config': {'views': {
+            'today': {'where': 'due = today'},
+            'tomorrow': {'where': 'due = tomorrow'},
+            'work': {'where': 'list = work'},
+        }},
+    }))
+    assert views('to') == [
+        ('today', 'due = today'),
+        ('tomorrow', 'due = tomorrow'),
+    ]
+
+    assert main(['views', 'w']) == 0
+    assert capsys.readouterr().out == 'work\tlist = work\n'
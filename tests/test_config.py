@@ -1,10 +1,16 @@
+import os
+from os.path import exists
 from unittest.mock import patch
 
 import pytest
 from click.testing import CliRunner
 
 from todoman.cli import cli
-from todoman.configuration import ConfigurationException, load_config
+from todoman.configuration import (
+    config_cache_path,
+    ConfigurationException,
+    load_config,
+)
 
 
 def test_explicit_nonexistant(runner):
@@ -174,3 +180,68 @@ def test_colour_validation_invalid(config):
         return_value=(str(config)),
     ), pytest.raises(ConfigurationException):
         load_config()
+
+
+def test_config_cache_reused(config):
+    cfg = load_config(str(config))
+    assert exists(config_cache_path())
+
+    with patch('todoman.configuration._validate_config') as validate:
+        assert load_config(str(config)) == cfg
+
+    assert validate.call_count == 0
+
+
+def test_config_cache_changed_config(config):
+    assert load_config(str(config))['main']['color'] == 'auto'
+
+    # Keep the same mtime; the change must still be picked up.
+    stat = os.stat(str(config))
+    config.write("color = 'never'\n", 'a')
+    os.utime(str(config), ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    assert load_config(str(config))['main']['color'] == 'never'
+
+
+def test_config_cache_invalidated_by_version(config):
+    load_config(str(config))
+
+    with patch('todoman.configuration.__version__', '0.0.0'), patch(
+        'todoman.configuration._validate_config',
+        return_value={'main': {}},
+    ) as validate:
+        load_config(str(config))
+
+    assert validate.call_count == 1
+
+
+def test_config_cache_environment(config, tmpdir, monkeypatch):
+    config.write(
+        '[main]\n'
+        'path = {}/*\n'
+        'cache_path = $TODOMAN_TEST_CACHE/cache.sqlite3\n'.format(tmpdir)
+    )
+
+    monkeypatch.setenv('TODOMAN_TEST_CACHE', str(tmpdir.join('a')))
+    cfg = load_config(str(config))
+    assert cfg['main']['cache_path'] == str(tmpdir.join('a/cache.sqlite3'))
+
+    monkeypatch.setenv('TODOMAN_TEST_CACHE', str(tmpdir.join('b')))
+    cfg = load_config(str(config))
+    assert cfg['main']['cache_path'] == str(tmpdir.join('b/cache.sqlite3'))
+
+
+def test_config_cache_corrupt(config):
+    cfg = load_config(str(config))
+    with open(config_cache_path(), 'w') as f:
+        f.write('{not json')
+
+    assert load_config(str(config)) == cfg
+
+
+def test_config_cache_unwritable(config, xdg_cache_home):
+    xdg_cache_home.join('todoman').write('not a directory')
+
+    cfg = load_config(str(config))
+    assert cfg['main']['color'] == 'auto'
+    assert not exists(config_cache_path())
@@ -0,0 +1,82 @@
+from unittest.mock import patch
+
+import pytest
+
+from todoman.durability import AtomicBatch
+
+
+@pytest.mark.parametrize('durability', ['full', 'none'])
+def test_write_immediate(tmpdir, durability):
+    batch = AtomicBatch(durability)
+    path = str(tmpdir.join('one.ics'))
+
+    with patch('os.fsync') as fsync:
+        batch.write(path, b'one')
+        assert tmpdir.join('one.ics').read_binary() == b'one'
+        assert batch.commit() == []
+
+    # The file, and then its directory:
+    assert fsync.call_count == (2 if durability == 'full' else 0)
+
+
+def test_write_batch(tmpdir):
+    batch = AtomicBatch('batch')
+    tmpdir.mkdir('a')
+    tmpdir.mkdir('b')
+    paths = [
+        str(tmpdir.join('a', 'one.ics')),
+        str(tmpdir.join('a', 'two.ics')),
+        str(tmpdir.join('b', 'three.ics')),
+    ]
+
+    with patch('os.fsync') as fsync:
+        for path in paths:
+            batch.write(path, path.encode())
+        assert fsync.call_count == 0
+        assert not any(tmpdir.join(d).listdir('*.ics') for d in 'ab')
+
+        assert sorted(batch.commit()) == sorted(paths)
+
+    # Each file, and then each directory once:
+    assert fsync.call_count == 5
+    for path in paths:
+        with open(path, 'rb') as f:
+            assert f.read() == path.encode()
+    assert len(tmpdir.join('a').listdir()) == 2
+
+
+def test_write_replaces(tmpdir):
+    path = tmpdir.join('one.ics')
+    path.write('old')
+
+    AtomicBatch().write(str(path), b'new')
+    assert path.read() == 'new'
+
+
+def test_abort(tmpdir):
+    batch = AtomicBatch('batch')
+    batch.write(str(tmpdir.join('one.ics')), b'one')
+    batch.abort()
+
+    assert tmpdir.listdir() == []
+    assert batch.commit() == []
+
+    # Files which have already vanished are ignored:
+    batch.write(str(tmpdir.join('two.ics')), b'two')
+    for path in tmpdir.listdir():
+        path.remove()
+    batch.abort()
+
+
+def test_write_error(tmpdir):
+    batch = AtomicBatch('full')
+    with patch('os.fsync', side_effect=OSError('Disk on fire')):
+        with pytest.raises(OSError):
+            batch.write(str(tmpdir.join('one.ics')), b'one')
+
+    assert tmpdir.listdir() == []
+
+
+def test_invalid_mode():
+    with pytest.raises(ValueError):
+        AtomicBatch('sometimes')
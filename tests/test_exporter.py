@@ -0,0 +1,120 @@
+import io
+import json
+
+import pytest
+
+from todoman.exporter import export, read_vtodo
+
+TIMEZONE = (
+    'BEGIN:VTIMEZONE\n'
+    'TZID:Europe/Berlin\n'
+    'BEGIN:STANDARD\n'
+    'DTSTART:19701025T030000\n'
+    'TZOFFSETFROM:+0200\n'
+    'TZOFFSETTO:+0100\n'
+    'END:STANDARD\n'
+    'END:VTIMEZONE\n'
+)
+
+
+def test_read_vtodo(create):
+    path = create(
+        'shared.ics',
+        'UID:one\nSUMMARY:One\nEND:VTODO\nBEGIN:VTODO\nUID:tw\n o\n'
+        'SUMMARY:Two\n',
+    )
+
+    vtodo, timezones = read_vtodo(str(path), 'two')
+    assert vtodo == b'BEGIN:VTODO\nUID:tw\n o\nSUMMARY:Two\nEND:VTODO\n'
+    assert timezones == []
+
+    assert read_vtodo(str(path), 'three') is None
+
+
+def test_export_ics(create, default_database, tmpdir):
+    for uid, day in (('one', 1), ('two', 2)):
+        tmpdir.join('default', '{}.ics'.format(uid)).write(
+            'BEGIN:VCALENDAR\n' + TIMEZONE + 'BEGIN:VTODO\n'
+            'UID:{0}\n'
+            'SUMMARY:{0}\n'
+            'DUE;TZID=Europe/Berlin:2020010{1}T100000\n'
+            'X-CUSTOM:Kept as is\n'
+            'END:VTODO\n'
+            'END:VCALENDAR\n'.format(uid, day)
+        )
+    create('three.ics', 'UID:three\nSUMMARY:Three\nSTATUS:COMPLETED\n')
+    default_database.update_cache()
+
+    out = io.BytesIO()
+    assert export(default_database.todos(), out) == 2
+
+    content = out.getvalue()
+    assert content.startswith(b'BEGIN:VCALENDAR\r\n')
+    assert content.endswith(b'END:VCALENDAR\r\n')
+    assert content.count(b'BEGIN:VTIMEZONE') == 1
+    assert b'X-CUSTOM:Kept as is\n' in content
+    assert b'Three' not in content
+
+    import icalendar
+    cal = icalendar.Calendar.from_ical(content)
+    assert sorted(str(todo['summary']) for todo in cal.walk('VTODO')) == [
+        'one',
+        'two',
+    ]
+
+
+def test_export_ics_missing_file(create, default_database, caplog):
+    path = create('one.ics', 'UID:one\nSUMMARY:One\n')
+    default_database.update_cache()
+    path.remove()
+
+    out = io.BytesIO()
+    assert export(default_database.todos(), out) == 0
+    assert 'Could not read' in caplog.text
+
+
+def test_export_ics_missing_todo(create, default_database, caplog):
+    content = 'UID:one\nSUMMARY:One\nEND:VTODO\nBEGIN:VTODO\nUID:two\n'
+    path = create('shared.ics', content)
+    default_database.update_cache()
+    create('shared.ics', content.replace('UID:', 'UID:x'))
+
+    out = io.BytesIO()
+    assert export(default_database.todos(), out) == 0
+    assert 'Could not find one in {}'.format(path) in caplog.text
+
+
+@pytest.mark.parametrize('format', ['json', 'ndjson'])
+def test_export_json(todo_factory, default_database, format):
+    todo_factory(summary='One', location='Home', priority=1)
+    todo_factory(summary='Two')
+
+    out = io.BytesIO()
+    assert export(default_database.todos(), out, format) == 2
+
+    if format == 'json':
+        data = json.loads(out.getvalue().decode())
+    else:
+        data = [
+            json.loads(line)
+            for line in out.getvalue().decode().splitlines()
+        ]
+
+    data.sort(key=lambda todo: todo['summary'])
+    assert [todo['summary'] for todo in data] == ['One', 'Two']
+    assert data[0]['location'] == 'Home'
+    assert data[0]['priority'] == 1
+    assert data[0]['list'] == 'default'
+    assert data[0]['created_at'].startswith('20')
+    assert data[1]['due'] is None
+
+
+def test_export_json_empty(default_database):
+    out = io.BytesIO()
+    assert export(default_database.todos(), out, 'json') == 0
+    assert json.loads(out.getvalue().decode()) == []
+
+
+def test_export_invalid_format(default_database):
+    with pytest.raises(ValueError):
+        export(default_database.todos(), io.BytesIO(), 'csv')
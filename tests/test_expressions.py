@@ -0,0 +1,243 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+import pytz
+
+from todoman.cli import cli
+from todoman.expressions import ExpressionError, parse
+
+
+@pytest.fixture
+def query(default_database, default_formatter):
+    def inner(text, status=('ANY',)):
+        expression = parse(text, default_formatter)
+        return sorted(
+            todo.summary for todo in default_database.todos(
+                where=expression,
+                status=status,
+            )
+        )
+
+    return inner
+
+
+@pytest.fixture
+def todos(todo_factory):
+    today = datetime.now(pytz.UTC).replace(hour=12, minute=0, second=0)
+    todo_factory(
+        summary='Buy milk',
+        due=today,
+        priority=1,
+        categories=['home', 'errands'],
+        location='Shop',
+    )
+    todo_factory(
+        summary='Write report',
+        due=today + timedelta(days=3),
+        priority=5,
+        categories=['work'],
+    )
+    todo_factory(
+        summary='Do homework',
+        due=date.today() - timedelta(days=2),
+        priority=9,
+        categories=['homework'],
+        status='COMPLETED',
+    )
+    todo_factory(summary='Someday')
+
+
+def test_comparisons(query, todos):
+    assert query('summary = "Buy milk"') == ['Buy milk']
+    assert query('summary == "Buy milk"') == ['Buy milk']
+    assert query('summary != "Buy milk"') == [
+        'Do homework', 'Someday', 'Write report'
+    ]
+    assert query('summary ~ o') == ['Do homework', 'Someday', 'Write report']
+    assert query('summary contains MILK') == ['Buy milk']
+    assert query('status = completed') == ['Do homework']
+    assert query('location = Shop') == ['Buy milk']
+    assert query('location is null') == [
+        'Do homework', 'Someday', 'Write report'
+    ]
+    assert query('id > 2') == ['Do homework', 'Someday']
+
+
+def test_boolean_logic(query, todos):
+    assert query('priority = high or priority = low') == [
+        'Buy milk', 'Do homework'
+    ]
+    assert query('summary ~ o and priority is not null') == [
+        'Do homework', 'Write report'
+    ]
+    assert query('not (summary ~ o and priority is not null)') == [
+        'Buy milk', 'Someday'
+    ]
+    assert query('not summary ~ o or priority = high') == ['Buy milk']
+    assert query('NOT due IS NULL AND NOT status = completed') == [
+        'Buy milk', 'Write report'
+    ]
+
+
+def test_negation_includes_missing_values(query, todos):
+    assert query('location != Shop') == [
+        'Do homework', 'Someday', 'Write report'
+    ]
+    assert query('not due < today') == [
+        'Buy milk', 'Someday', 'Write report'
+    ]
+
+
+def test_in(query, todos):
+    assert query('status in (completed, "needs-action")') == [
+        'Buy milk', 'Do homework', 'Someday', 'Write report'
+    ]
+    assert query('priority in (high, medium)') == ['Buy milk', 'Write report']
+    assert query('due not in (today, yesterday)') == [
+        'Do homework', 'Someday', 'Write report'
+    ]
+    assert query('list in (default)') == [
+        'Buy milk', 'Do homework', 'Someday', 'Write report'
+    ]
+    assert query('id not in (1, 2)') == ['Do homework', 'Someday']
+
+
+def test_dates(query, todos):
+    assert query('due = today') == ['Buy milk']
+    assert query('due < today') == ['Do homework']
+    assert query('due <= today') == ['Buy milk', 'Do homework']
+    assert query('due > today') == ['Write report']
+    assert query('due >= tomorrow') == ['Write report']
+    assert query('due is null') == ['Someday']
+    assert query('created_at < tomorrow') == [
+        'Buy milk', 'Do homework', 'Someday', 'Write report'
+    ]
+
+    in_a_week = (date.today() + timedelta(days=7)).strftime('%Y-%m-%d')
+    assert query('due < {}'.format(in_a_week)) == [
+        'Buy milk', 'Do homework', 'Write report'
+    ]
+    assert query('due > "{} 10:00"'.format(in_a_week)) == []
+    assert query('due < "in 2 weeks"') == [
+        'Buy milk', 'Do homework', 'Write report'
+    ]
+
+
+def test_priorities(query, todos):
+    assert query('priority = high') == ['Buy milk']
+    assert query('priority > low') == ['Buy milk', 'Write report']
+    assert query('priority >= low') == [
+        'Buy milk', 'Do homework', 'Write report'
+    ]
+    assert query('priority < medium') == ['Do homework', 'Someday']
+    assert query('priority <= medium') == [
+        'Do homework', 'Someday', 'Write report'
+    ]
+    assert query('priority = none') == ['Someday']
+    assert query('priority > none') == [
+        'Buy milk', 'Do homework', 'Write report'
+    ]
+    assert query('priority = 9') == ['Do homework']
+    assert query('priority > 1') == []
+
+
+def test_categories(query, todos):
+    assert query('categories = work') == ['Write report']
+    assert query('categories = errands') == ['Buy milk']
+    assert query('categories ~ work') == ['Do homework', 'Write report']
+    assert query('categories in (home, work)') == ['Buy milk', 'Write report']
+
+
+def test_like_escaping(query, todo_factory):
+    todo_factory(summary='100% done')
+    todo_factory(summary='1000 things')
+
+    assert query('summary ~ "0%"') == ['100% done']
+    assert query('summary ~ \'1_0\'') == []
+
+
+def test_combined_with_other_filters(query, todos):
+    assert query('due is not null', status=('NEEDS-ACTION',)) == [
+        'Buy milk', 'Write report'
+    ]
+
+
+@pytest.mark.parametrize(
+    'text,message,column', [
+        ('', 'Expected a field name, but the expression ended', 1),
+        ('colour = red', "Unknown field 'colour'", 1),
+        ('due <', 'Expected a value, but the expression ended', 6),
+        ('due tomorrow', "Expected a comparison after 'due'", 5),
+        ('summary = "milk', 'Unterminated string', 11),
+        ('summary = milk!', "Unexpected character '!'", 15),
+        ('(id = 1', 'Expected ")"', 8),
+        ('id = 1 id = 2', 'Expected "and", "or" or the end', 8),
+        ('id = one', "'id' must be compared to a number", 6),
+        ('due < someday', "Invalid date 'someday'", 7),
+        ('priority = urgent', 'Priority must be one of', 12),
+        ('due ~ 2', "'due' is not a text field", 7),
+        ('categories < work', 'Categories can only be compared', 14),
+        ('due is not 2', 'Expected "null"', 12),
+        ('id not 2', 'Expected "in"', 8),
+        ('id in 1, 2', 'Expected "("', 7),
+        ('id in (1 2)', 'Expected "," or ")"', 10),
+        ('and = 1', 'Expected a field name', 1),
+    ]
+)
+def test_errors(default_formatter, text, message, column):
+    with pytest.raises(ExpressionError) as excinfo:
+        parse(text, default_formatter)
+
+    assert message in str(excinfo.value)
+    assert '(at column {})'.format(column) in str(excinfo.value)
+    assert excinfo.value.position == column - 1
+
+
+def test_parameterized(default_formatter):
+    expression = parse('summary = "x\' OR 1=1 --"', default_formatter)
+
+    assert expression.sql == 'todos.summary = ?'
+    assert expression.params == ["x' OR 1=1 --"]
+    assert repr(expression) == '<Expression \'summary = "x\\\' OR 1=1 --"\'>'
+
+
+@pytest.mark.parametrize(
+    'text,index', [
+        ('due < tomorrow', 'todos_due'),
+        ('start >= today', 'todos_start'),
+        ('priority >= medium', 'todos_priority'),
+        ('completed_at = today', 'todos_completed_at'),
+        ('list = default', 'files_list_name'),
+    ]
+)
+def test_uses_indexes(default_database, default_formatter, text, index):
+    expression = parse(text, default_formatter)
+    plan = default_database.cache._conn.execute(
+        '''
+        EXPLAIN QUERY PLAN
+            SELECT todos.id
+              FROM todos, files
+             WHERE todos.file_path = files.path AND ({})
+        '''.format(expression.sql),
+        expression.params,
+    ).fetchall()
+
+    assert any(index in row[-1] for row in plan)
+
+
+def test_where_option(runner, create):
+    create('one.ics', 'SUMMARY:haha\nPRIORITY:1\n')
+    create('two.ics', 'SUMMARY:hoho\nPRIORITY:9\n')
+
+    result = runner.invoke(cli, ['list', '--where', 'priority > low'])
+    assert not result.exception
+    assert 'haha' in result.output
+    assert 'hoho' not in result.output
+
+
+def test_where_option_invalid(runner):
+    result = runner.invoke(cli, ['list', '--where', 'priority >'])
+    assert result.exception
+    assert 'Invalid value for' in result.output
+    assert '--where' in result.output
+    assert 'Expected a value' in result.output
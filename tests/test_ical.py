@@ -0,0 +1,315 @@
+from datetime import date, datetime, timedelta
+from unittest.mock import patch
+
+import hypothesis.strategies as st
+import icalendar
+import pytz
+from hypothesis import given, settings
+
+from todoman import ical
+from todoman.model import _as_datetime, Cache, List, Todo, VtodoWriter
+
+# icalendar doesn't unescape backslashes properly, nor escaped commas within
+# categories, so those can't be round-tripped through it.
+TEXT = st.text(
+    st.characters(
+        blacklist_categories=('Cc', 'Cs'),
+        blacklist_characters='\\',
+    ) | st.just('\n'),
+)
+CATEGORY = st.text(
+    st.characters(
+        blacklist_categories=('Cc', 'Cs', 'Zs'),
+        blacklist_characters='\\,',
+    ),
+    min_size=1,
+)
+DATETIMES = st.one_of(
+    st.none(),
+    st.dates(date(1900, 1, 1), date(3000, 1, 1)),
+    st.datetimes(datetime(1900, 1, 1), datetime(3000, 1, 1)),
+    st.datetimes(
+        datetime(1900, 1, 1),
+        datetime(3000, 1, 1),
+        timezones=st.sampled_from([pytz.UTC, pytz.timezone('Asia/Tokyo')]),
+    ),
+)
+
+
+class Writer:
+    """Collects written files, rather than writing them."""
+
+    def __init__(self):
+        self.files = {}
+
+    def write(self, path, data):
+        self.files[path] = data
+
+
+def _old_serializer(todo):
+    """Serializes new todos as they used to be, using icalendar."""
+    calendar = icalendar.Calendar()
+    calendar.add_component(VtodoWriter(todo).serialize())
+    calendar.add('prodid', 'io.barrera.todoman')
+    calendar.add('version', '2.0')
+    return calendar.to_ical()
+
+
+def _write_new(todo):
+    writer = Writer()
+    assert VtodoWriter(todo).write(writer) is None
+    return writer.files[todo.path]
+
+
+def _cached(cache, add, *args):
+    id = add(*args)
+    row = cache._conn.execute(
+        'SELECT * FROM todos WHERE id = ?',
+        (id,),
+    ).fetchone()
+    return tuple(row[key] for key in row.keys() if key != 'id')
+
+
+def test_serialize_new(tmpdir):
+    cache = Cache(tmpdir.join('cache.sqlite3'))
+    todo_list = List('default', str(tmpdir.join('default')))
+    cache.add_list(todo_list.name, todo_list.path, None, 0)
+
+    @settings(deadline=None)
+    @given(
+        summary=TEXT,
+        description=TEXT,
+        location=TEXT,
+        categories=st.lists(CATEGORY, max_size=3),
+        priority=st.integers(0, 9),
+        percent_complete=st.integers(0, 100),
+        status=st.sampled_from(Todo.VALID_STATUSES),
+        due=DATETIMES,
+        start=DATETIMES,
+        completed_at=DATETIMES,
+        rrule=st.sampled_from(['', 'FREQ=DAILY', 'FREQ=WEEKLY;COUNT=3']),
+    )
+    def run_test(**fields):
+        todo = Todo(new=True, list=todo_list)
+        todo.sequence = 1
+        todo.last_modified = datetime.now(pytz.UTC)
+        for name, value in fields.items():
+            setattr(todo, name, value)
+
+        data = _write_new(todo)
+        assert data == _old_serializer(todo)
+
+        calendar = icalendar.Calendar.from_ical(data)
+        vtodo = calendar.walk('VTODO')[0]
+        assert calendar.to_ical() == data
+        for source, target in VtodoWriter.FIELD_MAP.items():
+            value = getattr(todo, source)
+            if not value:
+                assert target not in vtodo
+            elif source in Todo.DATETIME_FIELDS:
+                if isinstance(value, datetime):
+                    value = _as_datetime(value).replace(microsecond=0)
+                assert vtodo.decoded(target) == value
+            elif source == 'categories':
+                assert vtodo.get(target).cats == value
+            elif source == 'rrule':
+                assert vtodo.get(target).to_ical().decode() == value
+            else:
+                assert vtodo.get(target) == value
+
+        # Caching the todo directly is the same as reading the file back.
+        cache.add_file(todo_list.name, todo.path, 0)
+        assert _cached(cache, cache.add_todo, todo, todo.path) == \
+            _cached(cache, cache.add_vtodo, vtodo, todo.path)
+
+    run_test()
+
+
+def test_escape():
+    assert ical.escape('a\\b;c,d\ne\r\nf') == 'a\\\\b\\;c\\,d\\ne\\nf'
+
+
+def test_fold():
+    line = 'DESCRIPTION:' + 'ñ€' * 60
+    folded = ical.fold(line)
+
+    assert all(len(chunk.encode()) <= 75 for chunk in folded.split('\r\n'))
+    assert folded.replace('\r\n ', '') == line
+    assert ical.fold('SUMMARY:short') == 'SUMMARY:short'
+    assert ical.fold('x' * 148) == 'x' * 74 + '\r\n ' + 'x' * 74
+
+
+def test_format_datetime():
+    tokyo = pytz.timezone('Asia/Tokyo')
+
+    assert ical.format_datetime('DUE', date(999, 1, 2)) == \
+        'DUE;VALUE=DATE:09990102'
+    assert ical.format_datetime(
+        'DUE',
+        tokyo.localize(datetime(2018, 1, 1, 8, 30, 15, 999)),
+    ) == 'DUE;VALUE=DATE-TIME:20171231T233015Z'
+
+
+def test_new_todo_file(tmpdir, runner, todos):
+    todo = Todo(new=True, list=List('default', str(tmpdir.join('default'))))
+    todo.summary = 'Buy milk, eggs; and bread'
+    todo.due = datetime.now(pytz.UTC) + timedelta(days=1)
+
+    path = tmpdir.join('default').join(todo.filename)
+    VtodoWriter(todo).write()
+
+    assert path.read_binary() == _old_serializer(todo)
+    assert next(todos()).summary == 'Buy milk, eggs; and bread'
+
+
+ORIGINAL = (
+    'BEGIN:VCALENDAR\n'
+    'VERSION:2.0\n'
+    'PRODID:-//Other client//EN\n'
+    'BEGIN:VTODO\n'
+    'UID:patched\n'
+    'SUMMARY:Old summary\n'
+    'DUE;VALUE=DATE:20300101\n'
+    'CATEGORIES:home,errands\n'
+    'X-OTHER-CLIENT;X-PARAM="a:b":A value which is long enough to have been \n'
+    ' folded by the client which wrote it\n'
+    'BEGIN:VALARM\n'
+    'ACTION:DISPLAY\n'
+    'DESCRIPTION:Reminder\n'
+    'TRIGGER:-PT15M\n'
+    'END:VALARM\n'
+    'END:VTODO\n'
+    'END:VCALENDAR\n'
+)
+
+
+def test_save_patches_changes(tmpdir, default_database):
+    path = tmpdir.join('default').join('patched.ics')
+    path.write(ORIGINAL)
+    default_database.update_cache()
+
+    todo = next(default_database.todos())
+    todo.summary = 'New summary'
+    todo.description = 'Added'
+    default_database.save(todo)
+
+    # Only changed lines are rewritten, and new ones are added after the
+    # last property, since nested components must come last.
+    assert path.read() == ORIGINAL.replace(
+        'SUMMARY:Old summary\n',
+        'SUMMARY:New summary\n',
+    ).replace(
+        'BEGIN:VALARM\n',
+        'DESCRIPTION:Added\n{}\nSEQUENCE:2\nBEGIN:VALARM\n'.format(
+            ical.format_datetime('LAST-MODIFIED', todo.last_modified),
+        ),
+    )
+
+    todo = default_database.todo(todo.id)
+    assert todo.summary == 'New summary'
+    assert todo.description == 'Added'
+
+    # Emptied properties are removed.
+    todo.description = ''
+    todo.due = None
+    default_database.save(todo)
+
+    data = path.read()
+    assert 'DUE' not in data
+    assert 'DESCRIPTION:Added' not in data
+    assert 'DESCRIPTION:Reminder' in data
+    assert 'CATEGORIES:home,errands\n' in data
+    assert 'X-OTHER-CLIENT;X-PARAM="a:b":A value which is long enough' in data
+
+
+def test_save_patch_caches_todo(tmpdir, default_database):
+    path = tmpdir.join('default').join('patched.ics')
+    path.write(ORIGINAL.replace(
+        'UID:patched\n',
+        'UID:patched\nRELATED-TO:parent\nRELATED-TO;RELTYPE=DEPENDS-ON:dep\n',
+    ))
+    default_database.update_cache()
+    cache = default_database.cache
+
+    todo = default_database.todo(next(default_database.todos()).id)
+    todo.summary = 'New summary'
+    todo.due = datetime(2030, 1, 2, 10, 30, tzinfo=pytz.UTC)
+    # The patched file isn't parsed again to update the cache.
+    with patch('icalendar.Calendar.from_ical') as from_ical:
+        default_database.save(todo)
+    assert from_ical.call_count == 0
+
+    def cached():
+        row = cache._conn.execute('SELECT * FROM todos').fetchone()
+        return (
+            {key: row[key] for key in row.keys() if key != 'id'},
+            cache.relations(row['id']),
+        )
+
+    # The cache is the same as if the file had been read.
+    patched = cached()
+    assert patched[0]['summary'] == 'New summary'
+    assert patched[0]['categories'] == 'home,errands'
+    assert patched[1] == {('parent', 'PARENT'), ('dep', 'DEPENDS-ON')}
+    cache.expire_file(str(path))
+    default_database.update_cache()
+    assert cached() == patched
+
+
+def test_save_unread_todo(tmpdir, default_database):
+    path = tmpdir.join('default').join('patched.ics')
+    todo_list = next(default_database.lists())
+
+    # Todos which weren't read from the cache are serialized in full.
+    path.write(ORIGINAL)
+    todo = Todo(list=todo_list, filename='patched.ics')
+    todo.uid = 'patched'
+    todo.summary = 'New summary'
+    default_database.save(todo)
+    assert 'PRODID:-//Other client//EN' in path.read()
+    assert 'SUMMARY:New summary' in path.read()
+
+
+def test_patch():
+    text = ORIGINAL.replace('\n', '\r\n')
+
+    assert ical.patch(text, 'patched', {'summary': 'New'}) == text.replace(
+        'Old summary',
+        'New',
+    )
+    assert ical.patch(text, 'other', {'summary': 'New'}) is None
+    # Duplicate properties are removed.
+    assert ical.patch(
+        text.replace('UID:patched', 'UID:patched\r\nSUMMARY:Again'),
+        'patched',
+        {'summary': 'New'},
+    ) == text.replace('Old summary', 'New')
+    assert ical.patch(text.replace('\r\n', '\r'), 'patched', {
+        'location': 'x' * 80,
+    }) == text.replace('\r\n', '\r').replace(
+        'BEGIN:VALARM\r',
+        'LOCATION:{}\r {}\rBEGIN:VALARM\r'.format('x' * 65, 'x' * 15),
+    )
+    # Without nested components, new properties go at the end.
+    assert ical.patch(
+        'BEGIN:VTODO\nUID:patched\nEND:VTODO\n',
+        'patched',
+        {'summary': 'New'},
+    ) == 'BEGIN:VTODO\nUID:patched\nSUMMARY:New\nEND:VTODO\n'
+    # Todos with overridden recurrences have several instances.
+    assert ical.patch(text + text, 'patched', {'summary': 'New'}) is None
+    assert ical.patch(text[:text.index('END:VTODO')], 'patched', {}) is None
+    assert ical.patch(' folded\r\n' + text[:-2], 'patched', {}) == \
+        ' folded\r\n' + text[:-2]
+
+
+def test_patch_non_utf8(tmpdir, default_database):
+    path = tmpdir.join('default').join('patched.ics')
+    path.write_binary(ORIGINAL.replace('Old', 'Öld').encode('latin-1'))
+    default_database.update_cache()
+
+    todo = default_database.todo(next(default_database.todos()).id)
+    todo.summary = 'New summary'
+    default_database.save(todo)
+
+    assert 'SUMMARY:New summary' in path.read()
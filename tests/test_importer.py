@@ -0,0 +1,238 @@
+import io
+from datetime import datetime
+from unittest.mock import patch
+
+import pytest
+import pytz
+
+from todoman.importer import Importer, split_calendar
+
+TIMEZONE = (
+    'BEGIN:VTIMEZONE\r\n'
+    'TZID:Europe/Berlin\r\n'
+    'BEGIN:STANDARD\r\n'
+    'DTSTART:19701025T030000\r\n'
+    'TZOFFSETFROM:+0200\r\n'
+    'TZOFFSETTO:+0100\r\n'
+    'END:STANDARD\r\n'
+    'END:VTIMEZONE\r\n'
+)
+
+
+def vtodo(uid, summary, extra=''):
+    return (
+        'BEGIN:VTODO\r\n' + ('UID:{}\r\n'.format(uid) if uid else '') +
+        'SUMMARY:{}\r\n'.format(summary) + extra + 'END:VTODO\r\n'
+    )
+
+
+def calendar(*components):
+    return io.BytesIO(
+        (
+            'BEGIN:VCALENDAR\r\n'
+            'VERSION:2.0\r\n'
+            'PRODID:-//Some other tool//EN\r\n' + ''.join(components) +
+            'END:VCALENDAR\r\n'
+        ).encode()
+    )
+
+
+@pytest.fixture
+def default_list(default_database):
+    return next(default_database.lists())
+
+
+def test_split_calendar():
+    alarm = (
+        'BEGIN:VALARM\r\n'
+        'ACTION:DISPLAY\r\n'
+        'TRIGGER:-PT15M\r\n'
+        'END:VALARM\r\n'
+    )
+    source = calendar(
+        TIMEZONE,
+        vtodo('one', 'One', 'DUE;TZID=Europe/Berlin:20200101T100000\r\n'),
+        'BEGIN:VEVENT\r\nUID:event\r\nEND:VEVENT\r\n',
+        vtodo('two', 'Two', alarm),
+    )
+
+    components = list(split_calendar(source))
+    assert len(components) == 2
+
+    data, timezones, position = components[0]
+    assert data == vtodo(
+        'one', 'One', 'DUE;TZID=Europe/Berlin:20200101T100000\r\n'
+    ).encode()
+    assert timezones == [TIMEZONE.encode()]
+
+    data, timezones, position = components[1]
+    assert data == vtodo('two', 'Two', alarm).encode()
+    assert timezones == []
+    assert position == len(source.getvalue()) - len('END:VCALENDAR\r\n')
+
+
+def test_split_calendar_unterminated():
+    source = io.BytesIO(b'BEGIN:VCALENDAR\nBEGIN:VTODO\nUID:one\nEND:VTODO')
+
+    ((data, timezones, position),) = split_calendar(source)
+    assert data == b'BEGIN:VTODO\nUID:one\nEND:VTODO\r\n'
+
+
+def test_import(default_database, default_list, tmpdir):
+    source = calendar(
+        TIMEZONE,
+        vtodo(
+            'one@example.com',
+            'One',
+            'DUE;TZID=Europe/Berlin:20200101T100000\r\nX-UNKNOWN:Kept\r\n',
+        ),
+        vtodo('two/unsafe', 'Two'),
+        vtodo(None, 'Three'),
+    )
+    positions = []
+
+    result = Importer(default_database, default_list, batch_size=2).run(
+        source,
+        positions.append,
+    )
+
+    assert result == (3, 0, 0, 0)
+    assert len(positions) == 3
+
+    files = tmpdir.join('default').listdir(sort=True)
+    assert len(files) == 3
+    assert tmpdir.join('default', 'one@example.com.ics') in files
+
+    content = tmpdir.join('default', 'one@example.com.ics').read_binary()
+    assert content.startswith(b'BEGIN:VCALENDAR\r\nVERSION:2.0\r\n')
+    assert TIMEZONE.encode() in content
+    assert b'X-UNKNOWN:Kept\r\n' in content
+
+    todos = {todo.summary: todo for todo in default_database.todos()}
+    assert sorted(todos) == ['One', 'Three', 'Two']
+    assert todos['Two'].uid == 'two/unsafe'
+    assert todos['Three'].uid
+    assert todos['One'].due == datetime(2020, 1, 1, 9, tzinfo=pytz.UTC)
+
+    # The cache is already up to date, so nothing needs to be parsed.
+    parsed = default_database.timings.phases['parse'].count
+    default_database.update_cache()
+    assert default_database.timings.phases['parse'].count == parsed
+    assert len(list(default_database.todos())) == 3
+
+
+def test_import_skip_duplicates(default_database, default_list, todo_factory):
+    todo = todo_factory(summary='Existing')
+
+    result = Importer(default_database, default_list).run(
+        calendar(
+            vtodo(todo.uid, 'Imported'),
+            vtodo('new', 'New'),
+            vtodo('new', 'New again'),
+        )
+    )
+
+    assert result == (1, 0, 2, 0)
+    summaries = sorted(todo.summary for todo in default_database.todos())
+    assert summaries == ['Existing', 'New']
+
+
+def test_import_replace_duplicates(
+    default_database,
+    default_list,
+    todo_factory,
+):
+    todo = todo_factory(summary='Existing')
+
+    result = Importer(default_database, default_list, 'replace').run(
+        calendar(
+            vtodo(todo.uid, 'Replaced'),
+            vtodo('new', 'New'),
+            vtodo('new', 'New again'),
+        )
+    )
+
+    assert result == (1, 2, 0, 0)
+    todos = {todo.summary: todo for todo in default_database.todos()}
+    assert sorted(todos) == ['New again', 'Replaced']
+    assert todos['Replaced'].id == todo.id
+    assert todos['Replaced'].path == todo.path
+
+
+@pytest.mark.parametrize('duplicates, expected', [
+    ('skip', (2, 0, 2, 0)),
+    ('replace', (2, 2, 0, 0)),
+])
+def test_import_duplicates_across_batches(
+    default_database,
+    default_list,
+    duplicates,
+    expected,
+):
+    importer = Importer(
+        default_database,
+        default_list,
+        duplicates,
+        batch_size=2,
+    )
+    # 'one' is repeated within the first batch, and 'two' in the next one.
+    result = importer.run(calendar(
+        vtodo('one', 'One'),
+        vtodo('one', 'One again'),
+        vtodo('two', 'Two'),
+        vtodo('two', 'Two again'),
+    ))
+
+    assert result == expected
+    assert len(list(default_database.todos())) == 2
+
+
+def test_import_invalid(default_database, default_list, caplog):
+    result = Importer(default_database, default_list).run(
+        calendar(
+            vtodo('broken', 'Broken', 'DUE:yesterday-ish\r\n'),
+            vtodo('fine', 'Fine'),
+        )
+    )
+
+    assert result.imported == 1
+    assert result.failed == 1
+    assert 'Skipping invalid todo' in caplog.text
+
+
+def test_import_replace_shared_file(default_database, default_list, create):
+    create(
+        'shared.ics',
+        'UID:one\nSUMMARY:One\nEND:VTODO\nBEGIN:VTODO\nUID:two\n'
+        'SUMMARY:Two\n',
+    )
+    default_database.update_cache()
+
+    result = Importer(default_database, default_list, 'replace').run(
+        calendar(vtodo('one', 'Replaced'))
+    )
+
+    assert result == (0, 0, 1, 0)
+    summaries = sorted(todo.summary for todo in default_database.todos())
+    assert summaries == ['One', 'Two']
+
+
+def test_import_error(default_database, default_list, tmpdir):
+    importer = Importer(default_database, default_list, batch_size=1)
+
+    with patch.object(
+        importer.writer,
+        'commit',
+        side_effect=OSError('Disk on fire'),
+    ):
+        with pytest.raises(OSError):
+            importer.run(calendar(vtodo('one', 'One')))
+
+    # Nothing is left behind.
+    assert tmpdir.join('default').listdir() == []
+    assert list(default_database.todos()) == []
+
+
+def test_invalid_duplicates_mode(default_database, default_list):
+    with pytest.raises(ValueError):
+        Importer(default_database, default_list, 'sometimes')
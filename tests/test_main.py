@@ -2,6 +2,9 @@ import os
 import sys
 from subprocess import PIPE, Popen
 
+import pytest
+
+from todoman.__main__ import main
 from todoman.cli import cli
 
 
@@ -20,3 +23,96 @@ def test_main(tmpdir, runner):
     main_output = pipe.communicate()[0]
 
     assert cli_result.output == main_output.decode()
+
+
+def test_list_lazy_imports(tmpdir, runner, create, config, xdg_cache_home):
+    """
+    Check that a warm ``todo list`` does not load any heavy dependencies.
+
+    This needs a fresh interpreter, since the test session itself will already
+    have imported everything.
+    """
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    env = os.environ.copy()
+    env['PYTHONPATH'] = root
+    env['TODOMAN_CONFIG'] = str(config)
+    env['XDG_CACHE_HOME'] = str(xdg_cache_home)
+
+    create('test.ics', 'SUMMARY:harhar\n')
+    # Populate the cache first:
+    assert not runner.invoke(cli, ['list']).exception
+
+    script = (
+        'import sys\n'
+        'from todoman.cli import cli\n'
+        'try:\n'
+        '    cli(["list"])\n'
+        'except SystemExit:\n'
+        '    pass\n'
+        'print("\\n".join(sys.modules))\n'
+    )
+    pipe = Popen([sys.executable, '-c', script], stdout=PIPE, env=env)
+    output = pipe.communicate()[0].decode().splitlines()
+
+    assert 'harhar' in output[0]
+    modules = {module.split('.')[0] for module in output[1:]}
+
+    assert 'todoman' in modules
+    assert 'click' in modules
+    for module in (
+        'atomicwrites',
+        'humanize',
+        'icalendar',
+        'parsedatetime',
+        'pytz',
+        'urwid',
+    ):
+        assert module not in modules
+
+
+def test_complete_minimal_imports(
+    tmpdir, runner, create, config, xdg_cache_home
+):
+    """
+    Check that ``todo _complete`` reads the cache without loading the CLI.
+    """
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    env = os.environ.copy()
+    env['PYTHONPATH'] = root
+    env['XDG_CACHE_HOME'] = str(xdg_cache_home)
+
+    create('test.ics', 'SUMMARY:harhar\n')
+    # Populate the cache (and the cached configuration) first:
+    assert not runner.invoke(cli, ['list']).exception
+
+    script = (
+        'import sys\n'
+        'from todoman.__main__ import main\n'
+        'sys.argv = ["todo", "_complete", "ids"]\n'
+        'try:\n'
+        '    main()\n'
+        'except SystemExit:\n'
+        '    pass\n'
+        'print("\\n".join(sys.modules))\n'
+    )
+    pipe = Popen([sys.executable, '-c', script], stdout=PIPE, env=env)
+    output = pipe.communicate()[0].decode().splitlines()
+
+    assert output[0] == '1\t@default harhar'
+    modules = {module.split('.')[0] for module in output[1:]}
+
+    assert 'todoman' in modules
+    for module in ('click', 'configobj', 'dateutil', 'xdg'):
+        assert module not in modules
+
+
+def test_main_dispatch(monkeypatch):
+    monkeypatch.setattr('sys.argv', ['todo', '_complete'])
+    with pytest.raises(SystemExit) as excinfo:
+        main()
+    assert excinfo.value.code == 2
+
+    monkeypatch.setattr('sys.argv', ['todo', '--help'])
+    with pytest.raises(SystemExit) as excinfo:
+        main()
+    assert excinfo.value.code == 0
@@ -1,3 +1,4 @@
+import os
 from datetime import date, datetime, timedelta
 from unittest.mock import patch
 
@@ -7,8 +8,17 @@ from dateutil.tz import tzlocal
 from dateutil.tz.tz import tzoffset
 from freezegun import freeze_time
 
-from todoman.exceptions import AlreadyExists
-from todoman.model import cached_property, Database, List, Todo
+from todoman.exceptions import AlreadyExists, ChangedOnDisk
+from todoman.model import (
+    _compile_rrule,
+    cached_property,
+    compile_rrule,
+    Database,
+    FILE_NO_VTODO,
+    List,
+    next_occurrence,
+    Todo,
+)
 
 
 def test_querying(create, tmpdir):
@@ -343,6 +353,58 @@ def test_todos_startable(tmpdir, runner, todo_factory, todos):
         assert 'unstarted' not in todo.summary
 
 
+def test_todos_startable_dependencies(tmpdir, create, default_database):
+    create('a.ics', 'UID:a\nSUMMARY:A\nRELATED-TO;RELTYPE=DEPENDS-ON:b\n')
+    create('b.ics', 'UID:b\nSUMMARY:B\n')
+    create(
+        'c.ics',
+        'UID:c\nSUMMARY:C\n'
+        'RELATED-TO;RELTYPE=DEPENDS-ON:missing\n'
+        'RELATED-TO;RELTYPE=DEPENDS-ON:c\n'
+        'RELATED-TO:b\n',
+    )
+    default_database.update_cache()
+
+    def startable():
+        return sorted(
+            todo.summary for todo in default_database.todos(startable=True)
+        )
+
+    assert startable() == ['B', 'C']
+
+    # Completing the prerequisite unblocks the todos that depend on it.
+    prerequisite = next(default_database.todos(grep='B'))
+    prerequisite.complete()
+    default_database.save(prerequisite)
+    assert startable() == ['A', 'C']
+
+    # As does deleting it, even if something else then blocks them.
+    create('d.ics', 'UID:b\nSUMMARY:D\n', list_name='other')
+    default_database = Database(
+        [tmpdir.join('default'), tmpdir.join('other')],
+        default_database.cache.cache_path,
+    )
+    assert startable() == ['C', 'D']
+
+    default_database.delete(next(default_database.todos(grep='D')))
+    assert startable() == ['A', 'C']
+
+
+def test_todos_startable_uses_index(default_database):
+    extra_where, params = default_database.cache._todo_filters(startable=True)
+    plan = default_database.cache._conn.execute(
+        '''
+        EXPLAIN QUERY PLAN
+            SELECT todos.id
+              FROM todos, files
+             WHERE todos.file_path = files.path {}
+        '''.format(' '.join(extra_where)),
+        params,
+    ).fetchall()
+
+    assert any('todos_startable' in row[-1] for row in plan)
+
+
 def test_filename_uid_colision(create, default_database, runner, todos):
     create('ABC.ics', 'SUMMARY:My UID is not ABC\n' 'UID:NOTABC\n')
     len(list(todos())) == 1
@@ -427,6 +489,51 @@ def test_unreadable_ics(todo_factory, todos, tmpdir):
     assert mocked_exception.call_count == 1
 
 
+def test_file_statuses(tmpdir, create, default_database, todos, sleep):
+    create('todo.ics', 'SUMMARY:Buy milk\n')
+    broken = tmpdir.join('default').join('broken.ics')
+    broken.write('BEGIN:VCALENDAR\nBEGIN:VTODO\nSUMMARY:Buy eggs\n')
+    # Files without todos aren't parsed, so this isn't reported as broken.
+    events = tmpdir.join('default').join('events.ics')
+    events.write('BEGIN:VCALENDAR\nBEGIN:VEVENT\nSUMMARY:Party\n')
+
+    assert [todo.summary for todo in todos()] == ['Buy milk']
+    errors = default_database.file_statuses()
+    assert [(row['path'], row['parse_status']) for row in errors] == [
+        (str(broken), 'error'),
+    ]
+    assert errors[0]['parse_error'].startswith(
+        'ValueError: Found no components'
+    )
+    assert [
+        row['path']
+        for row in default_database.file_statuses([FILE_NO_VTODO])
+    ] == [str(events)]
+
+    # Fixed files are read again.
+    sleep()
+    create('broken.ics', 'SUMMARY:Buy eggs\n')
+    assert len(list(todos())) == 2
+    assert default_database.file_statuses() == []
+
+
+def test_flush_without_commits(todo_factory, default_database):
+    for i in range(5):
+        todo_factory(summary='done {}'.format(i), status='COMPLETED')
+    todo_factory(summary='pending')
+
+    with patch.object(
+        default_database.cache,
+        'save_to_disk',
+        wraps=default_database.cache.save_to_disk,
+    ) as save_to_disk:
+        flushed = list(default_database.flush())
+
+    assert len(flushed) == 5
+    assert save_to_disk.call_count == 0
+    assert not any(os.path.exists(todo.path) for todo in flushed)
+
+
 def test_cached_property_caching():
     class TestClass:
         i = 0
@@ -469,3 +576,619 @@ def test_cached_property_property():
             return 0
 
     assert TestClass.a.__class__ == cached_property
+
+
+def test_database_timings(create, tmpdir, sleep):
+    create('one.ics', 'SUMMARY:one\n')
+    create('two.ics', 'SUMMARY:two\n')
+    db = Database([tmpdir.join('default')], tmpdir.join('cache.sqlite3'))
+    timings = db.timings
+
+    assert list(timings.phases) == [
+        'lists',
+        'expire',
+        'scan',
+        'parse',
+        'commit',
+    ]
+    assert timings.phases['lists'].count == 1
+    assert timings.phases['scan'].count == 2
+    assert timings.phases['expire'].count == 0
+    assert timings.phases['parse'].count == 2
+    assert all(phase.seconds > 0 for phase in timings.phases.values())
+
+    sleep()
+    create('two.ics', 'SUMMARY:two, again\n')
+    db.update_cache()
+    assert timings.phases['scan'].count == 4
+    assert timings.phases['expire'].count == 1
+    assert timings.phases['parse'].count == 3
+
+    assert len(list(db.todos())) == 2
+    db.todo(1)
+    assert timings.phases['hydrate'].count == 3
+    assert len(list(db.tree())) == 2
+    assert timings.phases['hydrate'].count == 5
+    assert timings.phases['query'].seconds > 0
+    assert timings.total == sum(
+        phase.seconds for phase in timings.phases.values()
+    )
+
+
+def test_compile_rrule_cache():
+    _compile_rrule.cache_clear()
+    dt = datetime(2020, 1, 1, 10, tzinfo=pytz.UTC)
+
+    first = compile_rrule('FREQ=DAILY', dt)
+    assert compile_rrule('FREQ=DAILY', dt) is first
+    assert compile_rrule('FREQ=WEEKLY', dt) is not first
+    # The same instant in another timezone expands differently:
+    other = compile_rrule('FREQ=DAILY', dt.astimezone(tzoffset(None, 3600)))
+    assert other is not first
+    assert other[0].tzinfo != first[0].tzinfo
+
+    assert _compile_rrule.cache_info().hits == 1
+    assert _compile_rrule.cache_info().misses == 3
+
+
+def test_occurrences_recurring():
+    todo = Todo()
+    todo.due = datetime(2020, 1, 1, 10, tzinfo=pytz.UTC)
+    todo.rrule = 'FREQ=DAILY'
+
+    occurrences = todo.occurrences(
+        datetime(2020, 1, 3, tzinfo=pytz.UTC),
+        datetime(2020, 1, 5, 10, tzinfo=pytz.UTC),
+    )
+    assert occurrences == [
+        datetime(2020, 1, 3, 10, tzinfo=pytz.UTC),
+        datetime(2020, 1, 4, 10, tzinfo=pytz.UTC),
+        datetime(2020, 1, 5, 10, tzinfo=pytz.UTC),
+    ]
+
+
+def test_occurrences_bounded():
+    todo = Todo()
+    todo.start = datetime(2020, 1, 1, 10, tzinfo=pytz.UTC)
+    todo.rrule = 'FREQ=WEEKLY;COUNT=3'
+
+    occurrences = todo.occurrences(
+        datetime(2020, 1, 1, tzinfo=pytz.UTC),
+        datetime(2020, 12, 31, tzinfo=pytz.UTC),
+    )
+    assert len(occurrences) == 3
+    assert occurrences[-1] == datetime(2020, 1, 15, 10, tzinfo=pytz.UTC)
+
+
+def test_occurrences_dates():
+    todo = Todo()
+    todo.due = date(2020, 1, 1)
+    todo.rrule = 'FREQ=MONTHLY'
+
+    occurrences = todo.occurrences(date(2020, 1, 15), date(2020, 3, 15))
+    assert occurrences == [date(2020, 2, 1), date(2020, 3, 1)]
+
+
+def test_occurrences_until_date():
+    # RFC 5545 requires UNTIL to be a date for all-day todos.
+    todo = Todo()
+    todo.due = date(2020, 1, 1)
+    todo.rrule = 'FREQ=DAILY;UNTIL=20200103'
+
+    with patch('todoman.model.logger') as logger:
+        occurrences = todo.occurrences(date(2019, 12, 30), date(2020, 1, 10))
+
+    assert occurrences == [
+        date(2020, 1, 1),
+        date(2020, 1, 2),
+        date(2020, 1, 3),
+    ]
+    assert logger.warning.call_count == 0
+
+
+def test_occurrences_until_floating():
+    todo = Todo()
+    todo.due = datetime(2020, 1, 1, 10)
+    todo.rrule = 'FREQ=DAILY;UNTIL=20200103T100000'
+
+    with patch('todoman.model.LOCAL_TIMEZONE', pytz.UTC):
+        occurrences = todo.occurrences(
+            datetime(2020, 1, 2, tzinfo=pytz.UTC),
+            datetime(2020, 1, 10, tzinfo=pytz.UTC),
+        )
+
+    assert occurrences == [
+        datetime(2020, 1, 2, 10, tzinfo=pytz.UTC),
+        datetime(2020, 1, 3, 10, tzinfo=pytz.UTC),
+    ]
+
+
+def test_occurrences_not_recurring():
+    todo = Todo()
+    assert todo.occurrences(date(2020, 1, 1), date(2020, 2, 1)) == []
+
+    todo.due = date(2020, 1, 10)
+    assert todo.occurrences(date(2020, 1, 1), date(2020, 2, 1)) == [
+        date(2020, 1, 10),
+    ]
+    assert todo.occurrences(date(2020, 2, 1), date(2020, 3, 1)) == []
+
+
+def test_occurrences_invalid_rrule():
+    todo = Todo()
+    todo.due = datetime(2020, 1, 10, tzinfo=pytz.UTC)
+    todo.rrule = 'FREQ=SOMETIMES'
+
+    with patch('todoman.model.logger') as logger:
+        occurrences = todo.occurrences(date(2020, 1, 1), date(2020, 2, 1))
+
+    assert occurrences == [todo.due]
+    assert logger.warning.call_count == 1
+    assert todo.occurrences(date(2020, 2, 1), date(2020, 3, 1)) == []
+
+
+def test_database_occurrences(todo_factory, default_database):
+    start = datetime(2020, 1, 1, tzinfo=pytz.UTC)
+    todo_factory(summary='daily', due=start, rrule='FREQ=DAILY')
+    todo_factory(summary='once', due=start + timedelta(days=1, hours=1))
+    todo_factory(summary='later', due=start + timedelta(days=30))
+    todo_factory(summary='never')
+
+    occurrences = default_database.occurrences(
+        start,
+        start + timedelta(days=2),
+    )
+    assert [(dt, todo.summary) for dt, todo in occurrences] == [
+        (start, 'daily'),
+        (start + timedelta(days=1), 'daily'),
+        (start + timedelta(days=1, hours=1), 'once'),
+        (start + timedelta(days=2), 'daily'),
+    ]
+
+
+@pytest.mark.parametrize('rule', [
+    'FREQ=DAILY',
+    'FREQ=DAILY;INTERVAL=3',
+    'FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,TH',
+    'FREQ=HOURLY;INTERVAL=5',
+    'FREQ=MONTHLY;BYMONTHDAY=-1',
+    'FREQ=DAILY;COUNT=500',
+    'FREQ=DAILY;UNTIL=20200301T000000Z',
+])
+def test_next_occurrence(rule):
+    dtstart = datetime(2019, 1, 1, 10, 30, tzinfo=pytz.UTC)
+    after = datetime(2020, 2, 15, 9, 0, tzinfo=pytz.UTC)
+
+    expected = compile_rrule(rule, dtstart).after(after)
+    assert next_occurrence(rule, dtstart, after) == expected
+
+
+@pytest.mark.parametrize('rule', [
+    'FREQ=DAILY;COUNT=3',
+    'FREQ=DAILY;UNTIL=20190110T000000Z',
+])
+def test_next_occurrence_ended(rule):
+    dtstart = datetime(2019, 1, 1, 10, 30, tzinfo=pytz.UTC)
+    after = datetime(2020, 2, 15, 9, 0, tzinfo=pytz.UTC)
+
+    assert next_occurrence(rule, dtstart, after) is None
+
+
+def test_next_occurrence_rebases():
+    dtstart = datetime(2000, 1, 1, 10, 30, tzinfo=pytz.UTC)
+    after = datetime(2020, 2, 15, 9, 0, tzinfo=pytz.UTC)
+
+    _compile_rrule.cache_clear()
+    occurrence = next_occurrence('FREQ=DAILY', dtstart, after)
+    assert occurrence == datetime(2020, 2, 15, 10, 30, tzinfo=pytz.UTC)
+    # The rule is compiled again, starting shortly before `after`.
+    assert _compile_rrule.cache_info().misses == 2
+
+    _compile_rrule.cache_clear()
+    next_occurrence('FREQ=DAILY;COUNT=10000', dtstart, after)
+    assert _compile_rrule.cache_info().misses == 1
+
+
+@pytest.mark.parametrize('rule', [
+    'FREQ=DAILY;INTERVAL=3',
+    'freq=daily;interval=3',
+    'INTERVAL=3;FREQ=DAILY',
+])
+def test_next_occurrence_rebases_interval(rule):
+    dtstart = datetime(2000, 1, 1, 10, 30, tzinfo=pytz.UTC)
+    after = datetime(2020, 2, 15, 9, 0, tzinfo=pytz.UTC)
+
+    _compile_rrule.cache_clear()
+    occurrence = next_occurrence(rule, dtstart, after)
+    assert occurrence == compile_rrule(rule, dtstart).after(after)
+    assert _compile_rrule.cache_info().misses == 2
+
+
+@freeze_time('2020-02-15 09:00')
+def test_complete_catch_up(todo_factory):
+    original_due = datetime(2019, 1, 1, 10, 30, tzinfo=pytz.UTC)
+    original_start = original_due - timedelta(hours=2)
+    todo = todo_factory(
+        rrule='FREQ=DAILY',
+        due=original_due,
+        start=original_start,
+    )
+
+    todo.complete(catch_up=True)
+    related = todo.related[0]
+
+    assert todo.is_completed
+    assert todo.due == original_due
+    assert not todo.rrule
+
+    assert related.due == datetime(2020, 2, 15, 10, 30, tzinfo=pytz.UTC)
+    assert related.start == datetime(2020, 2, 15, 8, 30, tzinfo=pytz.UTC)
+    assert related.rrule == 'FREQ=DAILY'
+    assert not related.is_completed
+
+
+@freeze_time('2020-02-15 09:00')
+def test_complete_catch_up_count(todo_factory):
+    original_due = datetime(2020, 1, 1, 10, 30, tzinfo=pytz.UTC)
+    todo = todo_factory(rrule='FREQ=WEEKLY;COUNT=10', due=original_due)
+
+    todo.complete(catch_up=True)
+    related = todo.related[0]
+
+    # Seven occurrences (Jan 1st to Feb 12th) have been skipped.
+    assert related.due == datetime(2020, 2, 19, 10, 30, tzinfo=pytz.UTC)
+    assert related.rrule == 'FREQ=WEEKLY;COUNT=3'
+
+
+@freeze_time('2020-02-15 09:00')
+def test_complete_catch_up_ended(todo_factory):
+    original_due = datetime(2020, 1, 1, 10, 30, tzinfo=pytz.UTC)
+    todo = todo_factory(rrule='FREQ=DAILY;COUNT=3', due=original_due)
+
+    todo.complete(catch_up=True)
+
+    assert todo.is_completed
+    assert not todo.rrule
+    assert todo.related == []
+
+
+@freeze_time('2020-02-15 09:00')
+def test_complete_catch_up_dates(todo_factory):
+    todo = todo_factory(rrule='FREQ=MONTHLY', due=date(2019, 6, 20))
+
+    todo.complete(catch_up=True)
+
+    assert todo.related[0].due == date(2020, 2, 20)
+
+
+@freeze_time('2020-02-15 09:00')
+def test_complete_catch_up_until_date(todo_factory):
+    todo = todo_factory(
+        rrule='FREQ=DAILY;UNTIL=20301231',
+        due=date(2020, 1, 1),
+    )
+
+    todo.complete(catch_up=True)
+
+    assert todo.related[0].due == date(2020, 2, 16)
+    assert todo.related[0].rrule == 'FREQ=DAILY;UNTIL=20301231'
+
+
+@freeze_time('2020-02-15 09:00')
+@pytest.mark.parametrize('until, expected', [
+    ('20990315T020000', datetime(2020, 2, 15, 10, 30)),
+    ('20200210T000000', None),
+])
+def test_complete_catch_up_until_naive(until, expected):
+    todo = Todo()
+    todo.due = datetime(2020, 1, 1, 10, 30)
+    todo.rrule = 'FREQ=DAILY;UNTIL={}'.format(until)
+
+    with patch('todoman.model.LOCAL_TIMEZONE', pytz.UTC):
+        todo.complete(catch_up=True)
+
+    assert [related.due for related in todo.related] == (
+        [expected] if expected else []
+    )
+
+
+@freeze_time('2020-02-15 09:00')
+def test_complete_catch_up_start(todo_factory):
+    original_start = datetime(2019, 1, 1, 10, 30, tzinfo=pytz.UTC)
+    todo = todo_factory(rrule='FREQ=DAILY', start=original_start)
+
+    todo.complete(catch_up=True)
+    related = todo.related[0]
+
+    assert related.due is None
+    assert related.start == datetime(2020, 2, 15, 10, 30, tzinfo=pytz.UTC)
+
+
+def test_complete_recurring_count(todo_factory):
+    original_due = datetime.now(pytz.UTC).replace(microsecond=0)
+    todo = todo_factory(rrule='FREQ=DAILY;COUNT=3', due=original_due)
+
+    todo.complete()
+    related = todo.related[0]
+    assert related.due == original_due + timedelta(days=1)
+    assert related.rrule == 'FREQ=DAILY;COUNT=2'
+
+
+def test_save_all(default_database, todo_factory, todos):
+    todo_factory(summary='one')
+    todo_factory(summary='two')
+
+    saved = [todo for todo in todos()]
+    for todo in saved:
+        todo.summary = todo.summary.upper()
+
+    with patch.object(
+        default_database.cache,
+        'save_to_disk',
+        wraps=default_database.cache.save_to_disk,
+    ) as save_to_disk:
+        default_database.save_all(saved)
+
+    assert save_to_disk.call_count == 1
+    assert sorted(todo.summary for todo in todos()) == ['ONE', 'TWO']
+
+
+@freeze_time('2020-02-15 09:00')
+def test_complete_catch_up_naive():
+    todo = Todo()
+    todo.due = datetime(2019, 1, 1, 10, 30)
+    todo.rrule = 'FREQ=WEEKLY'
+
+    with patch('todoman.model.LOCAL_TIMEZONE', pytz.UTC):
+        todo.complete(catch_up=True)
+
+    assert todo.related[0].due == datetime(2020, 2, 18, 10, 30)
+
+
+def test_move_updates_cache(create, tmpdir):
+    create('one.ics', 'SUMMARY:one\nUID:one\n')
+    create('two.ics', 'SUMMARY:two\nUID:two\n')
+    tmpdir.mkdir('other')
+    db = Database(
+        [tmpdir.join('default'), tmpdir.join('other')],
+        tmpdir.join('cache.sqlite3'),
+    )
+    other = next(lst for lst in db.lists() if lst.name == 'other')
+    todos = {todo.summary: todo for todo in db.todos()}
+
+    with patch.object(
+        db.cache,
+        'save_to_disk',
+        wraps=db.cache.save_to_disk,
+    ) as save_to_disk:
+        db.move_all(todos.values(), other)
+    assert save_to_disk.call_count == 1
+
+    assert tmpdir.join('other', 'one.ics').check()
+    assert not tmpdir.join('default', 'one.ics').check()
+
+    moved = {todo.summary: todo for todo in db.todos()}
+    assert moved['one'].id == todos['one'].id
+    assert moved['one'].list.name == 'other'
+    assert moved['one'].path == str(tmpdir.join('other', 'one.ics'))
+
+    # Nothing is left to re-parse.
+    parsed = db.timings.phases['parse'].count
+    db.update_cache()
+    assert db.timings.phases['parse'].count == parsed
+    assert db.timings.phases['expire'].count == 0
+    assert sorted(todo.id for todo in db.todos()) == sorted(
+        todo.id for todo in todos.values()
+    )
+
+
+def test_move_over_stale_entry(create, tmpdir, default_database):
+    create('one.ics', 'SUMMARY:one\nUID:one\n')
+    stale = create('one.ics', 'SUMMARY:stale\nUID:one\n', 'other')
+    default_database.paths.append(str(tmpdir.join('other')))
+    default_database.update_cache()
+    stale.remove()
+
+    todo = next(
+        todo for todo in default_database.todos() if todo.summary == 'one'
+    )
+    other = next(
+        lst for lst in default_database.lists() if lst.name == 'other'
+    )
+    default_database.move(todo, other)
+
+    assert [todo.summary for todo in default_database.todos()] == ['one']
+
+
+def test_delete_updates_cache(create, tmpdir, default_database):
+    create('one.ics', 'SUMMARY:one\nUID:one\n')
+    create('two.ics', 'SUMMARY:two\nUID:two\n')
+    default_database.update_cache()
+
+    todos = [todo for todo in default_database.todos()]
+    default_database.delete_all(todos[:1])
+
+    assert [todo.id for todo in default_database.todos()] == [todos[1].id]
+    assert not tmpdir.join('default', todos[0].filename).check()
+
+    default_database.update_cache()
+    assert default_database.timings.phases['expire'].count == 0
+
+
+def test_todos_limit_offset(default_database, todo_factory):
+    for i in range(7):
+        todo_factory(summary='Task {}'.format(i), priority=5)
+
+    ordered = [t.summary for t in default_database.todos()]
+    pages = [
+        [
+            t.summary for t in
+            default_database.todos(limit=3, offset=offset)
+        ] for offset in (0, 3, 6)
+    ]
+
+    # Todos that sort equally are paged in a stable order.
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert sorted(sum(pages, [])) == sorted(ordered)
+
+
+def test_count_todos(default_database, todo_factory):
+    todo_factory(summary='Buy milk')
+    todo_factory(summary='Buy bread', status='COMPLETED')
+    todo_factory(summary='Walk the dog')
+
+    assert default_database.count_todos() == 2
+    assert default_database.count_todos(grep='buy') == 1
+    assert default_database.count_todos(grep='buy', status=['ANY']) == 2
+    assert default_database.count_todos(sort=['due'], reverse=False) == 2
+
+
+def test_cache_is_fresh(default_database):
+    cache = default_database.cache
+
+    assert cache.is_fresh(60)
+    assert not cache.is_fresh(0)
+
+    cache.set_refreshed(datetime.now().timestamp() - 120)
+    assert not cache.is_fresh(60)
+    assert cache.is_fresh(180)
+
+    # Clocks going backwards shouldn't make the cache fresh forever.
+    cache.set_refreshed(datetime.now().timestamp() + 120)
+    assert not cache.is_fresh(180)
+
+    cache.set_refreshed(None)
+    assert not cache.is_fresh(60)
+
+
+def test_database_max_age(tmpdir, create):
+    cache_path = tmpdir.join('cache.sqlite3')
+    create('one.ics', 'SUMMARY:One\n')
+    Database([tmpdir.join('default')], cache_path)
+    create('two.ics', 'SUMMARY:Two\n')
+
+    stale = Database([tmpdir.join('default')], cache_path, max_age=60)
+    assert [todo.summary for todo in stale.todos()] == ['One']
+
+    fresh = Database([tmpdir.join('default')], cache_path)
+    assert len(list(fresh.todos())) == 2
+
+
+def test_save_changed_on_disk(default_database, todo_factory, tmpdir):
+    todo = todo_factory(summary='Original')
+    todo = default_database.todo(todo.id)
+
+    path = tmpdir.join('default').join(todo.filename)
+    path.write(path.read().replace('Original', 'Changed elsewhere'))
+    os.utime(str(path), (0, 0))
+
+    todo.summary = 'Mine'
+    with pytest.raises(ChangedOnDisk) as excinfo:
+        default_database.save(todo)
+    assert str(path) in str(excinfo.value)
+    assert 'Changed elsewhere' in path.read()
+
+    default_database.update_cache()
+    todo = default_database.todo(todo.id)
+    todo.summary = 'Mine'
+    default_database.save(todo)
+    assert 'Mine' in path.read()
+
+
+@pytest.mark.parametrize('durability,fsyncs', [
+    ('full', 6),
+    ('batch', 4),
+    ('none', 0),
+])
+def test_save_all_durability(tmpdir, durability, fsyncs):
+    database = Database(
+        [tmpdir.mkdir('default')],
+        tmpdir.join('cache.sqlite3'),
+        durability=durability,
+    )
+    todos = []
+    for summary in ('One', 'Two', 'Three'):
+        todo = Todo(new=True, list=next(database.lists()))
+        todo.summary = summary
+        todos.append(todo)
+
+    with patch('os.fsync') as fsync:
+        database.save_all(todos)
+
+    # Either each file and its directory, or each file and then the
+    # directory once.
+    assert fsync.call_count == fsyncs
+    assert len(tmpdir.join('default').listdir()) == 3
+    assert sorted(todo.summary for todo in database.todos()) == [
+        'One', 'Three', 'Two'
+    ]
+    for todo in todos:
+        assert database.todo(todo.id).summary == todo.summary
+
+    with patch('os.fsync') as fsync:
+        database.save(todos[0], durability='none')
+    assert fsync.call_count == 0
+
+
+def test_save_all_batch_same_file(default_database, todo_factory):
+    todo = todo_factory(summary='Original')
+    todo.summary = 'Mine'
+
+    default_database.save_all([todo, todo], durability='batch')
+
+    todo = default_database.todo(todo.id)
+    assert todo.summary == 'Mine'
+    assert todo.sequence == 3
+
+
+def test_save_all_batch_partial(default_database, todo_factory, tmpdir):
+    first = todo_factory(summary='First')
+    second = todo_factory(summary='Second')
+
+    path = tmpdir.join('default').join(second.filename)
+    os.utime(str(path), (0, 0))
+
+    first.summary = 'First, edited'
+    with pytest.raises(ChangedOnDisk):
+        default_database.save_all([first, second], durability='batch')
+
+    assert default_database.todo(first.id).summary == 'First, edited'
+    assert not tmpdir.join('default').listdir('.*')
+
+
+@pytest.mark.parametrize('scan_concurrency', [1, 4])
+def test_database_refresh(tmpdir, create, sleep, scan_concurrency):
+    create('one.ics', 'SUMMARY:One\n', list_name='first')
+    create('two.ics', 'SUMMARY:Two\n', list_name='second')
+    database = Database(
+        [tmpdir.join('first'), tmpdir.join('second')],
+        tmpdir.join('cache.sqlite3'),
+        scan_concurrency=scan_concurrency,
+    )
+
+    with patch.object(database, 'update_cache') as update_cache:
+        database.refresh()
+    assert not update_cache.called
+
+    sleep()
+    create('three.ics', 'SUMMARY:Three\n', list_name='second')
+    with patch.object(
+        database,
+        'update_cache',
+        wraps=database.update_cache,
+    ) as update_cache:
+        database.refresh()
+    update_cache.assert_called_once_with([str(tmpdir.join('second'))])
+
+    assert sorted(
+        (todo.list.name, todo.summary) for todo in database.todos()
+    ) == [('first', 'One'), ('second', 'Three'), ('second', 'Two')]
+
+    sleep()
+    tmpdir.join('second').join('two.ics').remove()
+    tmpdir.join('first').join('displayname').write('Renamed')
+    database.refresh()
+
+    assert sorted(
+        (todo.list.name, todo.summary) for todo in database.todos()
+    ) == [('Renamed', 'One'), ('second', 'Three')]
@@ -0,0 +1,143 @@
+import logging
+import sqlite3
+
+import pytest
+
+from todoman.cli import cli
+from todoman.model import Database
+from todoman.querylog import InstrumentedConnection, QueryLog
+
+
+@pytest.fixture
+def connection():
+    conn = sqlite3.connect(':memory:', factory=InstrumentedConnection)
+    conn.query_log = QueryLog(threshold=float('inf'))
+    conn.execute('CREATE TABLE numbers (n INTEGER)')
+    conn.executemany(
+        'INSERT INTO numbers (n) VALUES (?)',
+        ((i,) for i in range(10)),
+    )
+    return conn
+
+
+def test_statement_stats(connection):
+    for _ in range(2):
+        rows = list(connection.execute('SELECT n FROM numbers WHERE n < 3'))
+        assert len(rows) == 3
+    assert connection.execute('SELECT count(*) FROM numbers').fetchone() == (
+        10,
+    )
+    assert len(connection.execute('SELECT * FROM numbers').fetchall()) == 10
+
+    stats = connection.query_log.stats
+    assert list(stats) == [
+        'CREATE TABLE numbers (n INTEGER)',
+        'INSERT INTO numbers (n) VALUES (?)',
+        'SELECT n FROM numbers WHERE n < 3',
+        'SELECT count(*) FROM numbers',
+        'SELECT * FROM numbers',
+    ]
+    assert stats['INSERT INTO numbers (n) VALUES (?)'].rows == 10
+    assert stats['SELECT n FROM numbers WHERE n < 3'].count == 2
+    assert stats['SELECT n FROM numbers WHERE n < 3'].rows == 6
+    assert stats['SELECT count(*) FROM numbers'].rows == 1
+    assert stats['SELECT * FROM numbers'].rows == 10
+    for stat in stats.values():
+        assert sum(stat.histogram) == stat.count
+        assert 0 < stat.max_seconds <= stat.seconds
+
+
+def test_unfinished_statements(connection):
+    cursor = connection.cursor()
+    cursor.execute('SELECT n FROM numbers')
+    next(cursor)
+    # Running another statement records the previous one:
+    cursor.execute('SELECT n FROM numbers WHERE n = 1')
+    cursor.close()
+    # Abandoned cursors are recorded when collected:
+    connection.execute('SELECT n FROM numbers WHERE n = 2')
+
+    stats = connection.query_log.stats
+    assert stats['SELECT n FROM numbers'].rows == 1
+    assert stats['SELECT n FROM numbers WHERE n = 1'].rows == 0
+    assert stats['SELECT n FROM numbers WHERE n = 2'].count == 1
+
+
+def test_slow_query(connection, caplog):
+    connection.execute('CREATE INDEX numbers_n ON numbers(n)')
+    connection.query_log.threshold = 0
+
+    with caplog.at_level(logging.WARNING, logger='todoman.querylog'):
+        connection.execute('SELECT n FROM numbers WHERE n = ?', (3,))
+        connection.execute('DROP INDEX numbers_n')
+
+    select, drop = caplog.records
+    assert select.getMessage().startswith('Slow query (')
+    assert "SELECT n FROM numbers WHERE n = ? (3,)" in select.getMessage()
+    assert 'USING COVERING INDEX numbers_n' in select.getMessage()
+    assert drop.getMessage().endswith('rows): DROP INDEX numbers_n')
+
+
+def test_explain_failure(connection):
+    plan = connection.query_log.explain(
+        connection,
+        'SELECT * FROM nonexistent',
+        (),
+    )
+    assert plan == '  (no query plan: no such table: nonexistent)'
+
+
+def test_report(connection, caplog):
+    connection.execute('SELECT n FROM numbers').fetchall()
+
+    report = connection.query_log.report().splitlines()
+    assert report[0].split() == [
+        'calls',
+        'total',
+        'max',
+        'rows',
+        '<0.1ms',
+        '<1ms',
+        '<10ms',
+        '<100ms',
+        '<1000ms',
+        '>1000ms',
+        'statement',
+    ]
+    assert len(report) == 4
+    assert report[-1].split()[0] == '1'
+
+    with caplog.at_level(logging.INFO, logger='todoman.querylog'):
+        connection.query_log.log_report()
+        QueryLog(0).log_report()
+    assert len(caplog.records) == 1
+
+
+def test_database_query_log(tmpdir, create):
+    create('test.ics', 'SUMMARY:harhar\n')
+    query_log = QueryLog(threshold=float('inf'))
+    db = Database(
+        [tmpdir.join('default')],
+        tmpdir.join('cache.sqlite3'),
+        query_log=query_log,
+    )
+
+    assert [todo.summary for todo in db.todos()] == ['harhar']
+    assert db.todo(1).summary == 'harhar'
+    assert any(sql.startswith('INSERT INTO todos') for sql in query_log.stats)
+    assert any(
+        sql.startswith('SELECT todos.*') and stats.rows == 1
+        for sql, stats in query_log.stats.items()
+    )
+
+
+def test_slow_query_threshold_config(config, runner, create):
+    create('test.ics', 'SUMMARY:harhar\n')
+    config.write('slow_query_threshold = 0\n', 'a')
+
+    result = runner.invoke(cli, ['-v', 'INFO', 'list'])
+
+    assert not result.exception
+    assert 'harhar' in result.output
+    assert 'Slow query' in result.output
+    assert 'Cache statements:' in result.output
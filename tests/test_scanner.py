@@ -0,0 +1,148 @@
+import threading
+import time
+
+from todoman.cli import cli
+from todoman.model import Database
+from todoman.scanner import Filesystem, Scanner
+
+
+class SlowFilesystem(Filesystem):
+    """Adds latency to each call, and tracks how many overlap."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def _slow(self, function, *args):
+        with self._lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.latency)
+            return function(*args)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def list_metadata(self, path):
+        return self._slow(super().list_metadata, path)
+
+    def listdir(self, path):
+        return self._slow(super().listdir, path)
+
+    def getmtime(self, path):
+        return self._slow(super().getmtime, path)
+
+    def read(self, path):
+        return self._slow(super().read, path)
+
+
+def _summaries(database):
+    return sorted(
+        (todo.list.name, todo.summary)
+        for todo in database.todos(status=['ANY'])
+    )
+
+
+def _create_todos(create, count):
+    for i in range(count):
+        create(
+            'test{}.ics'.format(i),
+            'SUMMARY:Task {}\n'.format(i),
+            list_name='list{}'.format(i % 2),
+        )
+
+
+def test_scanner_matches_serial(tmpdir, create):
+    _create_todos(create, 20)
+    create('invalid.ics', 'DTSTART:not a date\n', list_name='list0')
+    tmpdir.join('list0').join('README').write('Not a todo')
+    paths = [tmpdir.join('list0'), tmpdir.join('list1')]
+
+    serial = Database(paths, tmpdir.join('serial.sqlite3'))
+    concurrent = Database(
+        paths,
+        tmpdir.join('concurrent.sqlite3'),
+        scan_concurrency=4,
+    )
+
+    assert len(_summaries(concurrent)) == 20
+    assert _summaries(concurrent) == _summaries(serial)
+    assert concurrent.timings.get('scan').count == 21
+    assert concurrent.timings.get('parse').count == 21
+
+
+def test_scanner_bounded_concurrency(tmpdir, create):
+    database = Database(
+        [tmpdir.mkdir('list0'), tmpdir.mkdir('list1')],
+        tmpdir.join('cache.sqlite3'),
+    )
+    _create_todos(create, 40)
+
+    filesystem = SlowFilesystem(0.01)
+    start = time.perf_counter()
+    Scanner(database, concurrency=8, filesystem=filesystem).run()
+    elapsed = time.perf_counter() - start
+
+    # Two lists: metadata and listing, then a stat and read for each file.
+    assert filesystem.calls == 2 + 2 + 40 + 40
+    assert 1 < filesystem.max_in_flight <= 8
+    # Serially, this would take at least 0.84s.
+    assert elapsed < 0.84
+    assert len(_summaries(database)) == 40
+
+
+def test_scanner_only_reads_changed_files(tmpdir, create, sleep):
+    _create_todos(create, 10)
+    database = Database(
+        [tmpdir.join('list0'), tmpdir.join('list1')],
+        tmpdir.join('cache.sqlite3'),
+        scan_concurrency=4,
+    )
+
+    sleep()
+    create('test3.ics', 'SUMMARY:Changed\n', list_name='list1')
+    tmpdir.join('list0').join('test4.ics').remove()
+
+    filesystem = SlowFilesystem(0)
+    Scanner(database, concurrency=4, filesystem=filesystem).run()
+
+    assert filesystem.calls == 2 + 2 + 9 + 1
+    assert ('list1', 'Changed') in _summaries(database)
+    assert ('list0', 'Task 4') not in _summaries(database)
+    assert len(_summaries(database)) == 9
+
+
+def test_scanner_unreadable_file(tmpdir, create, caplog):
+    class BrokenFilesystem(Filesystem):
+        def read(self, path):
+            if path.endswith('test1.ics'):
+                raise OSError('Connection reset')
+            return super().read(path)
+
+    database = Database(
+        [tmpdir.mkdir('list0'), tmpdir.mkdir('list1')],
+        tmpdir.join('cache.sqlite3'),
+    )
+    _create_todos(create, 3)
+    Scanner(database, filesystem=BrokenFilesystem()).run()
+
+    assert len(_summaries(database)) == 2
+    assert 'Failed to read entry' in caplog.text
+    assert [row['parse_error'] for row in database.file_statuses()] == [
+        'OSError: Connection reset',
+    ]
+
+
+def test_scan_concurrency_config(config, runner, create):
+    create('test.ics', 'SUMMARY:harhar\n')
+    config.write('scan_concurrency = 4\n', 'a')
+
+    result = runner.invoke(cli, ['list'])
+
+    assert not result.exception
+    assert 'harhar' in result.output
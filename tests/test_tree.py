@@ -0,0 +1,220 @@
+import sqlite3
+import time
+
+import icalendar
+import pytest
+
+from todoman.cli import cli
+
+
+@pytest.fixture
+def related(create):
+    def inner(name, summary, parent=None, extra='', list_name='default'):
+        content = 'UID:{}\nSUMMARY:{}\n{}'.format(name, summary, extra)
+        if parent:
+            content += 'RELATED-TO:{}\n'.format(parent)
+        return create('{}.ics'.format(name), content, list_name=list_name)
+
+    return inner
+
+
+def _tree(database, **kwargs):
+    return [
+        (todo.summary, depth, progress)
+        for todo, depth, progress in database.tree(**kwargs)
+    ]
+
+
+def test_tree(tmpdir, related, default_database):
+    related('project', 'Project', extra='PRIORITY:1\n')
+    related('design', 'Design', parent='project', extra='PRIORITY:1\n')
+    related('build', 'Build', parent='project', extra='PERCENT-COMPLETE:50\n')
+    related('frame', 'Frame', parent='build', extra='STATUS:COMPLETED\n')
+    related('roof', 'Roof', parent='build', extra='STATUS:CANCELLED\n')
+    related('chores', 'Chores')
+
+    default_database.update_cache()
+
+    # By default, the highest priority todos are listed last.
+    assert _tree(default_database) == [
+        ('Chores', 0, None),
+        ('Project', 0, pytest.approx(100 * 1.5 / 4)),
+        ('Build', 1, 75),
+        ('Design', 1, None),
+    ]
+    assert _tree(default_database, status=['ANY'], sort=['-summary']) == [
+        ('Chores', 0, None),
+        ('Project', 0, pytest.approx(100 * 1.5 / 4)),
+        ('Build', 1, 75),
+        ('Frame', 2, None),
+        ('Roof', 2, None),
+        ('Design', 1, None),
+    ]
+
+
+def test_tree_filtered_parent(related, default_database):
+    related('parent', 'Parent', extra='PRIORITY:9\n')
+    related('child', 'Child', parent='parent', extra='PRIORITY:1\n')
+
+    default_database.update_cache()
+
+    assert _tree(default_database, priority=4) == [('Child', 0, None)]
+
+
+def test_tree_other_list_and_unknown_parents(related, tmpdir):
+    from todoman.model import Database
+
+    related('parent', 'Parent')
+    related('child', 'Child', parent='parent', list_name='other')
+    related('orphan', 'Orphan', parent='missing')
+    database = Database(
+        [tmpdir.join('default'), tmpdir.join('other')],
+        tmpdir.join('cache.sqlite3'),
+    )
+
+    assert sorted(_tree(database)) == [
+        ('Child', 0, None),
+        ('Orphan', 0, None),
+        ('Parent', 0, None),
+    ]
+
+
+def test_tree_cycles(related, default_database):
+    related('a', 'A', parent='c')
+    related('b', 'B', parent='a')
+    related('c', 'C', parent='b')
+    related('d', 'D', parent='c')
+    related('self', 'Self', parent='self')
+
+    default_database.update_cache()
+
+    assert sorted(_tree(default_database)) == [
+        ('A', 0, 0),
+        ('B', 0, 0),
+        ('C', 0, 0),
+        ('D', 0, None),
+        ('Self', 0, None),
+    ]
+
+
+def test_tree_reltype(related, default_database):
+    related('parent', 'Parent')
+    related(
+        'sibling',
+        'Sibling',
+        extra='RELATED-TO;RELTYPE=SIBLING:parent\n',
+    )
+    related(
+        'child',
+        'Child',
+        extra='RELATED-TO;RELTYPE=parent:parent\n',
+    )
+
+    default_database.update_cache()
+
+    assert _tree(default_database, sort=['-summary']) == [
+        ('Parent', 0, 0),
+        ('Child', 1, None),
+        ('Sibling', 0, None),
+    ]
+
+
+def test_tree_relations_expire(related, default_database, sleep):
+    related('parent', 'Parent')
+    related('child', 'Child', parent='parent')
+    default_database.update_cache()
+
+    sleep()
+    related('child', 'Child')
+    default_database.update_cache()
+
+    assert default_database.cache._conn.execute(
+        'SELECT COUNT(*) FROM related_to'
+    ).fetchone()[0] == 0
+    assert len(_tree(default_database)) == 2
+
+
+def test_tree_without_window_functions(related, default_database):
+    """Window functions need SQLite 3.25, so trees are built without them."""
+    related('parent', 'Parent')
+    related('child', 'Child', parent='parent')
+    default_database.update_cache()
+
+    functions = set()
+
+    def authorizer(action, arg1, arg2, *args):
+        if action == sqlite3.SQLITE_FUNCTION:
+            functions.add(arg2.lower())
+        return sqlite3.SQLITE_OK
+
+    default_database.cache._conn.set_authorizer(authorizer)
+    assert _tree(default_database) == [('Parent', 0, 0), ('Child', 1, None)]
+    assert 'avg' in functions
+    assert not functions & {'row_number', 'rank', 'dense_rank'}
+
+
+def test_large_tree(default_database):
+    cache = default_database.cache
+    path = str(default_database.paths[0])
+    cache.add_list('default', path, None, 0)
+
+    # 10 projects, each with 20 tasks, each with 19 subtasks.
+    for project in range(10):
+        ids = ['p{}'.format(project)]
+        for task in range(20):
+            ids.append('p{}t{}'.format(project, task))
+            ids.extend(
+                'p{}t{}s{}'.format(project, task, subtask)
+                for subtask in range(19)
+            )
+
+        for uid in ids:
+            vtodo = icalendar.Todo()
+            vtodo.add('uid', uid)
+            vtodo.add('summary', uid)
+            if 's' in uid:
+                vtodo.add('related-to', uid.rsplit('s', 1)[0])
+                vtodo.add('status', 'COMPLETED')
+            elif 't' in uid:
+                vtodo.add('related-to', uid.rsplit('t', 1)[0])
+            file_path = '{}/{}.ics'.format(path, uid)
+            cache.add_file('default', file_path, 0)
+            cache.add_vtodo(vtodo, file_path)
+
+    start = time.perf_counter()
+    nodes = _tree(default_database, status=['ANY'], sort=['-summary'])
+    elapsed = time.perf_counter() - start
+
+    assert len(nodes) == 4010
+    assert elapsed < 2
+    assert nodes[:3] == [
+        ('p0', 0, pytest.approx(100 * 380 / 401)),
+        ('p0t0', 1, 95),
+        ('p0t0s0', 2, None),
+    ]
+    assert nodes[21] == ('p0t1', 1, 95)
+    assert nodes[401] == ('p1', 0, pytest.approx(100 * 380 / 401))
+
+
+def test_list_tree(tmpdir, runner, related):
+    related('project', 'Project', extra='PRIORITY:1\n')
+    related('design', 'Design', parent='project', extra='PRIORITY:1\n')
+    related('frame', 'Frame', parent='design', extra='PERCENT-COMPLETE:50\n')
+    related('chores', 'Chores')
+
+    result = runner.invoke(cli, ['list', '--tree'])
+    assert not result.exception
+    lines = [
+        line.split(']', 1)[1].strip() for line in result.output.splitlines()
+    ]
+    assert lines == [
+        'Chores @default',
+        '!!!    Project @default (17%)',
+        '!!!    └ Design @default (25%)',
+        '· └ Frame @default (50%)',
+    ]
+
+    result = runner.invoke(cli, ['--porcelain', 'list', '--tree'])
+    assert not result.exception
+    assert '"depth": 2' in result.output
+    assert '"progress": 25.0' in result.output
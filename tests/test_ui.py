@@ -1,4 +1,4 @@
-from datetime import datetime
+from datetime import date, datetime
 from unittest import mock
 
 import pytest
@@ -6,7 +6,7 @@ import pytz
 from freezegun import freeze_time
 from urwid import ExitMainLoop
 
-from todoman.interactive import TodoEditor
+from todoman.interactive import TodoBrowser, TodoEditor, TodoWalker
 
 
 def test_todo_editor_priority(
@@ -160,3 +160,286 @@ def test_ctrl_c_clears(default_formatter, todo_factory):
         editor.edit()
 
     assert mocked_stop.call_count == 1
+
+
+def _browser(database, formatter, **filters):
+    filters.setdefault('lists', ())
+    return TodoBrowser(database, formatter, filters)
+
+
+def test_todo_walker_pages_lazily(default_database, todo_factory):
+    for i in range(25):
+        todo_factory(summary='Task {:02}'.format(i), priority=i % 10)
+
+    rows = []
+    walker = TodoWalker(
+        default_database,
+        {'sort': ['-summary']},
+        lambda todo: rows.append(todo) or todo.summary,
+        page_size=10,
+        cached_pages=2,
+    )
+    assert walker.count == 25
+    assert walker._pages == {}
+    assert rows == []
+
+    assert walker[12] == 'Task 12'
+    assert list(walker._pages) == [1]
+    assert len(rows) == 1
+
+    # Rows are only rendered once.
+    assert walker[12] == 'Task 12'
+    assert len(rows) == 1
+
+    assert walker.todo(24).summary == 'Task 24'
+    assert walker.todo(0).summary == 'Task 00'
+    assert list(walker._pages) == [2, 0]
+
+    summaries = []
+    position = 0
+    while True:
+        summaries.append(walker.todo(position).summary)
+        try:
+            position = walker.next_position(position)
+        except IndexError:
+            break
+    assert summaries == ['Task {:02}'.format(i) for i in range(25)]
+
+    with pytest.raises(IndexError):
+        walker.prev_position(0)
+    with pytest.raises(IndexError):
+        walker[25]
+    assert walker.prev_position(3) == 2
+    assert list(walker.positions(reverse=True))[0] == 24
+    assert list(walker.positions()) == list(range(25))
+
+
+def test_todo_walker_empty(default_database):
+    walker = TodoWalker(default_database, {}, str)
+
+    assert walker.count == 0
+    assert walker.focused_todo is None
+    assert walker.get_focus() == (None, None)
+
+
+def test_todo_walker_deleted_since_counted(default_database, todo_factory):
+    todo = todo_factory()
+    walker = TodoWalker(default_database, {}, str)
+    default_database.delete(todo)
+
+    assert walker.count == 1
+    with pytest.raises(IndexError):
+        walker[0]
+
+
+def test_todo_browser_filter(
+    default_database, todo_factory, default_formatter
+):
+    todo_factory(summary='Buy milk')
+    todo_factory(summary='Buy bread')
+    todo_factory(summary='Walk the dog')
+    browser = _browser(default_database, default_formatter)
+    assert browser.walker.count == 3
+    assert browser._status.text == '3 tasks. Press F1 for help.'
+
+    browser._keypress('/')
+    assert browser._ui.focus_position == 'header'
+    browser._filter.set_edit_text('buy')
+    assert browser.walker.count == 2
+    assert browser._status.text == '2 tasks. Press F1 for help.'
+
+    # Keys are typed into the filter, rather than acting on todos.
+    browser._keypress('d')
+    assert browser.walker.todo(0).is_completed is False
+
+    browser._keypress('enter')
+    assert browser._ui.focus_position == 'body'
+
+
+def test_todo_browser_filter_debounced(
+    default_database, todo_factory, default_formatter
+):
+    todo_factory(summary='Buy milk')
+    todo_factory(summary='Walk the dog')
+    browser = _browser(default_database, default_formatter)
+    browser._loop = mock.MagicMock()
+
+    browser._filter.set_edit_text('b')
+    browser._filter.set_edit_text('bu')
+    assert browser._loop.set_alarm_in.call_count == 2
+    assert browser._loop.remove_alarm.call_count == 1
+    assert browser.walker.count == 2
+
+    callback = browser._loop.set_alarm_in.call_args[0][1]
+    callback(browser._loop, None)
+    assert browser.walker.count == 1
+
+
+def test_todo_browser_initial_grep(
+    default_database, todo_factory, default_formatter
+):
+    todo_factory(summary='Buy milk')
+    todo_factory(summary='Walk the dog')
+    browser = _browser(default_database, default_formatter, grep='dog')
+
+    assert browser._filter.edit_text == 'dog'
+    assert browser.walker.count == 1
+
+
+def test_todo_browser_done(default_database, todo_factory, default_formatter):
+    todo = todo_factory(summary='Buy milk')
+    todo_factory(summary='Walk the dog')
+    browser = _browser(
+        default_database,
+        default_formatter,
+        sort=['-summary'],
+        status=['ANY'],
+    )
+
+    browser._keypress('d')
+    assert default_database.todo(todo.id).is_completed
+    assert default_database.todo(todo.id).percent_complete == 100
+    assert browser.walker.todo(0).is_completed
+
+    browser._keypress('d')
+    todo = default_database.todo(todo.id)
+    assert not todo.is_completed
+    assert todo.completed_at is None
+    assert todo.percent_complete == 0
+    assert browser.walker.todo(0).percent_complete == 0
+
+
+def test_todo_browser_done_hides(
+    default_database, todo_factory, default_formatter
+):
+    todo_factory(summary='Buy milk')
+    browser = _browser(default_database, default_formatter)
+
+    browser._keypress('d')
+    assert browser.walker.count == 0
+
+    # Nothing to act on.
+    browser._keypress('d')
+    assert browser.walker.count == 0
+
+
+def test_todo_browser_cancel(
+    default_database, todo_factory, default_formatter
+):
+    todo = todo_factory()
+    browser = _browser(default_database, default_formatter, status=['ANY'])
+
+    browser._keypress('c')
+    assert default_database.todo(todo.id).status == 'CANCELLED'
+
+
+@pytest.mark.parametrize('key,before,after', [
+    ('+', 0, 9),
+    ('+', 9, 5),
+    ('+', 5, 1),
+    ('+', 1, 1),
+    ('-', 1, 5),
+    ('-', 0, 0),
+])
+def test_todo_browser_priority(
+    default_database, todo_factory, default_formatter, key, before, after
+):
+    todo = todo_factory(priority=before)
+    browser = _browser(default_database, default_formatter)
+
+    browser._keypress(key)
+    assert default_database.todo(todo.id).priority == after
+
+
+def test_todo_browser_read_only(
+    default_database, todo_factory, default_formatter, tmpdir
+):
+    todo = todo_factory()
+    path = tmpdir.join('default').join(todo.filename)
+    path.write(path.read().replace(
+        'END:VCALENDAR',
+        'BEGIN:VTODO\r\nUID:other\r\nSUMMARY:Other\r\nEND:VTODO\r\n'
+        'END:VCALENDAR',
+    ))
+    default_database.update_cache()
+    browser = _browser(default_database, default_formatter)
+
+    browser._keypress('d')
+    assert 'read-only' in browser._status.text
+    assert browser._status.get_text()[1][0][0] == 'error'
+
+
+def test_todo_browser_rows(default_database, todo_factory, default_formatter):
+    todo_factory(
+        summary='Overdue',
+        priority=1,
+        due=datetime(2000, 1, 1, tzinfo=pytz.UTC),
+    )
+    browser = _browser(default_database, default_formatter)
+    text, attributes = browser.walker[0].original_widget.get_text()
+
+    assert text.startswith('[ ] !!! 2000-01-01 ')
+    assert text.endswith('Overdue @default')
+    assert ('error', len('2000-01-01 00:00')) in attributes
+
+    browser.hide_list = True
+    browser.walker.reload()
+    text, _ = browser.walker[0].original_widget.get_text()
+    assert text.endswith('Overdue')
+
+
+def test_todo_browser_rows_dates(
+    default_database, todo_factory, default_formatter
+):
+    todo_factory(summary='Later', due=date(2100, 1, 1))
+    browser = _browser(default_database, default_formatter)
+    text, attributes = browser.walker[0].original_widget.get_text()
+
+    assert text.startswith('[ ]     2100-01-01       Later')
+    assert not any(attribute == 'error' for attribute, _ in attributes)
+
+
+def test_todo_browser_navigation(
+    default_database, todo_factory, default_formatter
+):
+    for i in range(5):
+        todo_factory(summary='Task {}'.format(i))
+    browser = _browser(default_database, default_formatter, sort=['-summary'])
+    size = (80, 4)
+    browser._ui.render(size, focus=True)
+
+    assert browser._ui.keypress(size, 'down') is None
+    assert browser.walker.focused_todo.summary == 'Task 1'
+    assert browser._ui.keypress(size, 'd') == 'd'
+
+    browser._keypress('end')
+    browser._ui.render(size, focus=True)
+    assert browser.walker.focused_todo.summary == 'Task 4'
+    browser._keypress('home')
+    assert browser.walker.focused_todo.summary == 'Task 0'
+
+
+def test_todo_browser_keys(default_database, todo_factory, default_formatter):
+    browser = _browser(default_database, default_formatter)
+
+    browser._keypress('f1')
+    assert browser._ui.footer is browser._help_text
+    browser._keypress('f1')
+    assert browser._ui.footer is browser._status
+
+    with pytest.raises(ExitMainLoop):
+        browser._keypress('q')
+
+
+def test_todo_browser_run(default_formatter, default_database):
+    browser = _browser(default_database, default_formatter)
+
+    with mock.patch(
+        'urwid.main_loop.MainLoop.run', side_effect=KeyboardInterrupt
+    ), mock.patch(
+        'urwid.main_loop.MainLoop.stop',
+    ) as mocked_stop:
+        browser.browse()
+
+    assert mocked_stop.call_count == 1
+    assert browser._loop is None
@@ -0,0 +1,208 @@
+import random
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import pytest
+import pytz
+
+from todoman.cli import cli
+from todoman.expressions import parse
+from todoman.model import Cache, Database, Todo
+
+VIEWS = {
+    'important': ('priority >= medium', ['NEEDS-ACTION', 'IN-PROCESS']),
+    'work_soon': ('list = work and due < "in 3 days"', ['NEEDS-ACTION']),
+    'errands': ('categories = errands or summary ~ milk', ['ANY']),
+    'finished': ('not status in (needs-action, "in-process")', ['ANY']),
+}
+
+
+@pytest.fixture
+def database(tmpdir):
+    return Database(
+        [tmpdir.mkdir('work'), tmpdir.mkdir('home')],
+        tmpdir.join('cache.sqlite3'),
+    )
+
+
+def _ids(todos):
+    return sorted(todo.id for todo in todos)
+
+
+def _define_views(database, formatter):
+    views = {}
+    for name, (text, status) in VIEWS.items():
+        views[name] = parse(text, formatter), status
+        database.define_view(name, where=views[name][0], status=status)
+    return views
+
+
+def _check_views(database, views):
+    for name, (where, status) in views.items():
+        materialized = _ids(database.todos(view=name, status=['ANY']))
+        evaluated = _ids(database.todos(where=where, status=status))
+        assert materialized == evaluated, name
+
+
+def _random_todo(rng, todo):
+    now = datetime.now(pytz.UTC)
+    todo.summary = rng.choice(['Buy milk', 'Write report', 'Call mum'])
+    todo.priority = rng.choice([0, 1, 5, 9])
+    todo.status = rng.choice(Todo.VALID_STATUSES)
+    todo.categories = rng.sample(
+        ['errands', 'home', 'work'],
+        rng.randint(0, 2),
+    )
+    todo.due = rng.choice([None, now - timedelta(days=1), now + timedelta(
+        days=rng.randint(0, 6)
+    )])
+    return todo
+
+
+def test_views_consistent(database, default_formatter, create):
+    rng = random.Random(4)
+    views = _define_views(database, default_formatter)
+    lists = {todo_list.name: todo_list for todo_list in database.lists()}
+
+    for step in range(150):
+        todos = [todo for todo in database.todos(status=['ANY'])]
+        action = rng.choice(['new', 'new', 'edit', 'move', 'delete', 'sync'])
+
+        if action == 'new' or not todos:
+            todo = Todo(new=True, list=lists[rng.choice(sorted(lists))])
+            database.save(_random_todo(rng, todo))
+        elif action == 'edit':
+            todo = database.todo(rng.choice(todos).id)
+            database.save(_random_todo(rng, todo))
+        elif action == 'move':
+            todo = rng.choice(todos)
+            other = 'home' if todo.list.name == 'work' else 'work'
+            database.move(todo, lists[other])
+        elif action == 'delete':
+            database.delete(rng.choice(todos))
+        else:
+            # Changes made by something else, and picked up by a rescan.
+            create(
+                'synced{}.ics'.format(step),
+                'SUMMARY:Buy milk\nPRIORITY:{}\n'.format(rng.randint(0, 9)),
+                list_name=rng.choice(sorted(lists)),
+            )
+            database.update_cache()
+
+        _check_views(database, views)
+
+    assert all(
+        len(_ids(database.todos(view=name, status=['ANY'])))
+        for name in views
+    )
+
+
+def test_views_persist(database, default_formatter, tmpdir):
+    views = _define_views(database, default_formatter)
+
+    # A new instance (eg: the next run) keeps maintaining the views.
+    database = Database(
+        [tmpdir.join('work'), tmpdir.join('home')],
+        tmpdir.join('cache.sqlite3'),
+    )
+    todo = Todo(new=True, list=next(database.lists()))
+    todo.summary = 'Buy milk'
+    database.save(todo)
+
+    assert _ids(database.todos(view='errands', status=['ANY'])) == [todo.id]
+    _check_views(database, views)
+
+
+def test_define_view(database, default_formatter):
+    where = parse('priority = high', default_formatter)
+    todo = Todo(new=True, list=next(database.lists()))
+    todo.priority = 1
+    database.save(todo)
+
+    assert database.cache.define_view('high', where=where)
+    assert not database.cache.define_view('high', where=where)
+    assert _ids(database.todos(view='high')) == [todo.id]
+
+    where = parse('priority = low', default_formatter)
+    assert database.cache.define_view('high', where=where)
+    assert _ids(database.todos(view='high')) == []
+
+    database.define_view('other', where=where)
+    assert database.timings.get('views').count == 1
+
+    assert database.cache.drop_views(keep=['other'])
+    assert not database.cache.drop_views(keep=['other', 'unknown'])
+    assert database.cache.define_view('high', where=where)
+    assert not database.cache.define_view('other', where=where)
+
+    database.drop_views()
+    assert not database.cache.drop_views()
+    assert database.cache._conn.execute(
+        'SELECT COUNT(*) FROM view_todos'
+    ).fetchone()[0] == 0
+
+
+def test_view_command(config, runner, create):
+    create('one.ics', 'SUMMARY:haha\nPRIORITY:1\n')
+    create('two.ics', 'SUMMARY:hoho\nPRIORITY:9\n')
+    create('three.ics', 'SUMMARY:hehe\nPRIORITY:1\nSTATUS:COMPLETED\n')
+    config.write(
+        '[views]\n'
+        '[[urgent]]\n'
+        'where = priority = high\n'
+        '[[cached]]\n'
+        'where = priority = high\n'
+        'status = any\n'
+        'materialize = True\n',
+        'a',
+    )
+
+    result = runner.invoke(cli, ['view', 'urgent'])
+    assert not result.exception
+    assert 'haha' in result.output
+    assert 'hoho' not in result.output
+    assert 'hehe' not in result.output
+
+    for _ in range(2):
+        result = runner.invoke(cli, ['view', 'cached'])
+        assert not result.exception
+        assert 'haha' in result.output
+        assert 'hoho' not in result.output
+        assert 'hehe' in result.output
+
+    # Showing a view which is up to date doesn't write to the cache.
+    changes = []
+
+    def record(method):
+        def wrapper(*args, **kwargs):
+            changes.append(method(*args, **kwargs))
+            return changes[-1]
+        return wrapper
+
+    with patch.object(Cache, 'drop_views', record(Cache.drop_views)), \
+            patch.object(Cache, 'define_view', record(Cache.define_view)):
+        result = runner.invoke(cli, ['view', 'cached'])
+    assert 'haha' in result.output
+    assert changes == [False, False]
+
+    create('four.ics', 'SUMMARY:huhu\nPRIORITY:2\n')
+    result = runner.invoke(cli, ['view', 'cached'])
+    assert 'huhu' in result.output
+
+
+def test_view_command_errors(config, runner):
+    result = runner.invoke(cli, ['view', 'urgent'])
+    assert result.exception
+    assert 'Unknown view "urgent", views are defined in the [views]' in \
+        result.output
+
+    config.write('[views]\n[[urgent]]\nwhere = priority = \n', 'a')
+
+    result = runner.invoke(cli, ['view', 'other'])
+    assert result.exception
+    assert 'configuration file (urgent)' in result.output
+
+    result = runner.invoke(cli, ['view', 'urgent'])
+    assert result.exception
+    assert 'Bad where setting for view "urgent": Expected a value' in \
+        result.output
@@ -1,4 +1,18 @@
-from todoman.cli import cli
+import sys
+
+
+def main(**kwargs):
+    # Shell completion runs on every TAB, so it skips loading the CLI (and
+    # refreshing the cache) altogether.
+    if sys.argv[1:2] == ['_complete']:
+        from todoman.completion import main as complete
+
+        sys.exit(complete(sys.argv[2:]))
+
+    from todoman.cli import cli
+
+    cli(**kwargs)
+
 
 if __name__ == '__main__':
-    cli(auto_envvar_prefix='TODOMAN')
+    main(auto_envvar_prefix='TODOMAN')
@@ -1,9 +1,11 @@
 import functools
 import glob
+import importlib.util
 import locale
+import os
 import sys
 from contextlib import contextmanager
-from datetime import timedelta
+from datetime import datetime, time, timedelta
 from os.path import expanduser, isdir
 
 import click
@@ -11,8 +13,16 @@ import click_log
 
 from todoman import exceptions, formatters
 from todoman.configuration import ConfigurationException, load_config
-from todoman.interactive import TodoEditor
-from todoman.model import cached_property, Database, Todo
+from todoman.durability import BATCH, DURABILITY_MODES
+from todoman.model import (
+    cached_property,
+    Database,
+    FILE_ERROR,
+    FILE_NO_VTODO,
+    LOCAL_TIMEZONE,
+    Todo,
+)
+from todoman.timings import Timings
 
 
 click_log.basic_config()
@@ -37,6 +47,10 @@ def catch_errors(f):
 
 
 TODO_ID_MIN = 1
+
+# Commands which never modify todos, and may use a stale cache (see the
+# cache_ttl setting).
+READ_ONLY_COMMANDS = ('agenda', 'export', 'list', 'show', 'view')
 with_id_arg = click.argument('id', type=click.IntRange(min=TODO_ID_MIN))
 
 
@@ -107,6 +121,19 @@ def _validate_start_date_param(ctx, param, val):
         raise click.BadParameter(e)
 
 
+def _validate_where_param(ctx, param, val):
+    ctx = ctx.find_object(AppContext)
+    if not val:
+        return None
+
+    from todoman.expressions import ExpressionError, parse
+
+    try:
+        return parse(val, ctx.formatter)
+    except ExpressionError as e:
+        raise click.BadParameter(e)
+
+
 def _validate_startable_param(ctx, param, val):
     ctx = ctx.find_object(AppContext)
     return val or ctx.config['main']['startable']
@@ -197,6 +224,20 @@ class AppContext:
         self.config = None
         self.db = None
         self.formatter_class = None
+        self.profiler = None
+        self.timings = Timings()
+
+    def refresh(self):
+        """
+        Prepares a context for running another command, within the REPL.
+
+        The database (along with its connection, and the statements it has
+        prepared) and formatters are kept, and only brought up to date.
+        """
+        self.db.refresh()
+        for name in ('formatter', 'ui_formatter'):
+            if name in self.__dict__:
+                self.__dict__[name].update_now()
 
     @cached_property
     def ui_formatter(self):
@@ -217,6 +258,15 @@ class AppContext:
 
 pass_ctx = click.make_pass_decorator(AppContext)
 
+_durability_option = click.option(
+    '--durability',
+    type=click.Choice(DURABILITY_MODES),
+    help=(
+        'How to sync changed tasks to disk: one by one (full), all at once '
+        '(batch), or not at all (none). Defaults to the durability setting.'
+    )
+)
+
 _interactive_option = click.option(
     '--interactive',
     '-i',
@@ -262,13 +312,49 @@ _interactive_option = click.option(
     envvar='TODOMAN_CONFIG',
     metavar='PATH',
 )
+@click.option(
+    '--profile',
+    is_flag=True,
+    allow_from_autoenv=False,
+    help='Profile this run, and print the hot spots to stderr.'
+)
+@click.option(
+    '--profile-output',
+    default=None,
+    envvar='TODOMAN_PROFILE',
+    metavar='PATH',
+    help=(
+        'Where to write profiling data, implies --profile. A pstats dump is '
+        'written, or collapsed stacks (for flame graphs) if PATH ends with '
+        '.folded or .collapsed. Defaults to todoman.prof.'
+    )
+)
+@click.option(
+    '--timings',
+    is_flag=True,
+    help=(
+        'Print how long each phase of this run took to stderr (as JSON if '
+        'used with --porcelain).'
+    )
+)
 @click.pass_context
 @click.version_option(prog_name='todoman')
 @catch_errors
-def cli(click_ctx, colour, porcelain, humanize, config):
+def cli(
+    click_ctx, colour, porcelain, humanize, config, profile, profile_output,
+    timings
+):
     ctx = click_ctx.ensure_object(AppContext)
+    if (profile or profile_output) and not ctx.profiler:
+        _start_profiling(click_ctx, profile_output or 'todoman.prof')
+    if timings:
+        click_ctx.call_on_close(
+            functools.partial(_print_timings, ctx.timings, porcelain)
+        )
+
     try:
-        ctx.config = load_config(config)
+        with ctx.timings.phase('config'):
+            ctx.config = load_config(config)
     except ConfigurationException as e:
         raise click.ClickException(e.args[0])
 
@@ -294,14 +380,45 @@ def cli(click_ctx, colour, porcelain, humanize, config):
     elif colour == 'never':
         click_ctx.color = False
 
-    paths = [
-        path for path in glob.iglob(expanduser(ctx.config["main"]["path"]))
-        if isdir(path)
-    ]
+    with ctx.timings.phase('glob') as phase:
+        paths = [
+            path
+            for path in glob.iglob(expanduser(ctx.config["main"]["path"]))
+            if isdir(path)
+        ]
+        phase.count += len(paths)
     if len(paths) == 0:
         raise exceptions.NoListsFound(ctx.config["main"]["path"])
 
-    ctx.db = Database(paths, ctx.config['main']['cache_path'])
+    # Within the REPL, this callback runs again for each command. The
+    # database is reused, unless its cache was dropped (eg: by flush).
+    if ctx.db and ctx.db.cache and ctx.db.paths == paths and \
+            ctx.db.cache.cache_path == ctx.config['main']['cache_path']:
+        ctx.refresh()
+    else:
+        query_log = None
+        threshold = ctx.config['main']['slow_query_threshold']
+        if threshold is not None:
+            from todoman.querylog import QueryLog
+
+            query_log = QueryLog(threshold / 1000)
+            click_ctx.call_on_close(query_log.log_report)
+
+        command = click_ctx.invoked_subcommand or \
+            ctx.config['main']['default_command'].split(' ')[0]
+        max_age = 0
+        if command in READ_ONLY_COMMANDS:
+            max_age = ctx.config['main']['cache_ttl']
+
+        ctx.db = Database(
+            paths,
+            ctx.config['main']['cache_path'],
+            ctx.timings,
+            query_log,
+            ctx.config['main']['scan_concurrency'],
+            max_age,
+            ctx.config['main']['durability'],
+        )
 
     # Make python actually use LC_TIME, or the user's locale settings
     locale.setlocale(locale.LC_TIME, "")
@@ -313,6 +430,28 @@ def cli(click_ctx, colour, porcelain, humanize, config):
         )
 
 
+def _start_profiling(click_ctx, path):
+    # Within the REPL, this callback runs again for each command. Profiling
+    # started by the outer invocation then covers all of those.
+    from todoman import profiling
+
+    ctx = click_ctx.find_object(AppContext)
+    ctx.profiler = profiling.start()
+
+    def stop():
+        profiling.stop(ctx.profiler, path)
+        ctx.profiler = None
+
+    click_ctx.call_on_close(stop)
+
+
+def _print_timings(timings, porcelain):
+    if porcelain:
+        click.echo(timings.format_json(), err=True)
+    else:
+        click.echo(timings.format(), err=True)
+
+
 def invoke_command(click_ctx, command):
     name, *args = command.split(' ')
     if name not in cli.commands:
@@ -322,12 +461,17 @@ def invoke_command(click_ctx, command):
     click_ctx.invoke(cli.commands[command], args)
 
 
-try:  # pragma: no cover
-    import click_repl
-    click_repl.register_repl(cli)
-    click_repl.register_repl(cli, name="shell")
-except ImportError:
-    pass
+if importlib.util.find_spec('click_repl'):  # pragma: no cover
+    # click_repl pulls in prompt_toolkit, so only import it when the shell is
+    # actually started.
+    @click.pass_context
+    def _repl(click_ctx):
+        """Start an interactive shell. All subcommands are available in it."""
+        import click_repl
+        click_repl.repl(click_ctx)
+
+    cli.command(name='repl')(_repl)
+    cli.command(name='shell')(_repl)
 
 
 @cli.command()
@@ -373,6 +517,8 @@ def new(ctx, summary, list, todo_properties, read_description, interactive):
         todo.description = '\n'.join(sys.stdin)
 
     if interactive or (not summary and interactive is None):
+        from todoman.interactive import TodoEditor
+
         ui = TodoEditor(todo, ctx.db.lists(), ctx.ui_formatter)
         ui.edit()
         click.echo()  # work around lines going missing after urwid
@@ -415,6 +561,8 @@ def edit(ctx, id, todo_properties, interactive, raw):
             setattr(todo, key, value)
 
     if interactive or (not changes and interactive is None):
+        from todoman.interactive import TodoEditor
+
         ui = TodoEditor(todo, ctx.db.lists(), ctx.ui_formatter)
         ui.edit()
 
@@ -436,7 +584,8 @@ def show(ctx, id):
     Show details about a task.
     '''
     todo = ctx.db.todo(id, read_only=True)
-    click.echo(ctx.formatter.detailed(todo))
+    with ctx.timings.phase('render', 1):
+        click.echo(ctx.formatter.detailed(todo))
 
 
 @cli.command()
@@ -444,16 +593,38 @@ def show(ctx, id):
 @click.argument(
     'todos',
     nargs=-1,
-    required=True,
     type=click.IntRange(0),
     callback=_validate_todos,
 )
+@click.option(
+    '--catch-up',
+    is_flag=True,
+    help=(
+        'For recurring tasks, skip any occurrences that have already passed. '
+        'If no tasks are given, catch up on all overdue recurring tasks.'
+    )
+)
+@_durability_option
 @catch_errors
-def done(ctx, todos):
+def done(ctx, todos, catch_up, durability):
     """Mark one or more tasks as done."""
+    if not todos:
+        if not catch_up:
+            raise click.UsageError('No tasks specified')
+        todos = []
+        for todo in ctx.db.todos(overdue=True, recurring=True):
+            # Todos sharing a file with others are read-only, as they are
+            # when given by id.
+            try:
+                todos.append(ctx.db.todo(todo.id))
+            except exceptions.ReadOnlyTodo as e:
+                click.echo('Skipping {}: {}'.format(todo.summary, e), err=True)
+
+    for todo in todos:
+        todo.complete(catch_up=catch_up)
+    ctx.db.save_all(todos, durability)
+
     for todo in todos:
-        todo.complete()
-        ctx.db.save(todo)
         click.echo(ctx.formatter.detailed(todo))
 
 
@@ -466,12 +637,15 @@ def done(ctx, todos):
     type=click.IntRange(0),
     callback=_validate_todos,
 )
+@_durability_option
 @catch_errors
-def cancel(ctx, todos):
+def cancel(ctx, todos, durability):
     """Cancel one or more tasks."""
     for todo in todos:
         todo.cancel()
-        ctx.db.save(todo)
+    ctx.db.save_all(todos, durability)
+
+    for todo in todos:
         click.echo(ctx.formatter.detailed(todo))
 
 
@@ -490,6 +664,33 @@ def flush(ctx):
         click.echo(ctx.formatter.simple_action('Flushing', todo))
 
 
+@cli.group()
+def cache():
+    '''
+    Inspect the cache.
+    '''
+
+
+@cache.command()
+@pass_ctx
+@click.option(
+    '--all',
+    'all_',
+    is_flag=True,
+    help='Also list files without any tasks (eg: with only events).'
+)
+@catch_errors
+def errors(ctx, all_):
+    '''
+    List files which couldn't be read, and why.
+
+    Files are only read again once they change, so fixed files are no longer
+    listed afterwards.
+    '''
+    statuses = [FILE_ERROR, FILE_NO_VTODO] if all_ else [FILE_ERROR]
+    click.echo(ctx.formatter.file_statuses(ctx.db.file_statuses(statuses)))
+
+
 @cli.command()
 @pass_ctx
 @click.argument('ids', nargs=-1, required=True, type=click.IntRange(0))
@@ -515,7 +716,7 @@ def delete(ctx, ids, yes):
 
     for todo in todos:
         click.echo(ctx.formatter.simple_action('Deleting', todo))
-        ctx.db.delete(todo)
+    ctx.db.delete_all(todos)
 
 
 @cli.command()
@@ -527,16 +728,19 @@ def delete(ctx, ids, yes):
     help='The list to copy the tasks to.'
 )
 @click.argument('ids', nargs=-1, required=True, type=click.IntRange(0))
+@_durability_option
 @catch_errors
-def copy(ctx, list, ids):
+def copy(ctx, list, ids, durability):
     '''Copy tasks to another list.'''
 
+    todos = []
     for id in ids:
         original = ctx.db.todo(id)
         todo = original.clone()
         todo.list = list
         click.echo(ctx.formatter.compact(todo))
-        ctx.db.save(todo)
+        todos.append(todo)
+    ctx.db.save_all(todos, durability)
 
 
 @cli.command()
@@ -552,76 +756,189 @@ def copy(ctx, list, ids):
 def move(ctx, list, ids):
     '''Move tasks to another list.'''
 
+    todos = []
     for id in ids:
         todo = ctx.db.todo(id)
         click.echo(ctx.formatter.compact(todo))
-        ctx.db.move(todo, list)
+        todos.append(todo)
+    ctx.db.move_all(todos, list)
 
 
-@cli.command()
+@contextmanager
+def _import_progress(source):
+    """
+    Yields a callback to report how much of ``source`` has been read, or
+    ``None`` if its size is unknown.
+    """
+    try:
+        size = os.fstat(source.fileno()).st_size
+    except (OSError, ValueError):
+        size = 0
+
+    if not size:
+        yield None
+        return
+
+    with click.progressbar(
+        length=size,
+        label='Importing',
+        file=click.get_text_stream('stderr'),
+    ) as bar:
+        yield lambda position: bar.update(position - bar.pos)
+
+
+@cli.command(name='import')
 @pass_ctx
-@click.argument('lists', nargs=-1, callback=_validate_lists_param)
-@click.option('--location', help='Only show tasks with location containg TEXT')
-@click.option('--category', help='Only show tasks with category containg TEXT')
-@click.option('--grep', help='Only show tasks with message containg TEXT')
+@click.argument('source', type=click.File('rb'))
 @click.option(
-    '--sort',
-    help=(
-          'Sort tasks using fields like : '
-          '"start", "due", "priority", "created_at", "percent_complete" etc.'
-          '\nFor all fields please refer to: '
-          '<https://todoman.readthedocs.io/en/stable/usage.html> '
-          ),
-    callback=_sort_callback,
-)
-@click.option(
-    '--reverse/--no-reverse',
-    default=True,
-    help='Sort tasks in reverse order (see --sort). '
-    'Defaults to true.'
-)
-@click.option(
-    '--due',
-    default=None,
-    help='Only show tasks due in INTEGER '
-    'hours',
-    type=int
+    '--list',
+    '-l',
+    callback=_validate_list_param,
+    help='The list to import the tasks into.'
 )
 @click.option(
-    '--priority',
-    default=None,
-    help='Only show tasks with'
-    ' priority at least as high as TEXT (low, medium or high).',
-    type=str,
-    callback=_validate_priority_param
+    '--duplicates',
+    type=click.Choice(['skip', 'replace']),
+    default='skip',
+    help=(
+        'What to do with tasks whose UID is already in the list. Defaults to '
+        'skip.'
+    )
 )
 @click.option(
-    '--start',
-    default=None,
-    callback=_validate_start_date_param,
-    nargs=2,
-    help='Only shows tasks before/after given DATE'
+    '--durability',
+    type=click.Choice(DURABILITY_MODES),
+    default=BATCH,
+    help=(
+        'How to sync imported files to disk: one by one (full), in batches '
+        '(batch), or not at all (none). Defaults to batch.'
+    )
 )
+@catch_errors
+def import_(ctx, source, list, duplicates, durability):
+    """
+    Import tasks from an iCalendar file.
+
+    Each task in SOURCE (which may be - for stdin) is saved into its own file
+    in the list. Other components, like events, are ignored.
+    """
+    from todoman.importer import Importer
+
+    importer = Importer(ctx.db, list, duplicates, durability)
+    with _import_progress(source) as progress:
+        result = importer.run(source, progress)
+
+    summary = 'Imported {} tasks, replaced {}, skipped {}.'.format(
+        result.imported,
+        result.replaced,
+        result.skipped,
+    )
+    if result.failed:
+        summary += ' {} tasks could not be read.'.format(result.failed)
+    click.echo(summary)
+
+
+def _todo_filter_options(command):
+    """Adds the options used to filter todos, as taken by ``Cache.todos``."""
+    # Options are listed in --help in the opposite order to which they are
+    # added here.
+    click.option(
+        '--where',
+        default=None,
+        metavar='EXPRESSION',
+        callback=_validate_where_param,
+        help='Only show tasks matching EXPRESSION, eg: '
+        '"due < friday and priority >= medium". See the documentation for '
+        'the full syntax.'
+    )(command)
+    click.option(
+        '--status',
+        '-s',
+        default=['NEEDS-ACTION', 'IN-PROCESS'],
+        callback=validate_status,
+        help='Show only todos with the '
+        'provided comma-separated statuses. Valid statuses are '
+        '"NEEDS-ACTION", "CANCELLED", "COMPLETED", "IN-PROCESS" or "ANY"'
+    )(command)
+    click.option(
+        '--startable',
+        default=None,
+        is_flag=True,
+        callback=_validate_startable_param,
+        help='Show only todos which '
+        'should can be started today (i.e.: start time is not in the '
+        'future, and they don\'t depend on any unfinished todos).'
+    )(command)
+    click.option(
+        '--start',
+        default=None,
+        callback=_validate_start_date_param,
+        nargs=2,
+        help='Only shows tasks before/after given DATE'
+    )(command)
+    click.option(
+        '--priority',
+        default=None,
+        help='Only show tasks with'
+        ' priority at least as high as TEXT (low, medium or high).',
+        type=str,
+        callback=_validate_priority_param
+    )(command)
+    click.option(
+        '--due',
+        default=None,
+        help='Only show tasks due in INTEGER '
+        'hours',
+        type=int
+    )(command)
+    click.option(
+        '--reverse/--no-reverse',
+        default=True,
+        help='Sort tasks in reverse order (see --sort). '
+        'Defaults to true.'
+    )(command)
+    click.option(
+        '--sort',
+        help=(
+              'Sort tasks using fields like : '
+              '"start", "due", "priority", "created_at", "percent_complete" '
+              'etc.\nFor all fields please refer to: '
+              '<https://todoman.readthedocs.io/en/stable/usage.html> '
+              ),
+        callback=_sort_callback,
+    )(command)
+    click.option(
+        '--grep',
+        help='Only show tasks with message containg TEXT'
+    )(command)
+    click.option(
+        '--category',
+        help='Only show tasks with category containg TEXT'
+    )(command)
+    click.option(
+        '--location',
+        help='Only show tasks with location containg TEXT'
+    )(command)
+    click.argument(
+        'lists',
+        nargs=-1,
+        callback=_validate_lists_param,
+    )(command)
+
+    return command
+
+
+@cli.command()
+@pass_ctx
+@_todo_filter_options
 @click.option(
-    '--startable',
-    default=None,
+    '--tree',
     is_flag=True,
-    callback=_validate_startable_param,
-    help='Show only todos which '
-    'should can be started today (i.e.: start time is not in the '
-    'future).'
-)
-@click.option(
-    '--status',
-    '-s',
-    default=['NEEDS-ACTION', 'IN-PROCESS'],
-    callback=validate_status,
-    help='Show only todos with the '
-    'provided comma-separated statuses. Valid statuses are '
-    '"NEEDS-ACTION", "CANCELLED", "COMPLETED", "IN-PROCESS" or "ANY"'
+    help='Show subtasks under their parent tasks (as given by their '
+    'RELATED-TO properties), with the progress of each whole subtree.'
 )
 @catch_errors
-def list(ctx, *args, **kwargs):
+def list(ctx, *args, tree=False, **kwargs):
     """
     List tasks. Filters any completed or cancelled tasks by default.
 
@@ -642,5 +959,166 @@ def list(ctx, *args, **kwargs):
     hide_list = (len([_ for _ in ctx.db.lists()]) == 1) \
         or (len(kwargs['lists']) == 1)
 
-    todos = ctx.db.todos(**kwargs)
-    click.echo(ctx.formatter.compact_multiple(todos, hide_list))
+    if tree:
+        nodes = [node for node in ctx.db.tree(**kwargs)]
+        with ctx.timings.phase('render', len(nodes)):
+            click.echo(ctx.formatter.tree(nodes, hide_list))
+        return
+
+    todos = [todo for todo in ctx.db.todos(**kwargs)]
+    with ctx.timings.phase('render', len(todos)):
+        click.echo(ctx.formatter.compact_multiple(todos, hide_list))
+
+
+@cli.command()
+@pass_ctx
+@_todo_filter_options
+@catch_errors
+def browse(ctx, **kwargs):
+    """
+    Browse tasks in a full-screen list.
+
+    Takes the same filters as `list'. Tasks are only read as they're scrolled
+    into view, so even very large lists open instantly. Press `/' to filter
+    tasks as you type, and F1 for the other shortcuts.
+    """
+    from todoman.interactive import TodoBrowser
+
+    hide_list = (len([_ for _ in ctx.db.lists()]) == 1) \
+        or (len(kwargs['lists']) == 1)
+
+    TodoBrowser(ctx.db, ctx.ui_formatter, kwargs, hide_list).browse()
+
+
+@cli.command()
+@pass_ctx
+@_todo_filter_options
+@click.option(
+    '--format',
+    'format_',
+    type=click.Choice(['ics', 'json', 'ndjson']),
+    default='ics',
+    help=(
+        'The output format: a single iCalendar file (ics), a JSON array '
+        '(json), or one JSON object per line (ndjson). Defaults to ics.'
+    )
+)
+@click.option(
+    '--output',
+    '-o',
+    type=click.File('wb'),
+    default='-',
+    help='Where to write the tasks. Defaults to stdout.'
+)
+@catch_errors
+def export(ctx, format_, output, **kwargs):
+    """
+    Export tasks to a single file.
+
+    Takes the same filters as `list'. Tasks are written as they are read, so
+    exporting even very large lists takes little memory. iCalendar output
+    contains each task exactly as it is in its original file.
+    """
+    from todoman import exporter
+
+    exporter.export(ctx.db.todos(**kwargs), output, format_)
+
+
+def _validate_view_param(ctx, param, name):
+    ctx = ctx.find_object(AppContext)
+    views = ctx.config['views']
+    if name not in views:
+        raise click.BadParameter(
+            'Unknown view "{}", views are defined in the [views] section of '
+            'the configuration file{}'.format(
+                name,
+                ' ({})'.format(', '.join(sorted(views))) if views else '',
+            )
+        )
+
+    from todoman.expressions import ExpressionError, parse
+
+    view = views[name]
+    try:
+        where = parse(view['where'], ctx.formatter)
+    except ExpressionError as e:
+        raise click.BadParameter(
+            'Bad where setting for view "{}": {}'.format(name, e)
+        )
+
+    return name, where, validate_status(val=','.join(view['status']))
+
+
+@cli.command()
+@pass_ctx
+@click.argument('view', metavar='NAME', callback=_validate_view_param)
+@catch_errors
+def view(ctx, view):
+    """
+    Show the tasks in a saved query.
+
+    Views are defined in the configuration file. Materialized views are kept
+    up to date in the cache, so showing them is cheap even for very large
+    lists.
+    """
+    name, where, status = view
+    views = ctx.config['views']
+    ctx.db.drop_views(
+        keep=[other for other in views if views[other]['materialize']]
+    )
+
+    if views[name]['materialize']:
+        ctx.db.define_view(name, where=where, status=status)
+        todos = ctx.db.todos(view=name, status=['ANY'])
+    else:
+        todos = ctx.db.todos(where=where, status=status)
+
+    hide_list = len([_ for _ in ctx.db.lists()]) == 1
+    todos = [todo for todo in todos]
+    with ctx.timings.phase('render', len(todos)):
+        click.echo(ctx.formatter.compact_multiple(todos, hide_list))
+
+
+def _window_bound(dt, end_of_day=False):
+    """Casts dates to the first (or last) instant of that day."""
+    if isinstance(dt, datetime):
+        return dt
+    return datetime.combine(
+        dt,
+        time.max if end_of_day else time.min,
+    ).replace(tzinfo=LOCAL_TIMEZONE)
+
+
+@cli.command()
+@pass_ctx
+@click.argument('lists', nargs=-1, callback=_validate_lists_param)
+@click.option(
+    '--from',
+    'start',
+    default='',
+    callback=_validate_date_param,
+    help='Show tasks from this date on. Defaults to today.'
+)
+@click.option(
+    '--to',
+    'end',
+    default='',
+    callback=_validate_date_param,
+    help='Show tasks until this date. Defaults to a week after --from.'
+)
+@catch_errors
+def agenda(ctx, lists, start, end):
+    """
+    Show tasks due within a date range, by date.
+
+    Recurring tasks are shown once for each time they recur within the range.
+    Tasks with no due date are shown on their start date, if any.
+    """
+    start = _window_bound(start or datetime.now(LOCAL_TIMEZONE).date())
+    end = _window_bound(end, True) if end else start + timedelta(days=7)
+
+    hide_list = (len([_ for _ in ctx.db.lists()]) == 1) or (len(lists) == 1)
+
+    occurrences = ctx.db.occurrences(start, end, lists=lists)
+    with ctx.timings.phase('render', len(occurrences)):
+        click.echo(ctx.formatter.agenda(occurrences, hide_list))
@@ -0,0 +1,153 @@
+"""
+Shell completion candidates, read straight from the cache.
+
+This runs on every TAB, so it skips everything that makes other commands
+slow: the configuration isn't validated (its cached, validated, copy is read
+instead), the cache isn't refreshed, and only the standard library is
+imported.
+
+Candidates are printed one per line, as ``value<TAB>description``.
+"""
+import json
+import os
+import sqlite3
+import sys
+
+USAGE = 'Usage: todo _complete {{{}}} [PREFIX]'
+
+# Each query takes a LIKE pattern, and returns (value, description) rows.
+QUERIES = {
+    'ids': '''
+          SELECT todos.id, '@' || files.list_name || ' ' || todos.summary
+            FROM todos, files
+           WHERE todos.file_path = files.path
+             AND todos.status IN ('NEEDS-ACTION', 'IN-PROCESS')
+             AND CAST(todos.id AS TEXT) LIKE ? ESCAPE '\\'
+        ORDER BY todos.id
+    ''',
+    'lists': '''
+          SELECT name, path
+            FROM lists
+           WHERE name LIKE ? ESCAPE '\\'
+        ORDER BY name
+    ''',
+    'locations': '''
+          SELECT location, COUNT(*) || ' tasks'
+            FROM todos
+           WHERE location != '' AND location LIKE ? ESCAPE '\\'
+        GROUP BY location
+        ORDER BY location
+    ''',
+    # Categories are stored comma-separated, so these rows are split (and
+    # filtered by prefix) afterwards.
+    'categories': '''
+          SELECT categories, COUNT(*)
+            FROM todos
+           WHERE categories != '' AND categories LIKE ? ESCAPE '\\'
+        GROUP BY categories
+    ''',
+}
+
+
+def _cache_home():
+    return os.environ.get('XDG_CACHE_HOME') or \
+        os.path.join(os.path.expanduser('~'), '.cache')
+
+
+def _config(*keys):
+    """
+    Returns a setting from the configuration, as validated the last time
+    todoman ran, or ``None`` if it can't be read.
+    """
+    try:
+        with open(os.path.join(_cache_home(), 'todoman', 'config.json')) as f:
+            value = json.load(f)['config']
+        for key in keys:
+            value = value[key]
+        return value
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def cache_path():
+    """
+    Returns the path of the cache, as configured the last time todoman ran.
+    """
+    return _config('main', 'cache_path') or \
+        os.path.join(_cache_home(), 'todoman', 'cache.sqlite3')
+
+
+def views(prefix=''):
+    """Returns ``(name, expression)`` tuples for the configured views."""
+    return [
+        (name, view.get('where', ''))
+        for name, view in sorted((_config('views') or {}).items())
+        if name.startswith(prefix)
+    ]
+
+
+def _like_prefix(prefix):
+    for char in '\\%_':
+        prefix = prefix.replace(char, '\\' + char)
+    return prefix + '%'
+
+
+def _split_categories(rows, prefix):
+    counts = {}
+    for categories, count in rows:
+        for category in categories.split(','):
+            if category.lower().startswith(prefix.lower()):
+                counts[category] = counts.get(category, 0) + count
+    return [
+        (category, '{} tasks'.format(count))
+        for category, count in sorted(counts.items())
+    ]
+
+
+def candidates(path, kind, prefix=''):
+    """
+    Returns ``(value, description)`` tuples for values of ``kind`` starting
+    with ``prefix``. Nothing is returned if the cache can't be read.
+    """
+    if not os.path.exists(path):
+        return []
+
+    pattern = _like_prefix(prefix)
+    if kind == 'categories':
+        # Any of the categories may start with the prefix.
+        pattern = '%' + pattern
+
+    try:
+        connection = sqlite3.connect(path, timeout=1)
+        try:
+            rows = connection.execute(QUERIES[kind], (pattern,)).fetchall()
+        finally:
+            connection.close()
+    except sqlite3.Error:
+        return []
+
+    if kind == 'categories':
+        return _split_categories(rows, prefix)
+    return rows
+
+
+def main(argv):
+    """
+    Prints completion candidates, for ``todo _complete KIND [PREFIX]``.
+
+    :returns: The exit code.
+    """
+    kinds = sorted(list(QUERIES) + ['views'])
+    if not 1 <= len(argv) <= 2 or argv[0] not in kinds:
+        print(USAGE.format('|'.join(kinds)), file=sys.stderr)
+        return 2
+
+    prefix = argv[1] if len(argv) > 1 else ''
+    if argv[0] == 'views':
+        rows = views(prefix)
+    else:
+        rows = candidates(cache_path(), argv[0], prefix)
+
+    for value, description in rows:
+        print('{}\t{}'.format(value, description))
+    return 0
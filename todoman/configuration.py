@@ -1,11 +1,21 @@
+import hashlib
+import json
+import logging
 import os
+import re
 from os.path import exists, join
 
 import xdg.BaseDirectory
 from configobj import ConfigObj, flatten_errors
 from validate import Validator, VdtValueError
 
-from todoman import __documentation__
+from todoman import __documentation__, __version__
+
+logger = logging.getLogger(name=__name__)
+
+# Environment variables that affect validated values even when the
+# configuration file does not reference them explicitly.
+CACHE_ENVIRON = ('HOME', 'XDG_CACHE_HOME')
 
 
 class ConfigurationException(Exception):
@@ -65,9 +75,70 @@ def find_config(custom_path=None):
     raise ConfigurationException("No configuration file found.\n\n")
 
 
-def load_config(custom_path=None):
-    path = find_config(custom_path)
-    specpath = os.path.join(os.path.dirname(__file__), 'confspec.ini')
+def config_cache_path():
+    """
+    Returns the path of the file where the validated configuration is cached.
+    """
+    return os.path.join(
+        xdg.BaseDirectory.xdg_cache_home,
+        'todoman/config.json',
+    )
+
+
+def _config_cache_key(path, specpath):
+    """
+    Returns everything that the validated configuration depends on.
+
+    Besides the files themselves, any referenced environment variables are
+    included, since paths are expanded during validation.
+    """
+    with open(path, 'rb') as f:
+        content = f.read()
+
+    environ = set(CACHE_ENVIRON)
+    environ.update(
+        re.findall(r'\$\{?(\w+)', content.decode('utf-8', 'replace'))
+    )
+
+    return {
+        'version': __version__,
+        'path': os.path.abspath(path),
+        'mtime': os.stat(path).st_mtime_ns,
+        'digest': hashlib.sha256(content).hexdigest(),
+        'specpath': specpath,
+        'specmtime': os.stat(specpath).st_mtime_ns,
+        'environ': {name: os.environ.get(name)
+                    for name in sorted(environ)},
+    }
+
+
+def _read_config_cache(key):
+    try:
+        with open(config_cache_path()) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if not isinstance(cached, dict) or cached.get('key') != key:
+        logger.debug('Configuration cache is stale.')
+        return None
+
+    return cached.get('config')
+
+
+def _write_config_cache(key, config):
+    path = config_cache_path()
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, 'w') as f:
+            json.dump({'key': key, 'config': config}, f)
+        os.replace(tmp_path, path)
+    except OSError:
+        logger.debug('Could not write configuration cache.', exc_info=True)
+
+
+def _validate_config(path, specpath):
     validator = Validator({
         'expand_path': expand_path,
         'cache_path': validate_cache_path,
@@ -89,4 +160,23 @@ def load_config(custom_path=None):
                 'Bad {} setting, {}'.format(key, error.args[0])
             )
 
+    return config.dict()
+
+
+def load_config(custom_path=None):
+    """
+    Loads and validates the configuration.
+
+    Validated configurations are cached, and the cached copy is reused as long
+    as neither the configuration file, the spec nor todoman itself changed.
+    """
+    path = find_config(custom_path)
+    specpath = os.path.join(os.path.dirname(__file__), 'confspec.ini')
+
+    key = _config_cache_key(path, specpath)
+    config = _read_config_cache(key)
+    if config is None:
+        config = _validate_config(path, specpath)
+        _write_config_cache(key, config)
+
     return config
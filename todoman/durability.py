@@ -0,0 +1,117 @@
+"""
+Atomic file writes, with configurable durability.
+
+Writing each file atomically and durably means syncing its data, renaming it
+into place, and then syncing its directory. For bulk operations, those syncs
+dominate, so they can instead be grouped into batches.
+"""
+import os
+import threading
+
+#: Each file is synced, renamed into place, and has its directory synced as
+#: soon as it's written.
+FULL = 'full'
+#: Files are written to temporary files, and only synced, renamed into place,
+#: and have their directories synced (once per directory) when the batch is
+#: committed. A crash loses, at most, the uncommitted batch.
+BATCH = 'batch'
+#: Nothing is synced; the OS decides when data reaches the disk.
+NONE = 'none'
+
+DURABILITY_MODES = (FULL, BATCH, NONE)
+
+
+def fsync_directory(path):
+    """Makes renames and new files within a directory durable."""
+    fd = os.open(path, getattr(os, 'O_DIRECTORY', os.O_RDONLY))
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _fsync_path(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class AtomicBatch:
+    """
+    Writes files atomically, syncing them as required by ``durability``.
+
+    :meth:`write` may be called from several threads at once. Files written
+    in ``batch`` mode are only visible after :meth:`commit` is called.
+
+    :param str durability: One of ``DURABILITY_MODES``.
+    """
+
+    def __init__(self, durability=FULL):
+        if durability not in DURABILITY_MODES:
+            raise ValueError('Unknown durability mode: {}'.format(durability))
+        self.durability = durability
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def write(self, path, data):
+        """Writes ``data`` (bytes) to ``path``, replacing it if it exists."""
+        import tempfile
+
+        directory = os.path.dirname(path)
+        # Temporary files are hidden, and don't end in .ics, so that they're
+        # never picked up as todos.
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+                if self.durability == FULL:
+                    f.flush()
+                    os.fsync(f.fileno())
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+        if self.durability == BATCH:
+            with self._lock:
+                self._pending.append((tmp, path))
+            return
+
+        os.replace(tmp, path)
+        if self.durability == FULL:
+            fsync_directory(directory)
+
+    def commit(self):
+        """
+        Makes all files written so far visible and durable.
+
+        Returns the paths of the files committed by this call (which are only
+        tracked in ``batch`` mode).
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+
+        for tmp, _ in pending:
+            _fsync_path(tmp)
+
+        directories = set()
+        for tmp, path in pending:
+            os.replace(tmp, path)
+            directories.add(os.path.dirname(path))
+
+        for directory in sorted(directories):
+            fsync_directory(directory)
+
+        return [path for _, path in pending]
+
+    def abort(self):
+        """Discards any files which haven't been committed yet."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+
+        for tmp, _ in pending:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
@@ -46,3 +46,13 @@ class AlreadyExists(TodomanException):
 
     def __str__(self):
         return 'More than one {} has the same identity: {}.'.format(*self.args)
+
+
+class ChangedOnDisk(TodomanException):
+    EXIT_CODE = 24
+
+    def __str__(self):
+        return (
+            '{} has changed since it was last read, please try again.'
+            .format(self.args[0])
+        )
@@ -0,0 +1,134 @@
+"""
+Streaming export of todos.
+
+Todos are written one at a time, as they are read from the cache, so memory
+use doesn't depend on how many are exported. iCalendar output copies each
+todo's original lines from its file, rather than re-serializing it.
+"""
+import json
+import logging
+import re
+from datetime import date
+
+from todoman.importer import FOOTER, HEADER, split_calendar, TZID_RE
+from todoman.model import Todo
+
+logger = logging.getLogger(name=__name__)
+
+FORMATS = ('ics', 'json', 'ndjson')
+
+UNFOLD_RE = re.compile(rb'\r?\n[ \t]')
+UID_RE = re.compile(
+    rb'^UID(?:;[^:\r\n]*)?:(.*?)\r?$',
+    re.MULTILINE | re.IGNORECASE,
+)
+
+
+def read_vtodo(path, uid):
+    """
+    Returns the original bytes of a VTODO, and of the VTIMEZONEs it
+    references.
+
+    :param str path: The file containing the VTODO.
+    :param str uid: The VTODO's UID, used if the file contains several.
+    :returns: A ``(vtodo, timezones)`` tuple, or ``None`` if it wasn't found.
+    """
+    with open(path, 'rb') as f:
+        components = [
+            (vtodo, timezones) for vtodo, timezones, _ in split_calendar(f)
+        ]
+
+    if len(components) == 1:
+        return components[0]
+
+    for vtodo, timezones in components:
+        match = UID_RE.search(UNFOLD_RE.sub(b'', vtodo))
+        if match and match.group(1).decode('utf-8', 'replace') == uid:
+            return vtodo, timezones
+
+    return None
+
+
+def todo_as_dict(todo):
+    """Returns all of a todo's fields, in a JSON-friendly format."""
+    data = {
+        'id': todo.id,
+        'list': todo.list.name,
+    }
+    for field in Todo.ALL_SUPPORTED_FIELDS:
+        value = getattr(todo, field)
+        if isinstance(value, date):
+            value = value.isoformat()
+        data[field] = value
+    return data
+
+
+def export_ics(todos, out):
+    out.write(HEADER)
+
+    count = 0
+    written_timezones = set()
+    for todo in todos:
+        try:
+            component = read_vtodo(todo.path, todo.uid)
+        except OSError as e:
+            logger.warning('Could not read %s: %s', todo.path, e)
+            continue
+        if not component:
+            logger.warning('Could not find %s in %s', todo.uid, todo.path)
+            continue
+
+        vtodo, timezones = component
+        for timezone in timezones:
+            tzid = TZID_RE.search(timezone).group(1)
+            if tzid not in written_timezones:
+                out.write(timezone)
+                written_timezones.add(tzid)
+
+        out.write(vtodo)
+        count += 1
+
+    out.write(FOOTER)
+    return count
+
+
+def export_json(todos, out):
+    out.write(b'[')
+
+    count = 0
+    for todo in todos:
+        if count:
+            out.write(b',')
+        out.write(b'\n')
+        out.write(json.dumps(todo_as_dict(todo), sort_keys=True).encode())
+        count += 1
+
+    out.write(b'\n]\n')
+    return count
+
+
+def export_ndjson(todos, out):
+    count = 0
+    for todo in todos:
+        out.write(json.dumps(todo_as_dict(todo), sort_keys=True).encode())
+        out.write(b'\n')
+        count += 1
+    return count
+
+
+def export(todos, out, format='ics'):
+    """
+    Writes todos to a binary file-like object.
+
+    :param todos: An iterable of todos, usually from :meth:`Cache.todos`.
+    :param str format: One of ``FORMATS``.
+    :returns: How many todos were exported.
+    """
+    exporters = {
+        'ics': export_ics,
+        'json': export_json,
+        'ndjson': export_ndjson,
+    }
+    if format not in exporters:
+        raise ValueError('Unknown export format: {}'.format(format))
+    return exporters[format](todos, out)
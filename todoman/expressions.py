@@ -0,0 +1,491 @@
+"""
+A small expression language for filtering todos, eg::
+
+    due < friday and (priority >= medium or categories = urgent)
+
+Expressions are parsed once, and compiled into a parameterized SQL condition
+for :meth:`Cache.todos`. Conditions compare raw columns (rather than values
+computed from them), so that SQLite can answer them using the cache's
+indexes.
+"""
+import re
+from datetime import datetime, timedelta
+
+from todoman.model import LOCAL_TIMEZONE
+
+TEXT = 'text'
+NUMBER = 'number'
+DATE = 'date'
+PRIORITY = 'priority'
+CATEGORIES = 'categories'
+
+#: The fields which may be used in expressions, with their column and type.
+FIELDS = {
+    'categories': ('todos.categories', CATEGORIES),
+    'completed_at': ('todos.completed_at', DATE),
+    'created_at': ('todos.created_at', DATE),
+    'description': ('todos.description', TEXT),
+    'due': ('todos.due', DATE),
+    'id': ('todos.id', NUMBER),
+    'list': ('files.list_name', TEXT),
+    'location': ('todos.location', TEXT),
+    'percent_complete': ('todos.percent_complete', NUMBER),
+    'priority': ('todos.priority', PRIORITY),
+    'sequence': ('todos.sequence', NUMBER),
+    'start': ('todos.start', DATE),
+    'status': ('todos.status', TEXT),
+    'summary': ('todos.summary', TEXT),
+    'uid': ('todos.uid', TEXT),
+}
+
+KEYWORDS = ('and', 'contains', 'in', 'is', 'not', 'null', 'or')
+COMPARISONS = ('=', '==', '!=', '<', '<=', '>', '>=', '~')
+
+#: The range of raw priority values for each priority name.
+PRIORITIES = {
+    'high': (1, 4),
+    'medium': (5, 5),
+    'low': (6, 9),
+    'none': None,
+}
+
+TOKEN_RE = re.compile(
+    r'''
+    \s*(?:
+        (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+      | (?P<op><=|>=|!=|==|[=<>~(),])
+      | (?P<word>[^\s()<>=!~,"']+)
+    )
+    ''',
+    re.VERBOSE,
+)
+ESCAPE_RE = re.compile(r'\\(.)')
+
+
+class ExpressionError(ValueError):
+    """Raised when an expression can't be parsed."""
+
+    def __init__(self, message, position):
+        super().__init__('{} (at column {})'.format(message, position + 1))
+        self.position = position
+
+
+class Expression:
+    """
+    A compiled expression.
+
+    :ivar str text: The original expression.
+    :ivar str sql: A condition, for use in a ``WHERE`` clause.
+    :ivar list params: The condition's parameters.
+    """
+
+    def __init__(self, text, sql, params):
+        self.text = text
+        self.sql = sql
+        self.params = params
+
+    def __repr__(self):
+        return '<Expression {!r}>'.format(self.text)
+
+
+class _Token:
+    def __init__(self, kind, value, position):
+        self.kind = kind
+        self.value = value
+        self.position = position
+
+    def is_keyword(self, *keywords):
+        return self.kind == 'word' and self.value.lower() in keywords
+
+    def is_op(self, *ops):
+        return self.kind == 'op' and self.value in ops
+
+
+def tokenize(text):
+    """Returns the tokens of an expression, ending with an ``end`` token."""
+    tokens = []
+    position = 0
+
+    while text[position:].strip():
+        match = TOKEN_RE.match(text, position)
+        if not match:
+            start = len(text) - len(text[position:].lstrip())
+            if text[start] in '"\'':
+                raise ExpressionError('Unterminated string', start)
+            raise ExpressionError(
+                'Unexpected character {!r}'.format(text[start]),
+                start,
+            )
+
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == 'string':
+            value = ESCAPE_RE.sub(r'\1', value[1:-1])
+        tokens.append(_Token(kind, value, match.start(kind)))
+        position = match.end()
+
+    tokens.append(_Token('end', None, len(text)))
+    return tokens
+
+
+class _Parser:
+    """
+    A recursive descent parser, which compiles as it goes::
+
+        expression := and ('or' and)*
+        and        := not ('and' not)*
+        not        := 'not' not | '(' expression ')' | condition
+        condition  := FIELD ('=' | '==' | '!=' | '<' | '<=' | '>' | '>=' |
+                             '~' | 'contains') VALUE
+                    | FIELD ['not'] 'in' '(' VALUE (',' VALUE)* ')'
+                    | FIELD 'is' ['not'] 'null'
+    """
+
+    def __init__(self, text, formatter):
+        self.tokens = tokenize(text)
+        self.index = 0
+        self.formatter = formatter
+        self.params = []
+
+    @property
+    def token(self):
+        return self.tokens[self.index]
+
+    def advance(self):
+        token = self.token
+        self.index += 1
+        return token
+
+    def error(self, message, token=None):
+        token = token or self.token
+        if token.kind == 'end':
+            message += ', but the expression ended'
+        else:
+            message += ', got {!r}'.format(token.value)
+        return ExpressionError(message, token.position)
+
+    def parse(self):
+        sql = self.expression()
+        if self.token.kind != 'end':
+            raise self.error('Expected "and", "or" or the end')
+        return sql
+
+    def expression(self):
+        terms = [self.conjunction()]
+        while self.token.is_keyword('or'):
+            self.advance()
+            terms.append(self.conjunction())
+        return terms[0] if len(terms) == 1 else \
+            '({})'.format(' OR '.join(terms))
+
+    def conjunction(self):
+        terms = [self.negation()]
+        while self.token.is_keyword('and'):
+            self.advance()
+            terms.append(self.negation())
+        return terms[0] if len(terms) == 1 else \
+            '({})'.format(' AND '.join(terms))
+
+    def negation(self):
+        if self.token.is_keyword('not'):
+            self.advance()
+            return _negate(self.negation())
+
+        if self.token.is_op('('):
+            self.advance()
+            sql = self.expression()
+            if not self.token.is_op(')'):
+                raise self.error('Expected ")"')
+            self.advance()
+            return sql
+
+        return self.condition()
+
+    def condition(self):
+        token = self.advance()
+        if token.kind != 'word' or token.value.lower() in KEYWORDS:
+            raise self.error('Expected a field name', token)
+
+        name = token.value.lower()
+        if name not in FIELDS:
+            raise ExpressionError(
+                'Unknown field {!r}, expected one of: {}'.format(
+                    token.value,
+                    ', '.join(sorted(FIELDS)),
+                ),
+                token.position,
+            )
+        field = _Field(name, self)
+
+        if self.token.is_keyword('is'):
+            self.advance()
+            negated = self.token.is_keyword('not')
+            if negated:
+                self.advance()
+            if not self.token.is_keyword('null'):
+                raise self.error('Expected "null"')
+            self.advance()
+            sql = field.is_null()
+            return _negate(sql) if negated else sql
+
+        if self.token.is_keyword('not', 'in'):
+            negated = self.advance().is_keyword('not')
+            if negated:
+                if not self.token.is_keyword('in'):
+                    raise self.error('Expected "in"')
+                self.advance()
+            sql = field.one_of(self.values())
+            return _negate(sql) if negated else sql
+
+        if self.token.is_keyword('contains'):
+            op = '~'
+        elif self.token.is_op(*COMPARISONS):
+            op = self.token.value
+        else:
+            raise self.error(
+                'Expected a comparison after {!r}'.format(token.value)
+            )
+        self.advance()
+        return field.compare(op, self.value())
+
+    def value(self):
+        token = self.token
+        if token.kind == 'string' or (
+            token.kind == 'word' and token.value.lower() not in KEYWORDS
+        ):
+            self.advance()
+            return token
+        raise self.error('Expected a value')
+
+    def values(self):
+        if not self.token.is_op('('):
+            raise self.error('Expected "("')
+        self.advance()
+
+        values = [self.value()]
+        while self.token.is_op(','):
+            self.advance()
+            values.append(self.value())
+
+        if not self.token.is_op(')'):
+            raise self.error('Expected "," or ")"')
+        self.advance()
+        return values
+
+
+def _negate(sql):
+    # Conditions on missing (NULL) values are neither true nor false, and so
+    # would be excluded whether negated or not. Negations treat them as false.
+    return '({}) IS NOT 1'.format(sql)
+
+
+def _like_pattern(value):
+    for char in '\\%_':
+        value = value.replace(char, '\\' + char)
+    return '%{}%'.format(value)
+
+
+def _midnight(day):
+    return datetime(day.year, day.month, day.day, tzinfo=LOCAL_TIMEZONE)
+
+
+class _Field:
+    """Compiles conditions on a single field."""
+
+    def __init__(self, name, parser):
+        self.name = name
+        self.column, self.type = FIELDS[name]
+        self.parser = parser
+
+    def param(self, value):
+        self.parser.params.append(value)
+        return '?'
+
+    def error(self, message, token):
+        return ExpressionError(message, token.position)
+
+    def is_null(self):
+        if self.type == PRIORITY:
+            return self.priority('=', None)
+        if self.type in (TEXT, CATEGORIES):
+            return "({0} IS NULL OR {0} = '')".format(self.column)
+        return '{} IS NULL'.format(self.column)
+
+    def one_of(self, tokens):
+        if self.type in (TEXT, NUMBER):
+            return '{} IN ({})'.format(
+                self.column,
+                ', '.join(self.param(self.convert(t)) for t in tokens),
+            )
+        return '({})'.format(
+            ' OR '.join(self.compare('=', token) for token in tokens)
+        )
+
+    def compare(self, op, token):
+        if op == '==':
+            op = '='
+        if op == '!=':
+            return _negate(self.compare('=', token))
+
+        if op == '~':
+            if self.type not in (TEXT, CATEGORIES):
+                raise self.error(
+                    '{!r} is not a text field, so can\'t be searched with '
+                    '"~" or "contains"'.format(self.name),
+                    token,
+                )
+            return "{} LIKE {} ESCAPE '\\'".format(
+                self.column,
+                self.param(_like_pattern(token.value)),
+            )
+
+        if self.type == DATE:
+            return self.date(op, token)
+        if self.type == PRIORITY:
+            return self.priority(op, self.convert_priority(token))
+        if self.type == CATEGORIES:
+            if op != '=':
+                raise self.error(
+                    'Categories can only be compared with "=", "!=", "~" '
+                    'and "in"',
+                    token,
+                )
+            # Categories are stored comma-separated.
+            return "',' || {} || ',' LIKE {} ESCAPE '\\'".format(
+                self.column,
+                self.param(_like_pattern(',{},'.format(token.value))),
+            )
+
+        return '{} {} {}'.format(
+            self.column,
+            op,
+            self.param(self.convert(token)),
+        )
+
+    def convert(self, token):
+        if self.type == NUMBER:
+            try:
+                return int(token.value)
+            except ValueError:
+                raise self.error(
+                    '{!r} must be compared to a number, got {!r}'.format(
+                        self.name,
+                        token.value,
+                    ),
+                    token,
+                )
+        if self.name == 'status':
+            return token.value.upper()
+        return token.value
+
+    def date(self, op, token):
+        value = self.convert_date(token)
+
+        if isinstance(value, datetime):
+            return '{} {} {}'.format(
+                self.column,
+                op,
+                self.param(value.timestamp()),
+            )
+
+        # Dates match any time during that day.
+        start = _midnight(value).timestamp()
+        end = _midnight(value + timedelta(days=1)).timestamp()
+        if op == '=':
+            return '({0} >= {1} AND {0} < {2})'.format(
+                self.column,
+                self.param(start),
+                self.param(end),
+            )
+        return '{} {} {}'.format(
+            self.column,
+            {'<': '<', '<=': '<', '>': '>=', '>=': '>='}[op],
+            self.param(start if op in ('<', '>=') else end),
+        )
+
+    def convert_date(self, token):
+        formatter = self.parser.formatter
+        today = formatter.now.date()
+        relative = {
+            'now': formatter.now,
+            'today': today,
+            'tomorrow': today + timedelta(days=1),
+            'yesterday': today - timedelta(days=1),
+        }
+
+        value = token.value.lower()
+        if value in relative:
+            return relative[value]
+
+        try:
+            value = formatter.parse_datetime(token.value)
+        except (TypeError, ValueError) as e:
+            raise self.error(
+                'Invalid date {!r}: {}'.format(token.value, e),
+                token,
+            )
+        return value
+
+    def convert_priority(self, token):
+        value = token.value.lower()
+        if value in PRIORITIES:
+            return PRIORITIES[value]
+        if value.isdigit() and int(value) <= 9:
+            value = int(value)
+            return (value, value) if value else None
+
+        raise self.error(
+            'Priority must be one of none, low, medium, high or 0-9, '
+            'got {!r}'.format(token.value),
+            token,
+        )
+
+    def priority(self, op, value):
+        """
+        Compares priorities by importance, so that, eg: ``priority > low``
+        matches high and medium priority todos.
+
+        :param tuple value: The range of raw priorities to compare to, or
+            ``None`` for no priority.
+        """
+        column = self.column
+        if value is None:
+            return {
+                '=': '({0} IS NULL OR {0} = 0)',
+                '<': '0',
+                '<=': '({0} IS NULL OR {0} = 0)',
+                '>': '{0} > 0',
+                '>=': '1',
+            }[op].format(column)
+
+        low, high = value
+        if op == '=':
+            return '{} BETWEEN {} AND {}'.format(
+                column,
+                self.param(low),
+                self.param(high),
+            )
+        if op in ('>', '>='):
+            return '{} BETWEEN 1 AND {}'.format(
+                column,
+                self.param(low - 1 if op == '>' else high),
+            )
+        return '({0} IS NULL OR {0} = 0 OR {0} {1} {2})'.format(
+            column,
+            '>' if op == '<' else '>=',
+            self.param(high if op == '<' else low),
+        )
+
+
+def parse(text, formatter):
+    """
+    Parses and compiles an expression.
+
+    :param str text: The expression.
+    :param formatter: Used to parse dates, as they are elsewhere.
+    :raises ExpressionError: If the expression is invalid.
+    :rtype: Expression
+    """
+    parser = _Parser(text, formatter)
+    sql = parser.parse()
+    return Expression(text, sql, parser.params)
@@ -3,11 +3,12 @@ import json
 from time import mktime
 
 import click
-import humanize
-import parsedatetime
-import pytz
 from dateutil.tz import tzlocal
-from tabulate import tabulate
+
+from todoman.model import cached_property
+
+#: How many characters of each file's error are shown in tables.
+ERROR_WIDTH = 100
 
 
 def rgb_to_ansi(colour):
@@ -44,9 +45,22 @@ class DefaultFormatter:
         )
 
         self.tz = tz_override or tzlocal()
+        self.update_now()
+
+    def update_now(self):
+        """
+        Updates the time used to highlight overdue todos, and to humanize
+        dates, eg: when a formatter is reused for several commands.
+        """
         self.now = datetime.datetime.now().replace(tzinfo=self.tz)
 
-        self._parsedatetime_calendar = parsedatetime.Calendar(
+    @cached_property
+    def _parsedatetime_calendar(self):
+        # parsedatetime is slow to import, and only needed for natural
+        # language input, so only load it when we actually get some.
+        import parsedatetime
+
+        return parsedatetime.Calendar(
             version=parsedatetime.VERSION_CONTEXT_STYLE,
         )
 
@@ -57,10 +71,23 @@ class DefaultFormatter:
         return self.compact_multiple([todo])
 
     def compact_multiple(self, todos, hide_list=False):
+        return self.tree(((todo, 0, None) for todo in todos), hide_list)
+
+    def tree(self, nodes, hide_list=False):
+        """
+        Returns a table of todos, with subtasks indented under their parents,
+        as returned by :meth:`~todoman.model.Database.tree`. Todos with
+        subtasks show the progress of their whole subtree.
+        """
+        from tabulate import tabulate
+
         table = []
-        for todo in todos:
+        for todo, depth, progress in nodes:
             completed = "X" if todo.is_completed else " "
-            percent = todo.percent_complete or ''
+            if progress is not None:
+                percent = round(progress)
+            else:
+                percent = todo.percent_complete or ''
             if percent:
                 percent = " ({}%)".format(percent)
             priority = self.format_priority_compact(todo.priority)
@@ -85,6 +112,9 @@ class DefaultFormatter:
                             self.format_database(todo.list),
                             percent,
                         )
+            if depth:
+                # Leading whitespace would be stripped by tabulate.
+                summary = '· ' * (depth - 1) + '└ ' + summary
 
             table.append([
                 todo.id,
@@ -96,6 +126,51 @@ class DefaultFormatter:
 
         return tabulate(table, tablefmt='plain')
 
+    def agenda(self, occurrences, hide_list=False):
+        """
+        Returns a table of occurrences, as returned by
+        :meth:`~todoman.model.Database.occurrences`.
+        """
+        from tabulate import tabulate
+
+        table = []
+        for dt, todo in occurrences:
+            if hide_list:
+                summary = todo.summary
+            else:
+                summary = '{} {}'.format(
+                    todo.summary,
+                    self.format_database(todo.list),
+                )
+
+            table.append([
+                self.format_datetime(dt),
+                todo.id,
+                self.format_priority_compact(todo.priority),
+                summary,
+                '⟳' if todo.is_recurring else '',
+            ])
+
+        return tabulate(table, tablefmt='plain')
+
+    def file_statuses(self, files):
+        """
+        Returns a table of files, as returned by
+        :meth:`~todoman.model.Database.file_statuses`, with the first line of
+        each one's error.
+        """
+        from tabulate import tabulate
+
+        table = [
+            [
+                row['path'],
+                row['parse_status'],
+                (row['parse_error'] or '').split('\n', 1)[0][:ERROR_WIDTH],
+            ]
+            for row in files
+        ]
+        return tabulate(table, tablefmt='plain')
+
     def _columnize_text(self, label, text):
         """Display text, split text by line-endings, on multiple colums,"""
         """do nothing if text is empty or None"""
@@ -122,6 +197,8 @@ class DefaultFormatter:
 
         :param Todo todo: The todo component.
         """
+        from tabulate import tabulate
+
         extra_rows = []
         extra_rows += self._columnize_text('Description', todo.description)
         extra_rows += self._columnize_text('Location', todo.location)
@@ -224,6 +301,8 @@ class HumanizedFormatter(DefaultFormatter):
         if not dt:
             return ''
 
+        import humanize
+
         rv = humanize.naturaltime(self.now - dt)
         if ' from now' in rv:
             rv = 'in {}'.format(rv[:-9])
@@ -251,6 +330,35 @@ class PorcelainFormatter(DefaultFormatter):
         data = [self._todo_as_dict(todo) for todo in todos]
         return json.dumps(data, indent=4, sort_keys=True)
 
+    def tree(self, nodes, hide_list=False):
+        data = []
+        for todo, depth, progress in nodes:
+            entry = self._todo_as_dict(todo)
+            entry['depth'] = depth
+            entry['progress'] = progress
+            data.append(entry)
+        return json.dumps(data, indent=4, sort_keys=True)
+
+    def agenda(self, occurrences, hide_list=False):
+        data = []
+        for dt, todo in occurrences:
+            entry = self._todo_as_dict(todo)
+            entry['occurrence'] = self.format_datetime(dt)
+            data.append(entry)
+        return json.dumps(data, indent=4, sort_keys=True)
+
+    def file_statuses(self, files):
+        data = [
+            dict(
+                path=row['path'],
+                list=row['list_name'],
+                status=row['parse_status'],
+                error=row['parse_error'],
+            )
+            for row in files
+        ]
+        return json.dumps(data, indent=4, sort_keys=True)
+
     def simple_action(self, action, todo):
         return self.compact(todo)
 
@@ -278,6 +386,8 @@ class PorcelainFormatter(DefaultFormatter):
 
     def parse_datetime(self, value):
         if value:
+            import pytz
+
             return datetime.datetime.fromtimestamp(value, tz=pytz.UTC)
         else:
             return None
@@ -0,0 +1,236 @@
+"""
+Fast serialization of todos into iCalendar (RFC 5545) files.
+
+Building an ``icalendar.Todo`` just to write a small new file is costly, so
+new todos are written directly as text instead. The output is the same as
+``icalendar`` would produce for :meth:`VtodoWriter.serialize`'s result:
+properties are sorted by name, datetimes are converted to UTC, text is
+escaped, and long lines are folded.
+
+Existing files are patched in place (see :func:`patch`): only the lines of
+the properties which changed are rewritten, and everything else is kept
+byte for byte.
+"""
+import re
+from collections import namedtuple
+from datetime import date, datetime, timezone
+
+#: Lines are folded so that no physical line is longer than this many octets,
+#: excluding the line break.
+LINE_LENGTH = 75
+
+
+def escape(text):
+    """Escapes a ``TEXT`` value."""
+    return text.replace('\\', '\\\\') \
+        .replace(';', '\\;') \
+        .replace(',', '\\,') \
+        .replace('\r\n', '\\n') \
+        .replace('\n', '\\n')
+
+
+def fold(line):
+    """
+    Folds a content line, splitting it between characters (never within
+    one), such that each physical line is at most ``LINE_LENGTH`` octets.
+    """
+    limit = LINE_LENGTH - 1
+    if _isascii(line):
+        return '\r\n '.join(
+            line[i:i + limit] for i in range(0, len(line), limit)
+        )
+
+    chunks = []
+    start = 0
+    octets = 0
+    for i, char in enumerate(line):
+        size = len(char.encode('utf-8'))
+        if octets + size > limit:
+            chunks.append(line[start:i])
+            start = i
+            octets = 0
+        octets += size
+    chunks.append(line[start:])
+    return '\r\n '.join(chunks)
+
+
+def _isascii(text):
+    try:
+        text.encode('ascii')
+    except UnicodeEncodeError:
+        return False
+    return True
+
+
+def format_datetime(name, dt):
+    """
+    Formats a ``DATE`` or ``DATE-TIME`` property. Datetimes must be aware.
+    """
+    if not isinstance(dt, datetime):
+        return '{};VALUE=DATE:{:04d}{:02d}{:02d}'.format(
+            name,
+            dt.year,
+            dt.month,
+            dt.day,
+        )
+
+    dt = dt.astimezone(timezone.utc)
+    return '{};VALUE=DATE-TIME:{:04d}{:02d}{:02d}T{:02d}{:02d}{:02d}Z'.format(
+        name,
+        dt.year,
+        dt.month,
+        dt.day,
+        dt.hour,
+        dt.minute,
+        dt.second,
+    )
+
+
+def serialize_new(properties, prodid, version='2.0'):
+    """
+    Serializes a new calendar, with a single todo.
+
+    :param dict properties: The todo's properties, mapping their (lowercase)
+        names to their values: strings, integers, lists of strings (for
+        ``categories``), or dates and aware datetimes. ``rrule`` is written
+        as is.
+    :returns: The calendar, as bytes.
+    """
+    lines = [
+        'BEGIN:VCALENDAR',
+        'VERSION:{}'.format(version),
+        'PRODID:{}'.format(escape(prodid)),
+        'BEGIN:VTODO',
+    ]
+    lines.extend(
+        serialize_property(name, properties[name])
+        for name in sorted(properties)
+    )
+    lines.extend(['END:VTODO', 'END:VCALENDAR', ''])
+    return '\r\n'.join(fold(line) for line in lines).encode('utf-8')
+
+
+def serialize_property(name, value):
+    """
+    Serializes a property (see :func:`serialize_new`) as an unfolded content
+    line.
+    """
+    name = name.upper()
+    if isinstance(value, date):
+        return format_datetime(name, value)
+    if isinstance(value, int):
+        return '{}:{}'.format(name, value)
+    if isinstance(value, list):
+        return '{}:{}'.format(name, ','.join(escape(item) for item in value))
+    if name == 'RRULE':
+        return '{}:{}'.format(name, value)
+    return '{}:{}'.format(name, escape(value))
+
+
+#: A content line, spanning ``text[start:end]`` (including any folds and the
+#: line break), with its name in upper case, and its unfolded value.
+ContentLine = namedtuple('ContentLine', 'start end name value')
+
+PHYSICAL_LINE_RE = re.compile(r'[^\r\n]*(?:\r\n|\r|\n)|[^\r\n]+$')
+# A property's name and parameters, up to the colon before its value.
+# Parameter values may be quoted, and contain colons.
+NAME_RE = re.compile(r'([A-Za-z0-9-]+)(?:[^:"]|"[^"]*")*:')
+
+
+def content_lines(text):
+    """
+    Splits an iCalendar file into its content lines, unfolding them.
+
+    :rtype: list(ContentLine)
+    """
+    lines = []
+    for match in PHYSICAL_LINE_RE.finditer(text):
+        physical = match.group().rstrip('\r\n')
+        if physical[:1] in (' ', '\t') and lines:
+            previous = lines[-1]
+            lines[-1] = previous._replace(
+                end=match.end(),
+                value=previous.value + physical[1:],
+            )
+            continue
+
+        name = NAME_RE.match(physical)
+        lines.append(ContentLine(
+            match.start(),
+            match.end(),
+            name.group(1).upper() if name else '',
+            physical[name.end():] if name else physical,
+        ))
+    return lines
+
+
+def patch(text, uid, changes):
+    """
+    Changes some of a todo's properties, leaving the rest of the file as is.
+
+    Changed properties are rewritten where they were, and new ones are added
+    after the todo's last property (before any nested components, such as
+    alarms, which must come last). Folding and line breaks are kept as they
+    were.
+
+    :param str text: The iCalendar file's contents.
+    :param str uid: The UID of the todo to change.
+    :param dict changes: The properties to change, mapping their (lowercase)
+        names to their new values (see :func:`serialize_new`), or to ``None``
+        to remove them.
+    :returns: The patched file, or ``None`` if the file doesn't have exactly
+        one todo with the given UID (eg: if it has overridden recurrences, or
+        is broken), in which case it must be serialized in full.
+    """
+    # Each todo's properties (excluding those of any nested components, like
+    # alarms), and the line new properties go before: its first nested
+    # component's BEGIN line, or its END line.
+    todos = []
+    properties = None
+    depth = 0
+    for line in content_lines(text):
+        if properties is None:
+            if line.name == 'BEGIN' and line.value.upper() == 'VTODO':
+                properties = []
+                insert_before = None
+        elif line.name == 'BEGIN':
+            depth += 1
+            insert_before = insert_before or line
+        elif line.name == 'END' and depth:
+            depth -= 1
+        elif line.name == 'END':
+            todos.append((properties, insert_before or line))
+            properties = None
+        elif not depth:
+            properties.append(line)
+
+    matching = [
+        (properties, insert_before) for properties, insert_before in todos
+        if [line.value for line in properties if line.name == 'UID'] == [uid]
+    ]
+    if properties is not None or len(matching) != 1:
+        return None
+    properties, insert_before = matching[0]
+
+    newline = re.search(r'\r\n|\r|\n', text)
+    newline = newline.group() if newline else '\r\n'
+    edits = []
+    for name in sorted(changes):
+        value = changes[name]
+        new = ''
+        if value:
+            new = fold(serialize_property(name, value)).replace(
+                '\r\n',
+                newline,
+            ) + newline
+
+        existing = [line for line in properties if line.name == name.upper()]
+        if existing:
+            edits.append((existing[0].start, existing[0].end, new))
+            edits.extend((line.start, line.end, '') for line in existing[1:])
+        elif new:
+            edits.append((insert_before.start, insert_before.start, new))
+
+    for start, end, new in sorted(edits, key=lambda edit: edit[0])[::-1]:
+        text = text[:start] + new + text[end:]
+    return text
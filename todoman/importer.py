@@ -0,0 +1,291 @@
+"""
+Bulk import of todos from iCalendar files.
+
+Source calendars are read as a stream, and each VTODO is written into its own
+file (along with any timezones it references), copying its original lines
+as-is. Files are written in parallel, in batches, and their cache entries are
+inserted directly, so that nothing needs to be re-parsed afterwards.
+"""
+import logging
+import os
+import re
+import socket
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
+
+from todoman.durability import AtomicBatch, BATCH
+from todoman.model import _getmtime
+
+logger = logging.getLogger(name=__name__)
+
+#: How many todos are written (and, in batch mode, synced) at once.
+BATCH_SIZE = 500
+
+#: How many files are written in parallel.
+WORKERS = 8
+
+#: What to do with todos whose UID is already in the target list.
+SKIP = 'skip'
+REPLACE = 'replace'
+DUPLICATE_MODES = (SKIP, REPLACE)
+
+HEADER = b'BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:io.barrera.todoman\r\n'
+FOOTER = b'END:VCALENDAR\r\n'
+
+# UIDs which can safely be used as file names.
+SAFE_UID_RE = re.compile(r'^[\w@+-][\w@.+-]{0,200}$')
+TZID_RE = re.compile(rb'^TZID:(.*?)\r?$', re.MULTILINE | re.IGNORECASE)
+
+ImportResult = namedtuple(
+    'ImportResult',
+    ['imported', 'replaced', 'skipped', 'failed'],
+)
+
+
+class Entry:
+    def __init__(self, uid, path, data, component, id=None):
+        self.uid = uid
+        self.path = path
+        self.data = data
+        self.component = component
+        self.id = id
+
+
+def split_calendar(stream):
+    """
+    Splits a calendar into its VTODOs, without reading it all at once.
+
+    :param stream: A binary file-like object.
+    :returns: A generator of ``(vtodo, timezones, position)`` tuples, where
+        ``vtodo`` is the VTODO's original bytes, ``timezones`` are the
+        VTIMEZONEs it references, and ``position`` is how many bytes of
+        ``stream`` have been read so far.
+    """
+    # Timezones are expected to precede the components that use them.
+    timezones = OrderedDict()
+    lines = None
+    depth = 0
+    position = 0
+
+    for line in stream:
+        position += len(line)
+        name = line.rstrip(b'\r\n').upper()
+
+        if lines is None:
+            if name in (b'BEGIN:VTODO', b'BEGIN:VTIMEZONE'):
+                lines = [line]
+                depth = 1
+            continue
+
+        lines.append(line)
+        if name.startswith(b'BEGIN:'):
+            depth += 1
+        elif name.startswith(b'END:'):
+            depth -= 1
+
+        if depth:
+            continue
+
+        data = b''.join(lines)
+        if not data.endswith(b'\n'):
+            data += b'\r\n'
+        lines = None
+
+        if name == b'END:VTIMEZONE':
+            match = TZID_RE.search(data)
+            if match:
+                timezones[match.group(1)] = data
+        else:
+            yield (
+                data,
+                [tz for tzid, tz in timezones.items() if tzid in data],
+                position,
+            )
+
+
+class Importer:
+    """
+    Imports todos into a list.
+
+    :param Database database: The database to import into.
+    :param List list: The list to import into.
+    :param str duplicates: What to do with todos whose UID is already in the
+        list (or earlier in the source): one of ``DUPLICATE_MODES``.
+    :param str durability: How to sync written files. See
+        :mod:`todoman.durability`.
+    """
+
+    def __init__(
+        self,
+        database,
+        list,
+        duplicates=SKIP,
+        durability=BATCH,
+        workers=WORKERS,
+        batch_size=BATCH_SIZE,
+    ):
+        if duplicates not in DUPLICATE_MODES:
+            raise ValueError('Unknown duplicates mode: {}'.format(duplicates))
+
+        self.database = database
+        self.list = list
+        self.duplicates = duplicates
+        self.writer = AtomicBatch(durability)
+        self.workers = workers
+        self.batch_size = batch_size
+
+    def run(self, stream, progress=None):
+        """
+        Imports all todos in ``stream``.
+
+        :param stream: A binary file-like object with an iCalendar.
+        :param progress: If provided, called with the amount of bytes read so
+            far, each time a todo is read.
+        :rtype: ImportResult
+        """
+        cache = self.database.cache
+        timings = self.database.timings
+        counts = dict.fromkeys(ImportResult._fields, 0)
+
+        # Maps UIDs to (id, path, todos in that file) for the list's todos
+        # (including those imported so far).
+        existing = cache.uids(self.list.name)
+        batch = OrderedDict()
+
+        with ThreadPoolExecutor(self.workers) as executor:
+            try:
+                components = split_calendar(stream)
+                while True:
+                    with timings.phase('parse') as phase:
+                        item = next(components, None)
+                        if item is None:
+                            break
+                        entry = self._entry(*item[:2])
+                        phase.count += 1
+
+                    if progress:
+                        progress(item[2])
+
+                    if not entry:
+                        counts['failed'] += 1
+                        continue
+
+                    if entry.uid in batch:
+                        # Duplicated within the source, and not written yet.
+                        # This is counted as if the first copy had already
+                        # been written, so counts don't depend on batches.
+                        if self.duplicates == SKIP:
+                            counts['skipped'] += 1
+                            continue
+                        counts['replaced'] += 1
+                        entry.id = batch[entry.uid].id
+                        entry.path = batch[entry.uid].path
+                        batch[entry.uid] = entry
+                        continue
+
+                    if entry.uid in existing:
+                        if not self._replaces(entry, existing[entry.uid]):
+                            counts['skipped'] += 1
+                            continue
+                        counts['replaced'] += 1
+                    else:
+                        counts['imported'] += 1
+
+                    batch[entry.uid] = entry
+                    if len(batch) >= self.batch_size:
+                        self._flush(executor, batch.values(), existing)
+                        batch.clear()
+
+                self._flush(executor, batch.values(), existing)
+            except BaseException:
+                self.writer.abort()
+                raise
+            finally:
+                with timings.phase('commit'):
+                    cache.save_to_disk()
+
+        return ImportResult(**counts)
+
+    def _entry(self, data, timezones):
+        import icalendar
+
+        try:
+            component = icalendar.Todo.from_ical(data)
+        except ValueError:
+            logger.warning('Skipping invalid todo:\n%s', data.decode(
+                'utf-8',
+                'replace',
+            ))
+            return None
+
+        uid = component.get('uid')
+        if not uid:
+            uid = '{}@{}'.format(uuid4().hex, socket.gethostname())
+            component.add('uid', uid)
+            begin, rest = data.split(b'\n', 1)
+            data = b'\n'.join([
+                begin,
+                'UID:{}\r'.format(uid).encode('utf-8'),
+                rest,
+            ])
+        uid = str(uid)
+
+        path = None
+        if SAFE_UID_RE.match(uid):
+            path = os.path.join(self.list.path, '{}.ics'.format(uid))
+        if not path or os.path.exists(path):
+            path = os.path.join(self.list.path, '{}.ics'.format(uuid4().hex))
+
+        return Entry(
+            uid,
+            path,
+            HEADER + b''.join(timezones) + data + FOOTER,
+            component,
+        )
+
+    def _replaces(self, entry, existing):
+        if self.duplicates == SKIP:
+            return False
+
+        id, path, todos = existing
+        if todos > 1:
+            logger.warning(
+                'Not replacing %s, since %s contains other todos.',
+                entry.uid,
+                path,
+            )
+            return False
+
+        entry.id = id
+        entry.path = path
+        return True
+
+    def _flush(self, executor, entries, existing):
+        entries = [entry for entry in entries]
+
+        with self.database.timings.phase('write', len(entries)):
+            # Consume the results, so that errors are raised.
+            for _ in executor.map(
+                lambda entry: self.writer.write(entry.path, entry.data),
+                entries,
+            ):
+                pass
+            self.writer.commit()
+
+        cache = self.database.cache
+        with self.database.timings.phase('insert', len(entries)):
+            for entry in entries:
+                if entry.id:
+                    cache.expire_file(entry.path)
+                cache.add_file(
+                    self.list.name,
+                    entry.path,
+                    _getmtime(entry.path),
+                )
+                entry.id = cache.add_vtodo(
+                    entry.component,
+                    entry.path,
+                    entry.id,
+                )
+                existing[entry.uid] = (entry.id, entry.path, 1)
@@ -1,8 +1,20 @@
+import logging
+from collections import OrderedDict
+
 import urwid
 
 from todoman import widgets
+from todoman.exceptions import TodomanException
 
 _palette = [('error', 'light red', '')]
+_browser_palette = _palette + [('focus', 'standout', '')]
+
+#: How many todos are fetched from the cache at once while browsing.
+PAGE_SIZE = 100
+#: How many pages are kept in memory while browsing.
+CACHED_PAGES = 10
+#: How long (in seconds) to wait for more typing before re-filtering.
+FILTER_DELAY = 0.15
 
 
 class TodoEditor:
@@ -204,3 +216,303 @@ class TodoEditor:
     @property
     def priority(self):
         return self._priority.priority
+
+
+class TodoWalker(urwid.ListWalker):
+    """
+    Walks the todos matching some filters, fetching them from the cache a
+    page at a time.
+
+    Only a few pages are kept in memory, and rows are only rendered once
+    they're shown, so browsing is just as fast regardless of how many todos
+    match.
+
+    :param model.Database database: The database to read todos from.
+    :param dict filters: Filters for :meth:`~todoman.model.Cache.todos`.
+    :param make_row: Called with a todo, returns the widget that shows it.
+    """
+
+    def __init__(
+        self,
+        database,
+        filters,
+        make_row,
+        page_size=PAGE_SIZE,
+        cached_pages=CACHED_PAGES,
+    ):
+        self.database = database
+        self.filters = filters
+        self.make_row = make_row
+        self.page_size = page_size
+        self.cached_pages = cached_pages
+        self.focus = 0
+        self.reload()
+
+    def reload(self):
+        """Drops all fetched todos, eg: after filters or todos change."""
+        self._pages = OrderedDict()
+        self.count = self.database.count_todos(**self.filters)
+        self.focus = max(0, min(self.focus, self.count - 1))
+        self._modified()
+
+    def _page(self, number):
+        if number in self._pages:
+            self._pages.move_to_end(number)
+            return self._pages[number]
+
+        todos = self.database.todos(
+            limit=self.page_size,
+            offset=number * self.page_size,
+            **self.filters
+        )
+        # Rows are rendered lazily, the first time they're requested.
+        page = [[todo, None] for todo in todos]
+
+        self._pages[number] = page
+        if len(self._pages) > self.cached_pages:
+            self._pages.popitem(last=False)
+        return page
+
+    def _entry(self, position):
+        if not 0 <= position < self.count:
+            raise IndexError(position)
+        page = self._page(position // self.page_size)
+        offset = position % self.page_size
+        if offset >= len(page):
+            # Todos were removed since we counted them.
+            raise IndexError(position)
+        return page[offset]
+
+    def todo(self, position):
+        """Returns the todo at ``position``."""
+        return self._entry(position)[0]
+
+    @property
+    def focused_todo(self):
+        """The todo that has focus, or ``None`` if there are none."""
+        try:
+            return self.todo(self.focus)
+        except IndexError:
+            return None
+
+    def __getitem__(self, position):
+        entry = self._entry(position)
+        if entry[1] is None:
+            entry[1] = self.make_row(entry[0])
+        return entry[1]
+
+    def next_position(self, position):
+        if position + 1 >= self.count:
+            raise IndexError(position)
+        return position + 1
+
+    def prev_position(self, position):
+        if position <= 0:
+            raise IndexError(position)
+        return position - 1
+
+    def set_focus(self, position):
+        self.focus = position
+        self._modified()
+
+    def positions(self, reverse=False):
+        if reverse:
+            return range(self.count - 1, -1, -1)
+        return range(self.count)
+
+
+class TodoBrowser:
+    """
+    A full-screen, scrollable, list of todos.
+
+    Todos are read from the cache as they're scrolled into view, so even
+    huge lists open instantly. Typing a filter narrows down the list, and
+    todos can be completed, cancelled or re-prioritised in place.
+    """
+
+    HELP = [
+        ('Up/Down, PgUp/PgDn, Home/End', 'Move'),
+        ('/', 'Filter by summary (Enter or Esc to return)'),
+        ('d', 'Toggle done'),
+        ('c', 'Cancel'),
+        ('+', 'Higher priority'),
+        ('-', 'Lower priority'),
+        ('q', 'Quit'),
+        ('F1', 'Toggle help'),
+    ]
+
+    def __init__(self, database, formatter, filters, hide_list=False):
+        """
+        :param model.Database database: The database to read todos from.
+        :param formatter: The formatter used to render dates and priorities.
+        :param dict filters: Filters for :meth:`~todoman.model.Cache.todos`.
+        """
+        self.database = database
+        self.formatter = formatter
+        self.hide_list = hide_list
+        self._loop = None
+        self._filter_alarm = None
+        self._due_width = len(formatter.format_datetime(formatter.now))
+
+        filters = dict(filters)
+        filters['grep'] = filters.get('grep') or ''
+        self.walker = TodoWalker(database, filters, self._make_row)
+        urwid.connect_signal(self.walker, 'modified', self._update_status)
+
+        self._filter = widgets.ExtendedEdit(
+            parent=self,
+            caption='Filter: ',
+            edit_text=filters['grep'],
+        )
+        urwid.connect_signal(self._filter, 'change', self._filter_changed)
+
+        self._status = urwid.Text('')
+        self._help_text = urwid.Text('\n'.join(
+            ' {}: {}'.format(k, v) for k, v in self.HELP
+        ))
+
+        self._ui = urwid.Frame(
+            urwid.ListBox(self.walker),
+            header=self._filter,
+            footer=self._status,
+        )
+        self._update_status()
+
+    def _make_row(self, todo):
+        due = self.formatter.format_datetime(todo.due)
+        padding = ' ' * (self._due_width - len(due) + 1)
+        if todo.due and todo.due <= self._now_for(todo.due) and \
+                not todo.is_completed:
+            due = ('error', due)
+
+        summary = todo.summary
+        if not self.hide_list:
+            summary = '{} @{}'.format(summary, todo.list.name)
+
+        text = widgets.SelectableText(
+            [
+                '[{}] {:<3} '.format(
+                    'X' if todo.is_completed else ' ',
+                    self.formatter.format_priority_compact(todo.priority),
+                ),
+                due,
+                padding,
+                summary,
+            ],
+            wrap='clip',
+        )
+        return urwid.AttrMap(text, None, 'focus')
+
+    def _now_for(self, dt):
+        if hasattr(dt, 'hour'):
+            return self.formatter.now
+        return self.formatter.now.date()
+
+    def _update_status(self):
+        self.set_status('{} tasks. Press F1 for help.'.format(
+            self.walker.count
+        ))
+
+    def set_status(self, text):
+        self._status.set_text(text)
+
+    def _toggle_help(self):
+        if self._ui.footer is self._help_text:
+            self._ui.footer = self._status
+        else:
+            self._ui.footer = self._help_text
+
+    def _filter_changed(self, edit, text):
+        self.walker.filters['grep'] = text
+        if not self._loop:
+            self._apply_filter()
+            return
+
+        # Wait until typing pauses, rather than re-querying on each key.
+        if self._filter_alarm:
+            self._loop.remove_alarm(self._filter_alarm)
+        self._filter_alarm = self._loop.set_alarm_in(
+            FILTER_DELAY,
+            lambda loop, data: self._apply_filter(),
+        )
+
+    def _apply_filter(self):
+        self._filter_alarm = None
+        self.walker.focus = 0
+        self.walker.reload()
+
+    def _update_todo(self, action):
+        todo = self.walker.focused_todo
+        if todo is None:
+            return
+
+        try:
+            # Re-read the todo, to make sure it's writable and up to date.
+            todo = self.database.todo(todo.id)
+            action(todo)
+            self.database.save(todo)
+        except TodomanException as e:
+            self.set_status(('error', str(e)))
+            return
+
+        self.walker.reload()
+
+    def _toggle_done(self, todo):
+        if todo.is_completed:
+            todo.status = 'NEEDS-ACTION'
+            todo.completed_at = None
+            todo.percent_complete = 0
+        else:
+            todo.complete()
+
+    def _change_priority(self, delta):
+        def change(todo):
+            ranges = widgets.PrioritySelector.RANGES
+            for i, r in enumerate(ranges):
+                if (todo.priority or 0) in r:
+                    i = max(0, min(i + delta, len(ranges) - 1))
+                    todo.priority = ranges[i][0]
+                    return
+
+        return change
+
+    def browse(self):
+        """Shows the browser, until the user quits."""
+        self._loop = urwid.MainLoop(
+            self._ui,
+            palette=_browser_palette,
+            unhandled_input=self._keypress,
+            handle_mouse=False,
+        )
+        # Warnings would be written over the UI.
+        logging.disable(logging.WARNING)
+        try:
+            self._loop.run()
+        except KeyboardInterrupt:
+            self._loop.stop()  # Try to leave terminal in usable state
+        finally:
+            logging.disable(logging.NOTSET)
+        self._loop = None
+
+    def _keypress(self, key):
+        if key.lower() == 'f1':
+            self._toggle_help()
+        elif self._ui.focus_position == 'header':
+            if key in ('enter', 'esc'):
+                self._ui.focus_position = 'body'
+        elif key == '/':
+            self._ui.focus_position = 'header'
+        elif key == 'home':
+            self.walker.set_focus(0)
+        elif key == 'end':
+            self.walker.set_focus(max(0, self.walker.count - 1))
+        elif key == 'd':
+            self._update_todo(self._toggle_done)
+        elif key == 'c':
+            self._update_todo(lambda todo: todo.cancel())
+        elif key == '+':
+            self._update_todo(self._change_priority(1))
+        elif key == '-':
+            self._update_todo(self._change_priority(-1))
+        elif key == 'q':
+            raise urwid.ExitMainLoop()
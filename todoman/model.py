@@ -1,18 +1,21 @@
+import copy
+import functools
+import json
 import logging
 import os
+import re
 import socket
 import sqlite3
-from datetime import date, datetime, timedelta
+from collections import OrderedDict
+from datetime import date, datetime, time, timedelta
 from os.path import normpath, split
 from uuid import uuid4
 
-import icalendar
-import pytz
-from atomicwrites import AtomicWriter
-from dateutil.rrule import rrulestr
 from dateutil.tz import tzlocal
 
 from todoman import exceptions
+from todoman.durability import AtomicBatch, FULL
+from todoman.timings import Timings
 
 logger = logging.getLogger(name=__name__)
 
@@ -21,6 +24,19 @@ logger = logging.getLogger(name=__name__)
 # it once.
 LOCAL_TIMEZONE = tzlocal()
 
+#: How many compiled recurrence rules to keep around.
+RRULE_CACHE_SIZE = 1024
+
+#: The parse status of a cached file: it was read, it had no todos (eg: it
+#: only has events), or it couldn't be read (see
+#: :meth:`Database.file_statuses`).
+FILE_OK = 'ok'
+FILE_NO_VTODO = 'no-vtodo'
+FILE_ERROR = 'error'
+
+# Files which don't match this can't have any todos, and aren't parsed.
+_VTODO_RE = re.compile(rb'^BEGIN:VTODO\b', re.IGNORECASE | re.MULTILINE)
+
 
 class cached_property:  # noqa
     '''A read-only @property that is only evaluated once. Only usable on class
@@ -40,6 +56,105 @@ class cached_property:  # noqa
         return result
 
 
+def compile_rrule(rule, dtstart):
+    """
+    Returns the ``dateutil.rrule`` for a recurrence rule string.
+
+    Compiled rules are cached, since parsing them is relatively expensive and
+    the same rules tend to be used over and over.
+    """
+    # Equal datetimes in different timezones would share a cache entry, but
+    # expand differently, so the timezone is part of the key.
+    tz_key = repr(getattr(dtstart, 'tzinfo', None))
+    return _compile_rrule(rule, dtstart, tz_key)
+
+
+@functools.lru_cache(maxsize=RRULE_CACHE_SIZE)
+def _compile_rrule(rule, dtstart, tz_key):
+    from dateutil.rrule import rrulestr
+
+    return rrulestr(rule, dtstart=dtstart)
+
+
+# Recurrences with a fixed period can be rebased without changing their
+# occurrences.
+FIXED_PERIODS = {
+    'WEEKLY': timedelta(weeks=1),
+    'DAILY': timedelta(days=1),
+    'HOURLY': timedelta(hours=1),
+    'MINUTELY': timedelta(minutes=1),
+    'SECONDLY': timedelta(seconds=1),
+}
+
+FREQ_RE = re.compile(r'\bFREQ=(\w+)', re.IGNORECASE)
+INTERVAL_RE = re.compile(r'\bINTERVAL=(\d+)', re.IGNORECASE)
+COUNT_RE = re.compile(r'\bCOUNT=(\d+)', re.IGNORECASE)
+# An UNTIL in UTC ends with a Z, while dates and local times don't.
+UNTIL_RE = re.compile(r'\bUNTIL=[0-9T]+(Z?)', re.IGNORECASE)
+
+
+def next_occurrence(rule, dtstart, after):
+    """
+    Returns the first occurrence of a recurrence rule after ``after``.
+
+    Unbounded (or ``UNTIL``-bounded) rules with a fixed period are rebased to
+    the last period before ``after`` first, so that long-overdue series
+    needn't be expanded all the way from ``dtstart``. ``COUNT``-bounded rules
+    are expanded from ``dtstart``, since their end depends on it.
+
+    :returns: The occurrence, or ``None`` if the series ends before ``after``.
+    """
+    recurrence = compile_rrule(rule, dtstart)
+    # Only a single rule can be rebased as a whole.
+    freqs = FREQ_RE.findall(rule)
+    period = FIXED_PERIODS.get(freqs[0].upper()) if len(freqs) == 1 else None
+
+    if period and not COUNT_RE.search(rule) and after > dtstart:
+        interval = INTERVAL_RE.search(rule)
+        if interval:
+            period *= int(interval.group(1))
+        # Step back one extra period, in case a DST change shifted `after`.
+        periods = (after - dtstart) // period - 1
+        if periods > 0:
+            recurrence = compile_rrule(rule, dtstart + period * periods)
+
+    return recurrence.after(after)
+
+
+def _as_datetime(dt):
+    """Casts dates and naive datetimes to aware datetimes."""
+    if not isinstance(dt, datetime):
+        dt = datetime.combine(dt, time())
+    if not dt.tzinfo:
+        dt = dt.replace(tzinfo=LOCAL_TIMEZONE)
+    return dt
+
+
+def _rrule_dtstart(rule, dt):
+    """
+    Casts a date or datetime to the start of a recurrence rule's expansion.
+
+    dateutil refuses to mix an aware start with an ``UNTIL`` which isn't in
+    UTC (as for all-day or floating todos), so the start is naive (in local
+    time) for those, and aware otherwise.
+    """
+    match = UNTIL_RE.search(rule)
+    if not match or match.group(1):
+        return _as_datetime(dt)
+    return _as_naive(dt)
+
+
+def _as_naive(dt):
+    """Casts dates and aware datetimes to naive datetimes, in local time."""
+    dt = _as_datetime(dt).astimezone(LOCAL_TIMEZONE)
+    return dt.replace(tzinfo=None)
+
+
+def _like(dt, reference):
+    """Casts a date or datetime to be comparable with ``reference``."""
+    return _as_naive(dt) if not reference.tzinfo else _as_datetime(dt)
+
+
 class Todo:
     """
     Represents a task/todo, and wrapps around icalendar.Todo.
@@ -99,6 +214,18 @@ class Todo:
                 'Must not be an absolute path: {}'.format(self.filename)
             )
         self.mtime = mtime or datetime.now()
+        # The field values when the todo was read (see _snapshot).
+        self._original = None
+
+    def _snapshot(self):
+        """
+        Remembers the todo's current field values, so that only those
+        changed afterwards are rewritten when it's saved.
+        """
+        self._original = {
+            field: copy.copy(getattr(self, field))
+            for field in VtodoWriter.FIELD_MAP
+        }
 
     def clone(self):
         """
@@ -214,21 +341,76 @@ class Todo:
         if not dt:
             return None
 
-        recurrence = rrulestr(self.rrule, dtstart=dt)
+        recurrence = compile_rrule(self.rrule, dt)
 
         return recurrence.after(dt)
 
-    def _create_next_instance(self):
+    def _catch_up_dt(self, dt, now):
+        if not dt:
+            return None
+
+        dtstart = _rrule_dtstart(self.rrule, dt)
+        occurrence = next_occurrence(self.rrule, dtstart, _like(now, dtstart))
+        if not occurrence:
+            return None
+        if not isinstance(dt, datetime):
+            return occurrence.date()
+        if not dt.tzinfo:
+            return _as_naive(occurrence)
+        return _as_datetime(occurrence)
+
+    def _remaining_rrule(self, old, new):
+        """
+        Returns the recurrence rule for an instance moved from ``old`` to
+        ``new``, with its ``COUNT`` (if any) reduced by the skipped
+        occurrences.
+        """
+        match = COUNT_RE.search(self.rrule)
+        if not match or not old or not new:
+            return self.rrule
+
+        new = _as_datetime(new)
+        skipped = 0
+        for occurrence in compile_rrule(self.rrule, _as_datetime(old)):
+            if occurrence >= new:
+                break
+            skipped += 1
+
+        return COUNT_RE.sub(
+            'COUNT={}'.format(int(match.group(1)) - skipped),
+            self.rrule,
+        )
+
+    def _create_next_instance(self, catch_up=False):
         copy = self.clone()
-        copy.due = self._apply_recurrence_to_dt(self.due)
-        copy.start = self._apply_recurrence_to_dt(self.start)
+        if catch_up:
+            now = datetime.now(LOCAL_TIMEZONE)
+            copy.due = self._catch_up_dt(self.due, now)
+            if self.due and self.start:
+                # Keep the start the same distance from the due date.
+                copy.start = (
+                    self.start + (copy.due - self.due) if copy.due else None
+                )
+            else:
+                copy.start = self._catch_up_dt(self.start, now)
+        else:
+            copy.due = self._apply_recurrence_to_dt(self.due)
+            copy.start = self._apply_recurrence_to_dt(self.start)
+
+        anchor, new_anchor = (
+            (self.due, copy.due) if self.due else (self.start, copy.start)
+        )
+        if anchor and not new_anchor:
+            # The series has ended.
+            return None
+        copy.rrule = self._remaining_rrule(anchor, new_anchor)
 
         assert copy.uid != self.uid
 
         # TODO: Push copy's alarms.
         return copy
 
-    def complete(self):
+    def complete(self, catch_up=False):
         """
         Immediately completes this todo
 
@@ -237,17 +419,59 @@ class Todo:
 
         If this todo belongs to a series, newly created todo are added to the
         ``related`` list.
+
+        :param bool catch_up: For recurring todos, skip any occurrences that
+            have already passed, so that the next instance is the first one
+            after now, rather than the one after this one.
         """
         if self.is_recurring:
-            related = self._create_next_instance()
+            related = self._create_next_instance(catch_up)
+            self.rrule = None
             if related:
-                self.rrule = None
                 self.related.append(related)
 
         self.completed_at = datetime.now(tz=LOCAL_TIMEZONE)
         self.percent_complete = 100
         self.status = 'COMPLETED'
 
+    def occurrences(self, start, end):
+        """
+        Returns the occurrences of this todo between ``start`` and ``end``
+        (inclusive).
+
+        Occurrences are based on the due date (or the start date, for todos
+        with no due date). Non-recurring todos have at most one occurrence.
+        Dates are returned for all-day todos, and datetimes otherwise.
+
+        :param datetime start: The beginning of the window.
+        :param datetime end: The end of the window.
+        """
+        anchor = self.due or self.start
+        if not anchor:
+            return []
+
+        is_date = not isinstance(anchor, datetime)
+        start = _as_datetime(start)
+        end = _as_datetime(end)
+
+        if self.is_recurring:
+            try:
+                dtstart = _rrule_dtstart(self.rrule, anchor)
+                recurrence = compile_rrule(self.rrule, dtstart)
+                occurrences = recurrence.between(
+                    _like(start, dtstart),
+                    _like(end, dtstart),
+                    inc=True,
+                )
+            except (TypeError, ValueError):
+                logger.warning('Invalid recurrence rule for %s.', self.uid)
+            else:
+                if is_date:
+                    return [dt.date() for dt in occurrences]
+                return [_as_datetime(dt) for dt in occurrences]
+
+        return [anchor] if start <= _as_datetime(anchor) <= end else []
+
     @cached_property
     def path(self):
         return os.path.join(self.list.path, self.filename)
@@ -301,10 +525,14 @@ class VtodoWriter:
         if not dt.tzinfo:
             dt = dt.replace(tzinfo=LOCAL_TIMEZONE)
 
+        import pytz
+
         return dt.astimezone(pytz.UTC)
 
     def serialize_field(self, name, value):
         if name in Todo.RRULE_FIELDS:
+            import icalendar
+
             return icalendar.vRecur.from_ical(value)
         if name in Todo.DATETIME_FIELDS:
             return self.normalize_datetime(value)
@@ -327,6 +555,8 @@ class VtodoWriter:
     def serialize(self, original=None):
         """Serialize a Todo into a VTODO."""
         if not original:
+            import icalendar
+
             original = icalendar.Todo()
         self.vtodo = original
 
@@ -341,21 +571,86 @@ class VtodoWriter:
         return self.vtodo
 
     def _read(self, path):
+        import icalendar
+
         with open(path, 'rb') as f:
             cal = f.read()
             cal = icalendar.Calendar.from_ical(cal)
             for component in cal.walk('VTODO'):
                 return component
 
-    def write(self):
+    def write(self, writer=None):
+        """
+        Writes the todo to its file.
+
+        New files are written without building a VTODO (see
+        :mod:`todoman.ical`), and existing ones are patched where possible,
+        in which case ``None`` is returned.
+
+        :param AtomicBatch writer: Writes the file. By default, it's written
+            (and synced) immediately. Otherwise, the file may only be written
+            when the writer's batch is committed.
+        :returns: The written VTODO, if the file was rewritten in full.
+        """
+        writer = writer or AtomicBatch()
         if os.path.exists(self.todo.path):
-            self._write_existing(self.todo.path)
+            self._write_existing(self.todo.path, writer)
         else:
-            self._write_new(self.todo.path)
+            self._write_new(self.todo.path, writer)
 
+        self.todo._snapshot()
         return self.vtodo
 
-    def _write_existing(self, path):
+    def _properties(self, fields):
+        """
+        Returns the todo's properties for ``fields``, as taken by
+        :mod:`todoman.ical`, with ``None`` for empty ones.
+        """
+        properties = {}
+        for source in fields:
+            value = getattr(self.todo, source)
+            if isinstance(value, datetime) and not value.tzinfo:
+                value = value.replace(tzinfo=LOCAL_TIMEZONE)
+            properties[self.FIELD_MAP[source]] = value or None
+        return properties
+
+    def _patch(self, data):
+        """
+        Rewrites only the properties which changed since the todo was read
+        from the cache.
+
+        :returns: The patched file, or ``None`` if it needs to be serialized
+            in full (eg: if the todo wasn't read from the cache, or the file
+            has several instances of it).
+        """
+        from todoman import ical
+
+        original = self.todo._original
+        if original is None or original['uid'] != self.todo.uid:
+            return None
+        try:
+            text = data.decode('utf-8')
+        except UnicodeDecodeError:
+            return None
+
+        changed = [
+            field for field in self.FIELD_MAP
+            if getattr(self.todo, field) != original[field]
+        ]
+        text = ical.patch(text, self.todo.uid, self._properties(changed))
+        return text.encode('utf-8') if text is not None else None
+
+    def _write_existing(self, path, writer):
+        with open(path, 'rb') as f:
+            data = self._patch(f.read())
+        if data is not None:
+            writer.write(path, data)
+            # The cache is updated from the todo itself.
+            self.vtodo = None
+            return
+
+        import icalendar
+
         original = self._read(path)
         vtodo = self.serialize(original)
 
@@ -365,21 +660,22 @@ class VtodoWriter:
                 if component.get('uid', None) == self.todo.uid:
                     cal.subcomponents[index] = vtodo
 
-        with AtomicWriter(path, overwrite=True).open() as f:
-            f.write(cal.to_ical().decode("UTF-8"))
+        writer.write(path, cal.to_ical())
 
-    def _write_new(self, path):
-        vtodo = self.serialize()
+    def _write_new(self, path, writer):
+        from todoman import ical
 
-        c = icalendar.Calendar()
-        c.add_component(vtodo)
+        properties = {
+            name: value
+            for name, value in self._properties(self.FIELD_MAP).items()
+            if value
+        }
 
-        with AtomicWriter(path).open() as f:
-            c.add('prodid', 'io.barrera.todoman')
-            c.add('version', '2.0')
-            f.write(c.to_ical().decode("UTF-8"))
-
-        return vtodo
+        writer.write(
+            path,
+            ical.serialize_new(properties, prodid='io.barrera.todoman'),
+        )
+        self.vtodo = None
 
 
 class Cache:
@@ -395,13 +691,28 @@ class Cache:
     may be used for filtering/sorting.
     """
 
-    SCHEMA_VERSION = 7
+    SCHEMA_VERSION = 13
 
-    def __init__(self, path):
+    def __init__(self, path, timings=None, query_log=None):
+        """
+        :param Timings timings: Where to record time spent in queries.
+        :param QueryLog query_log: If provided, all statements are timed and
+            recorded in this log.
+        """
         self.cache_path = str(path)
+        self.timings = timings or Timings()
         os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
 
-        self._conn = sqlite3.connect(self.cache_path)
+        if query_log:
+            from todoman.querylog import InstrumentedConnection
+
+            self._conn = sqlite3.connect(
+                self.cache_path,
+                factory=InstrumentedConnection,
+            )
+            self._conn.query_log = query_log
+        else:
+            self._conn = sqlite3.connect(self.cache_path)
         self._conn.row_factory = sqlite3.Row
         self._conn.execute("PRAGMA foreign_keys = ON")
 
@@ -420,19 +731,41 @@ class Cache:
         except sqlite3.OperationalError:
             return False
 
+    # Whether the todo being updated depends on any unfinished todo.
+    _BLOCKED_SQL = '''EXISTS (
+        SELECT 1
+          FROM related_to AS dependency
+          JOIN todos AS prerequisite ON prerequisite.uid = dependency.uid
+         WHERE dependency.todo_id = todos.id
+           AND dependency.reltype = 'DEPENDS-ON'
+           AND prerequisite.id != todos.id
+           AND prerequisite.status NOT IN ('COMPLETED', 'CANCELLED')
+    )'''
+
     def create_tables(self):
         if self.is_latest_version():
             return
 
         self._conn.executescript(
             '''
+            DROP TABLE IF EXISTS meta;
             DROP TABLE IF EXISTS lists;
             DROP TABLE IF EXISTS files;
             DROP TABLE IF EXISTS todos;
+            DROP TABLE IF EXISTS views;
+            DROP TABLE IF EXISTS view_todos;
+            DROP TABLE IF EXISTS related_to;
         '''
         )
 
-        self._conn.execute('CREATE TABLE IF NOT EXISTS meta ("version" INT)')
+        self._conn.execute(
+            '''
+            CREATE TABLE IF NOT EXISTS meta (
+                "version" INT,
+                "last_refresh" REAL
+            );
+        '''
+        )
 
         self._conn.execute(
             'INSERT INTO meta (version) VALUES (?)',
@@ -458,6 +791,8 @@ class Cache:
                 "path" TEXT PRIMARY KEY,
                 "list_name" TEXT,
                 "mtime" INTEGER,
+                "parse_status" TEXT NOT NULL DEFAULT 'ok',
+                "parse_error" TEXT,
 
                 CONSTRAINT path_unique UNIQUE (path),
                 FOREIGN KEY(list_name) REFERENCES lists(name) ON DELETE CASCADE
@@ -489,12 +824,135 @@ class Cache:
                 "sequence" INTEGER,
                 "last_modified" INTEGER,
                 "rrule" TEXT,
+                "blocked" INTEGER NOT NULL DEFAULT 0,
 
                 FOREIGN KEY(file_path) REFERENCES files(path) ON DELETE CASCADE
             );
         '''
         )
 
+        # Indexes for the columns most often filtered on, including by
+        # expressions (see todoman.expressions).
+        self._conn.executescript(
+            '''
+            CREATE INDEX IF NOT EXISTS files_list_name ON files(list_name);
+            CREATE INDEX IF NOT EXISTS todos_file_path ON todos(file_path);
+            CREATE INDEX IF NOT EXISTS todos_due ON todos(due);
+            CREATE INDEX IF NOT EXISTS todos_start ON todos(start);
+            CREATE INDEX IF NOT EXISTS todos_priority ON todos(priority);
+            CREATE INDEX IF NOT EXISTS todos_completed_at
+                ON todos(completed_at);
+            CREATE INDEX IF NOT EXISTS todos_startable
+                ON todos(blocked, start);
+        '''
+        )
+
+        # Each todo's RELATED-TO properties, ie: the UIDs of its parents and
+        # of the todos it depends on.
+        self._conn.executescript(
+            '''
+            CREATE TABLE IF NOT EXISTS related_to (
+                "todo_id" INTEGER,
+                "uid" TEXT,
+                "reltype" TEXT,
+
+                FOREIGN KEY(todo_id) REFERENCES todos(id) ON DELETE CASCADE
+            );
+
+            CREATE INDEX IF NOT EXISTS related_to_todo_id
+                ON related_to(todo_id);
+            CREATE INDEX IF NOT EXISTS related_to_uid
+                ON related_to(uid, reltype);
+            CREATE INDEX IF NOT EXISTS todos_uid ON todos(uid);
+        '''
+        )
+
+        # Todos are blocked while any todo they depend on is unfinished.
+        # Since todos are only ever inserted or deleted (including by
+        # cascades, when their file or list expires), these triggers keep the
+        # flags up to date: only the dependents of an inserted or deleted
+        # todo need to be checked again.
+        self._conn.executescript(
+            '''
+            CREATE TRIGGER IF NOT EXISTS related_to_blocked
+             AFTER INSERT ON related_to
+              WHEN NEW.reltype = 'DEPENDS-ON'
+             BEGIN
+                UPDATE todos SET blocked = {blocked} WHERE id = NEW.todo_id;
+               END;
+
+            CREATE TRIGGER IF NOT EXISTS todos_inserted_blocked
+             AFTER INSERT ON todos
+             BEGIN
+                UPDATE todos SET blocked = {blocked} WHERE id IN (
+                    SELECT todo_id FROM related_to
+                     WHERE uid = NEW.uid AND reltype = 'DEPENDS-ON'
+                );
+               END;
+
+            CREATE TRIGGER IF NOT EXISTS todos_deleted_blocked
+             AFTER DELETE ON todos
+             BEGIN
+                UPDATE todos SET blocked = {blocked} WHERE id IN (
+                    SELECT todo_id FROM related_to
+                     WHERE uid = OLD.uid AND reltype = 'DEPENDS-ON'
+                );
+               END;
+        '''.format(blocked=self._BLOCKED_SQL)
+        )
+
+        # Materialized views: each view's condition, and the todos matching
+        # it (see define_view).
+        self._conn.executescript(
+            '''
+            CREATE TABLE IF NOT EXISTS views (
+                "name" TEXT PRIMARY KEY,
+                "sql" TEXT,
+                "params" TEXT
+            );
+
+            CREATE TABLE IF NOT EXISTS view_todos (
+                "view" TEXT,
+                "todo_id" INTEGER,
+
+                PRIMARY KEY (view, todo_id),
+                FOREIGN KEY(view) REFERENCES views(name) ON DELETE CASCADE,
+                FOREIGN KEY(todo_id) REFERENCES todos(id) ON DELETE CASCADE
+            );
+
+            CREATE INDEX IF NOT EXISTS view_todos_todo_id
+                ON view_todos(todo_id);
+        '''
+        )
+
+    def is_fresh(self, max_age):
+        """
+        Returns whether the cache was last refreshed less than ``max_age``
+        seconds ago.
+        """
+        if not max_age:
+            return False
+
+        last_refresh = self._conn.execute(
+            'SELECT last_refresh FROM meta'
+        ).fetchone()[0]
+        if last_refresh is None:
+            return False
+
+        return 0 <= datetime.now().timestamp() - last_refresh < max_age
+
+    def set_refreshed(self, timestamp):
+        """Records when the cache was last refreshed."""
+        self._conn.execute('UPDATE meta SET last_refresh = ?', (timestamp,))
+
+    def file_mtime(self, path):
+        """Returns the cached mtime of a file, or ``None`` if it's unknown."""
+        result = self._conn.execute(
+            'SELECT mtime FROM files WHERE path = ?',
+            (path,),
+        ).fetchone()
+        return result['mtime'] if result else None
+
     def clear(self):
         self._conn.close()
         os.remove(self.cache_path)
@@ -555,6 +1013,40 @@ class Cache:
         except sqlite3.IntegrityError as e:
             raise exceptions.AlreadyExists('file', list_name) from e
 
+    def set_file_status(self, path, status, error=None):
+        """
+        Records whether a file could be parsed, and if not, why.
+
+        :param str status: One of ``FILE_OK``, ``FILE_NO_VTODO`` or
+            ``FILE_ERROR``.
+        :param str error: The error that reading the file failed with.
+        """
+        self._conn.execute(
+            '''
+            UPDATE files
+               SET parse_status = ?, parse_error = ?
+             WHERE path = ?
+            ''',
+            (status, error, path),
+        )
+
+    def file_statuses(self, statuses):
+        """
+        Returns the files with any of the given statuses, by path.
+
+        :returns: Rows with each file's ``path``, ``list_name``,
+            ``parse_status`` and ``parse_error``.
+        """
+        return self._conn.execute(
+            '''
+            SELECT path, list_name, parse_status, parse_error
+              FROM files
+             WHERE parse_status IN ({})
+             ORDER BY path
+            '''.format(', '.join(['?'] * len(statuses))),
+            statuses,
+        ).fetchall()
+
     def _serialize_datetime(self, todo, field):
         """
         Serialize a todo field in two value, the first one is the corresponding
@@ -590,13 +1082,116 @@ class Cache:
 
         return ','.join([str(category) for category in categories.cats])
 
+    def _serialize_relations(self, todo):
+        related = todo.get('related-to', [])
+        if not isinstance(related, list):
+            related = [related]
+
+        return {
+            (str(uid), uid.params.get('RELTYPE', 'PARENT').upper())
+            for uid in related
+        }
+
     def add_vtodo(self, todo, file_path, id=None):
         """
         Adds a todo into the cache.
 
         :param icalendar.Todo todo: The icalendar component object on which
         """
+        due, due_dt = self._serialize_datetime(todo, 'due')
+        start, start_dt = self._serialize_datetime(todo, 'dtstart')
+
+        params = (
+            file_path,
+            todo.get('uid'),
+            todo.get('summary'),
+            due,
+            due_dt,
+            start,
+            start_dt,
+            todo.get('priority', 0) or None,
+            self._serialize_datetime(todo, 'created')[0],
+            self._serialize_datetime(todo, 'completed')[0],
+            todo.get('percent-complete', None),
+            self._serialize_datetime(todo, 'dtstamp')[0],
+            todo.get('status', 'NEEDS-ACTION'),
+            todo.get('description', None),
+            todo.get('location', None),
+            self._serialize_categories(todo, 'categories'),
+            todo.get('sequence', 1),
+            self._serialize_datetime(todo, 'last-modified')[0],
+            self._serialize_rrule(todo, 'rrule'),
+        )
+
+        return self._insert_todo(
+            params,
+            self._serialize_relations(todo),
+            id,
+        )
+
+    def _serialize_todo_datetime(self, dt):
+        """
+        Serializes a :class:`Todo` date or datetime as
+        :meth:`_serialize_datetime` would once it's been written, ie: without
+        microseconds.
+        """
+        if not dt:
+            return None, None
+
+        is_date = isinstance(dt, date) and not isinstance(dt, datetime)
+        return _as_datetime(dt).replace(microsecond=0).timestamp(), is_date
+
+    def add_todo(self, todo, file_path, id=None, relations=()):
+        """
+        Adds a todo into the cache, as :meth:`add_vtodo` would once it's been
+        written, but without needing its VTODO.
+
+        :param Todo todo: The todo.
+        :param relations: Its ``RELATED-TO`` properties (see
+            :meth:`relations`), which aren't :class:`Todo` fields. New todos
+            have none.
+        """
+        due, due_dt = self._serialize_todo_datetime(todo.due)
+        start, start_dt = self._serialize_todo_datetime(todo.start)
+
+        params = (
+            file_path,
+            todo.uid or None,
+            todo.summary or None,
+            due,
+            due_dt,
+            start,
+            start_dt,
+            todo.priority or None,
+            self._serialize_todo_datetime(todo.created_at)[0],
+            self._serialize_todo_datetime(todo.completed_at)[0],
+            todo.percent_complete or None,
+            self._serialize_todo_datetime(todo.dtstamp)[0],
+            todo.status or 'NEEDS-ACTION',
+            todo.description or None,
+            todo.location or None,
+            ','.join(todo.categories),
+            todo.sequence or 1,
+            self._serialize_todo_datetime(todo.last_modified)[0],
+            todo.rrule or None,
+        )
+
+        return self._insert_todo(params, relations, id)
+
+    def relations(self, id):
+        """
+        Returns a cached todo's ``RELATED-TO`` properties, as a set of
+        ``(uid, reltype)`` tuples.
+        """
+        return {
+            (row['uid'], row['reltype'])
+            for row in self._conn.execute(
+                'SELECT uid, reltype FROM related_to WHERE todo_id = ?',
+                (id,),
+            )
+        }
 
+    def _insert_todo(self, params, relations, id=None):
         sql = '''
             INSERT INTO todos (
                 {}
@@ -623,33 +1218,10 @@ class Cache:
                 ?)
             '''
 
-        due, due_dt = self._serialize_datetime(todo, 'due')
-        start, start_dt = self._serialize_datetime(todo, 'dtstart')
-
-        if start and due:
-            start = None if start >= due else start
-
-        params = (
-            file_path,
-            todo.get('uid'),
-            todo.get('summary'),
-            due,
-            due_dt,
-            start,
-            start_dt,
-            todo.get('priority', 0) or None,
-            self._serialize_datetime(todo, 'created')[0],
-            self._serialize_datetime(todo, 'completed')[0],
-            todo.get('percent-complete', None),
-            self._serialize_datetime(todo, 'dtstamp')[0],
-            todo.get('status', 'NEEDS-ACTION'),
-            todo.get('description', None),
-            todo.get('location', None),
-            self._serialize_categories(todo, 'categories'),
-            todo.get('sequence', 1),
-            self._serialize_datetime(todo, 'last-modified')[0],
-            self._serialize_rrule(todo, 'rrule'),
-        )
+        # Todos which start after they're due are cached as having no start.
+        due, start = params[3], params[5]
+        if start and due and start >= due:
+            params = params[:5] + (None,) + params[6:]
 
         if id:
             params = (id,) + params
@@ -664,32 +1236,121 @@ class Cache:
         finally:
             cursor.close()
 
+        if relations:
+            self._conn.executemany(
+                'INSERT INTO related_to (todo_id, uid, reltype) '
+                'VALUES (?, ?, ?)',
+                [(rv, uid, reltype) for uid, reltype in relations],
+            )
+
+        if self._views:
+            self._match_views('AND todos.id = ?', [rv])
+
         return rv
 
-    def todos(
-        self,
-        lists=(),
-        priority=None,
-        location='',
-        category='',
-        grep='',
-        sort=(),
-        reverse=True,
-        due=None,
-        start=None,
-        startable=False,
-        status=(
-            'NEEDS-ACTION',
-            'IN-PROCESS',
-        )
-    ):
+    @cached_property
+    def _views(self):
+        """The conditions of all materialized views, by name."""
+        return {
+            row['name']: (row['sql'], json.loads(row['params']))
+            for row in self._conn.execute('SELECT * FROM views')
+        }
+
+    def define_view(self, name, **kwargs):
         """
-        Returns filtered cached todos, in a specified order.
+        Materializes a view: the todos matching the given filters are stored,
+        and kept up to date as todos are added, moved and removed, so that
+        they can be read cheaply with ``todos(view=name)``.
 
-        If no order is specified, todos are sorted by the following fields::
+        If the view exists with the same filters, it's left as is. Since
+        relative dates (eg: "today") are resolved when filters are parsed,
+        this rebuilds views whose filters use them as those dates change.
 
-            completed_at
-            -priority
+        :param kwargs: Filters, as for :meth:`todos`.
+        :returns: Whether the view had to be (re)built.
+        """
+        extra_where, params = self._todo_filters(**kwargs)
+        sql = ' '.join(extra_where)
+        if self._views.get(name) == (sql, params):
+            return False
+
+        # Rows for any previous definition are removed by the cascade.
+        self._conn.execute('DELETE FROM views WHERE name = ?', (name,))
+        self._conn.execute(
+            'INSERT INTO views (name, sql, params) VALUES (?, ?, ?)',
+            (name, sql, json.dumps(params)),
+        )
+        self.__dict__.pop('_views', None)
+
+        self._match_views('', [], names=[name])
+        return True
+
+    def drop_views(self, keep=()):
+        """
+        Removes all materialized views, except for those in ``keep``.
+
+        :returns: Whether any view was removed.
+        """
+        if not set(self._views) - set(keep):
+            return False
+
+        self._conn.execute(
+            'DELETE FROM views WHERE name NOT IN ({})'.format(
+                ', '.join(['?'] * len(keep))
+            ),
+            list(keep),
+        )
+        self.__dict__.pop('_views', None)
+        return True
+
+    def _match_views(self, condition, params, names=None):
+        """
+        Adds the todos matching ``condition`` to the materialized views whose
+        conditions they match.
+        """
+        for name, (sql, view_params) in self._views.items():
+            if names is not None and name not in names:
+                continue
+            self._conn.execute(
+                '''
+                INSERT OR IGNORE INTO view_todos (view, todo_id)
+                     SELECT ?, todos.id
+                       FROM todos, files
+                      WHERE todos.file_path = files.path {} {}
+                '''.format(condition, sql),
+                [name] + params + view_params,
+            )
+
+    def todos(
+        self,
+        lists=(),
+        priority=None,
+        location='',
+        category='',
+        grep='',
+        sort=(),
+        reverse=True,
+        due=None,
+        start=None,
+        startable=False,
+        status=(
+            'NEEDS-ACTION',
+            'IN-PROCESS',
+        ),
+        overdue=False,
+        recurring=False,
+        where=None,
+        view=None,
+        limit=None,
+        offset=0,
+    ):
+        """
+        Returns filtered cached todos, in a specified order.
+
+        If no order is specified, todos are sorted by the following fields::
+
+            completed_at
+            -priority
             due
             -created_at
 
@@ -707,11 +1368,278 @@ class Cache:
             high as specified.
         :param tuple(bool, datetime) start: Return only todos before/after
             ``start`` date
+        :param bool startable: Return only todos which have started (or have
+            no start date), and don't depend on any unfinished todos.
         :param list(str) status: Return only todos with any of the given
             statuses.
+        :param bool overdue: Return only todos whose due date has passed.
+        :param bool recurring: Return only recurring todos.
+        :param Expression where: Return only todos matching this compiled
+            expression (see :func:`todoman.expressions.parse`).
+        :param str view: Return only todos in this materialized view (see
+            :meth:`define_view`).
+        :param int limit: Return at most this many todos.
+        :param int offset: Skip this many todos (only used with ``limit``).
         :return: A sorted, filtered list of todos.
         :rtype: generator
         """
+        extra_where, params = self._todo_filters(
+            lists=lists,
+            priority=priority,
+            location=location,
+            category=category,
+            grep=grep,
+            due=due,
+            start=start,
+            startable=startable,
+            status=status,
+            overdue=overdue,
+            recurring=recurring,
+            where=where,
+            view=view,
+        )
+
+        order = self._todo_order(sort, reverse)
+
+        query = '''
+              SELECT todos.*, files.list_name, files.path
+                FROM todos, files
+               WHERE todos.file_path = files.path {}
+            ORDER BY {}
+        '''.format(
+            ' '.join(extra_where),
+            order,
+        )
+        if limit is not None:
+            # Break ties, so that consecutive pages neither overlap nor skip
+            # any todos.
+            query += ', todos.id LIMIT ? OFFSET ?'
+            params.extend([limit, offset])
+
+        logger.debug(query)
+        logger.debug(params)
+
+        # SQLite does most of its work while rows are fetched, so fetch them
+        # all within the query phase, then hydrate them in one go.
+        with self.timings.phase('query'):
+            rows = self._conn.execute(query, params).fetchall()
+        with self.timings.phase('hydrate', len(rows)):
+            todos = [self._todo_from_db(row) for row in rows]
+
+        seen_paths = set()
+        warned_paths = set()
+
+        for row, todo in zip(rows, todos):
+            path = row['path']
+
+            if path in seen_paths and path not in warned_paths:
+                logger.warning(
+                    'Todo is in read-only mode because there are '
+                    'multiple todos in %s', path
+                )
+                warned_paths.add(path)
+            seen_paths.add(path)
+            yield todo
+
+    def _todo_order(self, sort=(), reverse=True):
+        """Returns the ``ORDER BY`` clause for :meth:`todos`."""
+        if sort:
+            order = []
+            for s in sort:
+                if s.startswith('-'):
+                    order.append(' {} ASC'.format(s[1:]))
+                else:
+                    order.append(' {} DESC'.format(s))
+            order = ','.join(order)
+        else:
+            order = '''
+                completed_at DESC,
+                priority IS NOT NULL, priority DESC,
+                due IS NOT NULL, due DESC,
+                created_at ASC
+            '''
+
+        if not reverse:
+            # Note the change in case to avoid swapping all of them. sqlite
+            # doesn't care about casing anyway.
+            order = order.replace(' DESC', ' asc').replace(' ASC', ' desc')
+
+        return order
+
+    # The id of the ``child`` todo's parent. If several todos match its
+    # RELATED-TO properties, the oldest is used, so that each todo has a
+    # single parent.
+    _PARENT_SQL = '''(
+        SELECT MIN(parent.id)
+          FROM related_to AS link
+          JOIN todos AS parent ON parent.uid = link.uid
+          JOIN files AS parent_file ON parent_file.path = parent.file_path
+         WHERE link.todo_id = child.id
+           AND link.reltype = 'PARENT'
+           AND parent.id != child.id
+           AND parent_file.list_name = (
+               SELECT list_name FROM files WHERE path = child.file_path
+           )
+    )'''
+
+    # Joins the todos which may be children of ``subtree.id``, as ``child``.
+    # The recursive step uses this (rather than a table of parents) since it
+    # can use the indexes.
+    _CHILDREN_SQL = '''
+        JOIN todos AS node ON node.id = subtree.id
+        JOIN related_to AS link_to_node
+          ON link_to_node.uid = node.uid AND link_to_node.reltype = 'PARENT'
+        JOIN todos AS child ON child.id = link_to_node.todo_id
+    '''
+
+    def tree(self, sort=(), reverse=True, **kwargs):
+        """
+        Returns filtered cached todos, with subtasks right after their
+        parents, as given by their ``RELATED-TO`` properties.
+
+        Parents are looked up by UID, within the same list. Subtasks whose
+        parent doesn't match the filters are shown as top-level todos.
+        Siblings are ordered as by :meth:`todos`.
+
+        The todos, their parents, and the progress of each subtree are
+        fetched in a single query, and then arranged into a tree. (Window
+        functions, which would let SQLite do the latter too, need SQLite
+        3.25.)
+
+        :param kwargs: Filters, as for :meth:`todos`.
+        :returns: ``(todo, depth, progress)`` tuples, where ``progress`` is
+            the average percent complete of the todo and all its (unfiltered)
+            subtasks, counting completed ones as 100% and ignoring cancelled
+            ones, or ``None`` if it has no subtasks.
+        :rtype: generator
+        """
+        extra_where, params = self._todo_filters(**kwargs)
+        query = '''
+            WITH RECURSIVE
+                matching(id) AS (
+                    SELECT todos.id
+                      FROM todos, files
+                     WHERE todos.file_path = files.path {where}
+                ),
+                -- Every todo (matching or not) in each matching todo's
+                -- subtree. UNION (rather than UNION ALL) stops at cycles.
+                subtree(ancestor, id) AS (
+                    SELECT id, id FROM matching
+                     UNION
+                    SELECT subtree.ancestor, child.id
+                      FROM subtree {children}
+                     WHERE {parent} = subtree.id
+                ),
+                rollup(id, descendants, progress) AS (
+                    SELECT subtree.ancestor,
+                           SUM(subtree.id != subtree.ancestor),
+                           AVG(
+                               CASE todos.status
+                                   WHEN 'CANCELLED' THEN NULL
+                                   WHEN 'COMPLETED' THEN 100
+                                   ELSE COALESCE(todos.percent_complete, 0)
+                               END
+                           )
+                      FROM subtree
+                      JOIN todos ON todos.id = subtree.id
+                  GROUP BY subtree.ancestor
+                )
+              SELECT *
+                FROM (
+                    SELECT child.*, files.list_name, files.path,
+                           rollup.descendants, rollup.progress,
+                           (
+                               SELECT id FROM matching WHERE id = {parent}
+                           ) AS tree_parent
+                      FROM matching
+                      JOIN todos AS child ON child.id = matching.id
+                      JOIN files ON files.path = child.file_path
+                      JOIN rollup ON rollup.id = matching.id
+                )
+            ORDER BY {order}, id
+        '''.format(
+            order=self._todo_order(sort, reverse),
+            where=' '.join(extra_where),
+            parent=self._PARENT_SQL,
+            children=self._CHILDREN_SQL,
+        )
+
+        with self.timings.phase('query'):
+            rows = self._conn.execute(query, params).fetchall()
+
+        children = {}
+        for row in rows:
+            children.setdefault(row['tree_parent'], []).append(row)
+
+        # Each top-level todo's subtree, depth first.
+        subtrees = {}
+        for root in children.get(None, ()):
+            nodes = subtrees[root['id']] = []
+            stack = [(root, 0)]
+            while stack:
+                row, depth = stack.pop()
+                nodes.append((row, depth))
+                stack.extend(
+                    (child, depth + 1)
+                    for child in reversed(children.get(row['id'], ()))
+                )
+        reached = {
+            row['id'] for nodes in subtrees.values() for row, _ in nodes
+        }
+
+        ordered = []
+        for row in rows:
+            if row['id'] in subtrees:
+                ordered.extend(subtrees[row['id']])
+            elif row['id'] not in reached:
+                # Todos in cycles aren't reachable from any top-level todo.
+                ordered.append((row, 0))
+
+        with self.timings.phase('hydrate', len(ordered)):
+            todos = [self._todo_from_db(row) for row, _ in ordered]
+
+        for (row, depth), todo in zip(ordered, todos):
+            progress = row['progress'] if row['descendants'] else None
+            yield todo, depth, progress
+
+    def count_todos(self, sort=(), reverse=True, **kwargs):
+        """
+        Returns how many todos :meth:`todos` would return for the same
+        filters, without fetching them.
+        """
+        extra_where, params = self._todo_filters(**kwargs)
+        query = '''
+            SELECT COUNT(*)
+              FROM todos, files
+             WHERE todos.file_path = files.path {}
+        '''.format(' '.join(extra_where))
+
+        with self.timings.phase('query'):
+            return self._conn.execute(query, params).fetchone()[0]
+
+    def _todo_filters(
+        self,
+        lists=(),
+        priority=None,
+        location='',
+        category='',
+        grep='',
+        due=None,
+        start=None,
+        startable=False,
+        status=(
+            'NEEDS-ACTION',
+            'IN-PROCESS',
+        ),
+        overdue=False,
+        recurring=False,
+        where=None,
+        view=None,
+    ):
+        """
+        Returns the ``WHERE`` clauses and parameters for the filters taken by
+        :meth:`todos`.
+        """
         extra_where = []
         params = []
 
@@ -755,59 +1683,26 @@ class Cache:
                 extra_where.append('AND start >= ?')
                 params.append(dt)
         if startable:
-            extra_where.append('AND (start IS NULL OR start <= ?)')
+            extra_where.append(
+                'AND blocked = 0 AND (start IS NULL OR start <= ?)'
+            )
             params.append(datetime.now().timestamp())
-        if sort:
-            order = []
-            for s in sort:
-                if s.startswith('-'):
-                    order.append(' {} ASC'.format(s[1:]))
-                else:
-                    order.append(' {} DESC'.format(s))
-            order = ','.join(order)
-        else:
-            order = '''
-                completed_at DESC,
-                priority IS NOT NULL, priority DESC,
-                due IS NOT NULL, due DESC,
-                created_at ASC
-            '''
-
-        if not reverse:
-            # Note the change in case to avoid swapping all of them. sqlite
-            # doesn't care about casing anyway.
-            order = order.replace(' DESC', ' asc').replace(' ASC', ' desc')
-
-        query = '''
-              SELECT todos.*, files.list_name, files.path
-                FROM todos, files
-               WHERE todos.file_path = files.path {}
-            ORDER BY {}
-        '''.format(
-            ' '.join(extra_where),
-            order,
-        )
-
-        logger.debug(query)
-        logger.debug(params)
-
-        result = self._conn.execute(query, params)
-
-        seen_paths = set()
-        warned_paths = set()
-
-        for row in result:
-            todo = self._todo_from_db(row)
-            path = row['path']
+        if overdue:
+            extra_where.append('AND due IS NOT NULL AND due < ?')
+            params.append(datetime.now().timestamp())
+        if recurring:
+            extra_where.append('AND rrule IS NOT NULL')
+        if where:
+            extra_where.append('AND ({})'.format(where.sql))
+            params.extend(where.params)
+        if view:
+            extra_where.append(
+                'AND todos.id IN '
+                '(SELECT todo_id FROM view_todos WHERE view = ?)'
+            )
+            params.append(view)
 
-            if path in seen_paths and path not in warned_paths:
-                logger.warning(
-                    'Todo is in read-only mode because there are '
-                    'multiple todos in %s', path
-                )
-                warned_paths.add(path)
-            seen_paths.add(path)
-            yield todo
+        return extra_where, params
 
     def _dt_from_db(self, dt, is_date=False):
         if dt:
@@ -832,11 +1727,15 @@ class Cache:
         todo.status = row['status']
         todo.description = row['description']
         todo.location = row['location']
+        todo.categories = (
+            row['categories'].split(',') if row['categories'] else []
+        )
         todo.sequence = row['sequence']
         todo.last_modified = row['last_modified']
         todo.list = self.lists_map[row['list_name']]
         todo.filename = os.path.basename(row['path'])
         todo.rrule = row['rrule']
+        todo._snapshot()
         return todo
 
     def lists(self):
@@ -852,11 +1751,19 @@ class Cache:
     def lists_map(self):
         return {l.name: l for l in self.lists()}
 
-    def expire_lists(self, paths):
+    def expire_lists(self, paths, partial=False):
+        """
+        Remove lists which no longer exist, or whose metadata changed.
+
+        :param dict paths: The mtimes of all lists' metadata, by path.
+        :param bool partial: Whether ``paths`` only contains some lists, in
+            which case, lists not in it are kept.
+        """
         results = self._conn.execute("SELECT path, name, mtime from lists")
         for result in results:
             if result['path'] not in paths:
-                self.delete_list(result['name'])
+                if not partial:
+                    self.delete_list(result['name'])
             else:
                 mtime = paths.get(result['path'])
                 if mtime and mtime > result['mtime']:
@@ -867,14 +1774,15 @@ class Cache:
 
     def todo(self, id, read_only=False):
         # XXX: DON'T USE READ_ONLY
-        result = self._conn.execute(
-            '''
-            SELECT todos.*, files.list_name, files.path
-              FROM todos, files
-            WHERE files.path = todos.file_path
-              AND todos.id = ?
-        ''', (id,)
-        ).fetchone()
+        with self.timings.phase('query'):
+            result = self._conn.execute(
+                '''
+                SELECT todos.*, files.list_name, files.path
+                  FROM todos, files
+                WHERE files.path = todos.file_path
+                  AND todos.id = ?
+            ''', (id,)
+            ).fetchone()
 
         if not result:
             raise exceptions.NoSuchTodo(id)
@@ -891,19 +1799,91 @@ class Cache:
             if count['c'] > 1:
                 raise exceptions.ReadOnlyTodo(result['path'])
 
-        return self._todo_from_db(result)
+        with self.timings.phase('hydrate', 1):
+            return self._todo_from_db(result)
+
+    def expire_files(self, paths_to_mtime, list_names=None):
+        """
+        Remove stale cache entries based on the given fresh data.
+
+        :param list list_names: If given, only files in these lists are
+            checked.
 
-    def expire_files(self, paths_to_mtime):
-        """Remove stale cache entries based on the given fresh data."""
-        result = self._conn.execute("SELECT path, mtime FROM files")
+        Returns the amount of expired files.
+        """
+        expired = 0
+        if list_names is None:
+            result = self._conn.execute("SELECT path, mtime FROM files")
+        else:
+            result = self._conn.execute(
+                'SELECT path, mtime FROM files WHERE list_name IN ({})'.format(
+                    ', '.join(['?'] * len(list_names))
+                ),
+                list_names,
+            ).fetchall()
         for row in result:
             path, mtime = row['path'], row['mtime']
             if paths_to_mtime.get(path, None) != mtime:
                 self.expire_file(path)
+                expired += 1
+        return expired
 
     def expire_file(self, path):
         self._conn.execute("DELETE FROM files WHERE path = ?", (path,))
 
+    def uids(self, list_name):
+        """
+        Returns the UIDs of all todos in a list.
+
+        :returns: A dict mapping each UID to a tuple with the todo's id, the
+            path of its file, and how many todos that file contains.
+        """
+        result = self._conn.execute(
+            '''
+            SELECT todos.uid, todos.id, todos.file_path, counts.todos
+              FROM todos
+              JOIN files ON files.path = todos.file_path
+              JOIN (
+                SELECT file_path, COUNT(*) AS todos
+                  FROM todos
+                 GROUP BY file_path
+              ) AS counts ON counts.file_path = todos.file_path
+             WHERE files.list_name = ?
+            ''',
+            (list_name,),
+        )
+        return {
+            row['uid']: (row['id'], row['file_path'], row['todos'])
+            for row in result
+        }
+
+    def move_file(self, old_path, new_path, list_name, mtime):
+        """
+        Re-points a cached file, and its todos, to a new path and list.
+
+        The todos keep their ids. Nothing is committed.
+        """
+        # Todos reference their file's path, so the new file is inserted
+        # before re-pointing them, and the old one is deleted afterwards.
+        self.expire_file(new_path)
+        self.add_file(list_name, new_path, mtime)
+        self._conn.execute(
+            'UPDATE todos SET file_path = ? WHERE file_path = ?',
+            (new_path, old_path),
+        )
+        self.expire_file(old_path)
+
+        if self._views:
+            # The todos' list changed, which views may filter on.
+            self._conn.execute(
+                '''
+                DELETE FROM view_todos
+                 WHERE todo_id IN (SELECT id FROM todos WHERE file_path = ?)
+                ''',
+                (new_path,),
+            )
+            self._match_views('AND todos.file_path = ?', [new_path])
+
 
 class List:
     def __init__(self, name, path, colour=None):
@@ -959,101 +1939,367 @@ class Database:
 
     Caching in abstracted inside this class, and is transparent to outside
     classes.
+
+    The time spent in each phase of refreshing and querying the cache is
+    recorded in ``timings``.
     """
 
-    def __init__(self, paths, cache_path):
-        self.cache = Cache(cache_path)
+    def __init__(
+        self,
+        paths,
+        cache_path,
+        timings=None,
+        query_log=None,
+        scan_concurrency=1,
+        max_age=0,
+        durability=FULL,
+    ):
+        """
+        :param float max_age: Don't refresh the cache if it was last
+            refreshed less than this many seconds ago.
+        :param str durability: How to sync saved todos' files, unless
+            specified when saving them. See :mod:`todoman.durability`.
+        """
+        self.timings = timings or Timings()
+        self.cache = Cache(cache_path, self.timings, query_log)
         self.paths = [str(path) for path in paths]
-        self.update_cache()
+        self.scan_concurrency = scan_concurrency
+        self.durability = durability
+        # The mtimes of lists' directories when they were last scanned.
+        self._dir_mtimes = {}
+
+        if not self.cache.is_fresh(max_age):
+            self.update_cache()
+
+    def update_cache(self, paths=None):
+        """
+        Rescans lists, and updates the cache with any changes.
+
+        :param list paths: Only rescan the lists at these paths. By default,
+            all lists are rescanned.
+        """
+        # Anything changed while scanning is picked up next time.
+        started = datetime.now().timestamp()
+        with self.timings.phase('lists'):
+            for path in paths or self.paths:
+                self._dir_mtimes[path] = _getmtime(path)
 
-    def update_cache(self):
-        paths = {path: List.mtime_for_path(path) for path in self.paths}
-        self.cache.expire_lists(paths)
+        if self.scan_concurrency > 1:
+            # Only pay for importing asyncio if it's actually used.
+            from todoman.scanner import Scanner
+
+            Scanner(self, self.scan_concurrency).run(paths)
+        else:
+            self._scan(paths)
+
+        # Lists may have been renamed or recoloured.
+        self.cache.__dict__.pop('lists_map', None)
+
+        with self.timings.phase('commit'):
+            self.cache.set_refreshed(started)
+            self.cache.save_to_disk()
+
+    def refresh(self):
+        """
+        Cheaply brings the cache up to date, eg: between commands in the REPL.
+
+        Only lists whose directories changed since they were last scanned are
+        rescanned. Files are always replaced, rather than modified in place,
+        by todoman and by sync tools, which changes their directory. Files
+        modified in place are missed, but saving their todos is refused (see
+        :meth:`save`).
+        """
+        with self.timings.phase('lists', len(self.paths)):
+            changed = [
+                path for path in self.paths
+                if _getmtime(path) != self._dir_mtimes.get(path)
+            ]
+
+        if changed:
+            self.update_cache(changed)
+
+    def _scan(self, scanned=None):
+        timings = self.timings
+        scanned = scanned or self.paths
+
+        with timings.phase('lists', len(scanned)):
+            paths = {path: List.mtime_for_path(path) for path in scanned}
+
+        with timings.phase('expire'):
+            self.cache.expire_lists(paths, partial=scanned != self.paths)
+
+        with timings.phase('lists'):
+            list_names = {
+                path: self.cache.add_list(
+                    List.name_for_path(path),
+                    path,
+                    List.colour_for_path(path),
+                    paths[path],
+                )
+                for path in scanned
+            }
 
         paths_to_mtime = {}
         paths_to_list_name = {}
 
-        for path in self.paths:
-            list_name = self.cache.add_list(
-                List.name_for_path(path),
-                path,
-                List.colour_for_path(path),
-                paths[path],
+        with timings.phase('scan') as phase:
+            for path in scanned:
+                for entry in os.listdir(path):
+                    if not entry.endswith('.ics'):
+                        continue
+                    entry_path = os.path.join(path, entry)
+                    mtime = _getmtime(entry_path)
+                    paths_to_mtime[entry_path] = mtime
+                    paths_to_list_name[entry_path] = list_names[path]
+            phase.count += len(paths_to_mtime)
+
+        with timings.phase('expire') as phase:
+            phase.count += self.cache.expire_files(
+                paths_to_mtime,
+                None if scanned == self.paths else list(list_names.values()),
             )
-            for entry in os.listdir(path):
-                if not entry.endswith('.ics'):
+
+        with timings.phase('parse') as phase:
+            for entry_path, mtime in paths_to_mtime.items():
+                list_name = paths_to_list_name[entry_path]
+
+                try:
+                    self.cache.add_file(list_name, entry_path, mtime)
+                except exceptions.AlreadyExists:
+                    logger.debug('File already in cache: %s', entry_path)
                     continue
-                entry_path = os.path.join(path, entry)
-                mtime = _getmtime(entry_path)
-                paths_to_mtime[entry_path] = mtime
-                paths_to_list_name[entry_path] = list_name
 
-        self.cache.expire_files(paths_to_mtime)
+                phase.count += 1
+                try:
+                    with open(entry_path, 'rb') as f:
+                        data = f.read()
+                except Exception as e:
+                    self._file_failed(entry_path, e)
+                else:
+                    self._parse_file(entry_path, data)
+
+    def _parse_file(self, path, data):
+        """
+        Caches all todos in a file's contents, and records whether it had
+        any, or why it couldn't be parsed.
+        """
+        try:
+            status = self._add_vtodos(path, data)
+        except Exception as e:
+            self._file_failed(path, e)
+        else:
+            self.cache.set_file_status(path, status)
 
-        for entry_path, mtime in paths_to_mtime.items():
-            list_name = paths_to_list_name[entry_path]
+    def _file_failed(self, path, error):
+        """
+        Records that a file couldn't be read or parsed. Must be called while
+        handling ``error``.
+        """
+        logger.exception('Failed to read entry %s.', path)
+        self.cache.set_file_status(
+            path,
+            FILE_ERROR,
+            '{}: {}'.format(type(error).__name__, error),
+        )
 
-            try:
-                self.cache.add_file(list_name, entry_path, mtime)
-            except exceptions.AlreadyExists:
-                logger.debug('File already in cache: %s', entry_path)
-                continue
+    def _add_vtodos(self, path, data):
+        """
+        Parses a file's contents, and caches all todos in it.
 
-            try:
-                with open(entry_path, 'rb') as f:
-                    cal = f.read()
-                    cal = icalendar.Calendar.from_ical(cal)
-                    for component in cal.walk('VTODO'):
-                        self.cache.add_vtodo(component, entry_path)
-            except Exception:
-                logger.exception("Failed to read entry %s.", entry_path)
+        :returns: ``FILE_OK``, or ``FILE_NO_VTODO`` if it had no todos (in
+            which case it isn't parsed at all).
+        """
+        if not _VTODO_RE.search(data):
+            return FILE_NO_VTODO
 
-        self.cache.save_to_disk()
+        # Only pay for importing icalendar if there's something to parse.
+        import icalendar
+
+        cal = icalendar.Calendar.from_ical(data)
+        for component in cal.walk('VTODO'):
+            self.cache.add_vtodo(component, path)
+        return FILE_OK
 
     def todos(self, **kwargs):
         return self.cache.todos(**kwargs)
 
+    def file_statuses(self, statuses=(FILE_ERROR,)):
+        """
+        Returns the files which were last read with any of the given statuses
+        (see :meth:`Cache.file_statuses`). By default, those which couldn't
+        be read.
+
+        Files are only read again once they change.
+        """
+        with self.timings.phase('query'):
+            return self.cache.file_statuses(list(statuses))
+
+    def count_todos(self, **kwargs):
+        return self.cache.count_todos(**kwargs)
+
+    def tree(self, **kwargs):
+        return self.cache.tree(**kwargs)
+
     def todo(self, id, **kwargs):
         return self.cache.todo(id, **kwargs)
 
+    def define_view(self, name, **kwargs):
+        """
+        Materializes a view (see :meth:`Cache.define_view`), and commits the
+        cache if it had to be (re)built.
+        """
+        with self.timings.phase('views') as phase:
+            if self.cache.define_view(name, **kwargs):
+                phase.count += 1
+                self.cache.save_to_disk()
+
+    def drop_views(self, keep=()):
+        if self.cache.drop_views(keep):
+            self.cache.save_to_disk()
+
+    def occurrences(self, start, end, **kwargs):
+        """
+        Returns all occurrences of todos between ``start`` and ``end``.
+
+        Recurring todos are expanded, and may occur more than once.
+
+        :param datetime start: The beginning of the window.
+        :param datetime end: The end of the window.
+        :param kwargs: Filters for :meth:`Cache.todos`.
+        :returns: A list of ``(datetime, Todo)`` tuples, sorted by date.
+        """
+        occurrences = []
+        for todo in self.todos(**kwargs):
+            for dt in todo.occurrences(start, end):
+                occurrences.append((dt, todo))
+
+        occurrences.sort(key=lambda occurrence: _as_datetime(occurrence[0]))
+        return occurrences
+
     def lists(self):
         return self.cache.lists()
 
     def move(self, todo, new_list, from_list=None):
+        self._move(todo, new_list, from_list)
+        self.cache.save_to_disk()
+
+    def move_all(self, todos, new_list):
+        """
+        Moves several todos to ``new_list``, committing the cache only once,
+        at the end.
+        """
+        for todo in todos:
+            self._move(todo, new_list)
+        self.cache.save_to_disk()
+
+    def _move(self, todo, new_list, from_list=None):
         from_list = from_list or todo.list
         orig_path = os.path.join(from_list.path, todo.filename)
         dest_path = os.path.join(new_list.path, todo.filename)
 
         os.rename(orig_path, dest_path)
+        # Update the cached entry in place, so the file needn't be re-parsed.
+        self.cache.move_file(
+            orig_path,
+            dest_path,
+            new_list.name,
+            _getmtime(dest_path),
+        )
 
     def delete(self, todo):
+        self._delete(todo)
+        self.cache.save_to_disk()
+
+    def delete_all(self, todos):
+        """
+        Deletes several todos, committing the cache only once, at the end.
+        """
+        for todo in todos:
+            self._delete(todo)
+        self.cache.save_to_disk()
+
+    def _delete(self, todo):
         path = os.path.join(todo.list.path, todo.filename)
         os.remove(path)
+        self.cache.expire_file(path)
 
     def flush(self):
+        # The whole cache is cleared afterwards, so only the files need to
+        # be removed.
         for todo in self.todos(status=['ANY']):
             if todo.is_completed:
                 yield todo
-                self.delete(todo)
+                os.remove(todo.path)
 
         self.cache.clear()
         self.cache = None
 
-    def save(self, todo):
+    def save(self, todo, durability=None):
+        self.save_all([todo], durability)
+
+    def save_all(self, todos, durability=None):
+        """
+        Saves several todos, committing the cache only once, at the end.
+
+        In ``batch`` mode, files are synced together, once all of them have
+        been written. If saving a todo fails, those saved before it are still
+        committed.
+
+        :param str durability: How to sync the todos' files. Defaults to the
+            database's durability.
+        """
+        writer = AtomicBatch(durability or self.durability)
+        # Maps paths to the todos written to them, which are cached once
+        # they've been committed.
+        pending = OrderedDict()
+        try:
+            for todo in todos:
+                self._save(todo, writer, pending)
+        finally:
+            self._commit(writer, pending)
+            self.cache.save_to_disk()
+
+    def _save(self, todo, writer, pending):
         for related in todo.related:
-            self.save(related)
+            self._save(related, writer, pending)
 
-        todo.sequence += 1
-        todo.last_modified = datetime.now(LOCAL_TIMEZONE)
+        if todo.path in pending:
+            # Files are read before being written, so earlier changes to the
+            # same file need to land first.
+            self._commit(writer, pending)
 
-        vtodo = VtodoWriter(todo).write()
+        cached_mtime = self.cache.file_mtime(todo.path)
+        if cached_mtime is not None and os.path.exists(todo.path) and \
+                _getmtime(todo.path) != cached_mtime:
+            # The todo may be out of date, and writing it would revert
+            # whatever changed.
+            raise exceptions.ChangedOnDisk(todo.path)
 
-        self.cache.expire_file(todo.path)
-        mtime = _getmtime(todo.path)
+        todo.sequence += 1
+        todo.last_modified = datetime.now(LOCAL_TIMEZONE)
 
-        self.cache.add_file(todo.list.name, todo.path, mtime)
-        todo.id = self.cache.add_vtodo(vtodo, todo.path, todo.id)
-        self.cache.save_to_disk()
+        pending[todo.path] = todo, VtodoWriter(todo).write(writer)
+
+    def _commit(self, writer, pending):
+        """Commits a batch of written files, and caches their todos."""
+        with self.timings.phase('sync', len(pending)):
+            writer.commit()
+
+        for path, (todo, vtodo) in pending.items():
+            # Patched todos keep their RELATED-TO properties, which only the
+            # cache knows about.
+            relations = ()
+            if vtodo is None and todo.id:
+                relations = self.cache.relations(todo.id)
+
+            self.cache.expire_file(path)
+            self.cache.add_file(todo.list.name, path, _getmtime(path))
+            if vtodo is None:
+                # New and patched todos are written without a VTODO.
+                todo.id = self.cache.add_todo(todo, path, todo.id, relations)
+            else:
+                todo.id = self.cache.add_vtodo(vtodo, path, todo.id)
+        pending.clear()
 
 
 def _getmtime(path):
@@ -0,0 +1,99 @@
+"""
+Profiling of todoman itself, for diagnosing performance issues.
+"""
+import cProfile
+import pstats
+import sys
+
+#: Profiles written to paths with these suffixes are written as collapsed
+#: stacks, otherwise they're written as pstats dumps.
+COLLAPSED_SUFFIXES = ('.collapsed', '.folded')
+
+#: How many entries to print when summarising a profile.
+HOTSPOTS = 20
+
+#: Paths that account for less than this fraction of the total time are
+#: dropped from collapsed stacks.
+MIN_FRACTION = 1e-5
+
+
+def start():
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def _label(func):
+    return pstats.func_std_string(func).replace(';', ',')
+
+
+def collapsed_stacks(stats):
+    """
+    Yields ``(stack, microseconds)`` tuples for a :class:`pstats.Stats`.
+
+    cProfile only records caller/callee pairs (rather than whole stacks), so
+    stacks are reconstructed by walking the call graph from its roots, and
+    splitting time spent in each function among its callers proportionally.
+    The result is an approximation, but is usually good enough to spot where
+    time goes.
+    """
+    children = {}
+    roots = []
+    for func, (cc, nc, tt, ct, callers) in stats.stats.items():
+        if not callers:
+            roots.append(func)
+        for caller, (_, _, _, edge_ct) in callers.items():
+            children.setdefault(caller, []).append((func, edge_ct))
+
+    total = sum(stats.stats[root][3] for root in roots)
+    threshold = total * MIN_FRACTION
+
+    pending = [((root,), 1.0) for root in roots]
+    while pending:
+        stack, scale = pending.pop()
+        func = stack[-1]
+        tt, ct = stats.stats[func][2:4]
+
+        own = tt * scale
+        if own >= threshold:
+            yield tuple(_label(f) for f in stack), int(own * 1e6)
+
+        for child, edge_ct in children.get(func, ()):
+            child_ct = stats.stats[child][3]
+            if child in stack or not child_ct:
+                continue
+            share = edge_ct * scale
+            if share >= threshold:
+                pending.append((stack + (child,), share / child_ct))
+
+
+def write_collapsed(stats, path):
+    folded = {}
+    for stack, us in collapsed_stacks(stats):
+        key = ';'.join(stack)
+        folded[key] = folded.get(key, 0) + us
+
+    with open(path, 'w') as f:
+        for stack, us in sorted(folded.items()):
+            if us:
+                f.write('{} {}\n'.format(stack, us))
+
+
+def stop(profiler, path, stream=None):
+    """
+    Stops ``profiler``, saves its data to ``path``, and prints a summary.
+
+    :param str path: Where to save the profile. See ``COLLAPSED_SUFFIXES``.
+    :param stream: Where to print the summary. Defaults to stderr.
+    """
+    profiler.disable()
+
+    stream = stream or sys.stderr
+    stats = pstats.Stats(profiler, stream=stream)
+    if path.endswith(COLLAPSED_SUFFIXES):
+        write_collapsed(stats, path)
+    else:
+        stats.dump_stats(path)
+
+    stats.sort_stats('cumulative').print_stats(HOTSPOTS)
+    print('Profile written to {}'.format(path), file=stream)
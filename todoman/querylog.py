@@ -0,0 +1,241 @@
+"""
+Instrumentation for the queries run against the cache.
+
+When enabled, every statement run on the cache's connection is timed. Those
+slower than a threshold are logged along with their query plan, and per
+statement statistics are kept, so that they can be reported at exit.
+"""
+import logging
+import re
+import sqlite3
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(name=__name__)
+
+#: Upper bounds (in seconds) of the buckets of the latency histogram.
+BUCKETS = (0.0001, 0.001, 0.01, 0.1, 1.0, float('inf'))
+
+# Statements for which sqlite can provide a query plan.
+EXPLAINABLE_RE = re.compile(r'\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b', re.I)
+
+
+def _normalize(sql):
+    return re.sub(r'\s+', ' ', sql).strip()
+
+
+def _bucket_label(bound):
+    if bound == float('inf'):
+        return '>{:g}ms'.format(BUCKETS[-2] * 1000)
+    return '<{:g}ms'.format(bound * 1000)
+
+
+class StatementStats:
+    def __init__(self, sql):
+        self.sql = sql
+        self.count = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.rows = 0
+        self.histogram = [0] * len(BUCKETS)
+
+    def add(self, seconds, rows):
+        self.count += 1
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.rows += rows
+        for i, bound in enumerate(BUCKETS):
+            if seconds < bound:
+                self.histogram[i] += 1
+                break
+
+
+class QueryLog:
+    """
+    Keeps statistics for, and logs slow, statements.
+
+    :param float threshold: Statements that take at least this long (in
+        seconds) are logged as warnings, along with their query plan.
+    """
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.stats = OrderedDict()
+
+    def record(self, connection, sql, params, seconds, rows):
+        key = _normalize(sql)
+        if key not in self.stats:
+            self.stats[key] = StatementStats(key)
+        self.stats[key].add(seconds, rows)
+
+        if seconds < self.threshold:
+            return
+
+        if params is not None and EXPLAINABLE_RE.match(sql):
+            logger.warning(
+                'Slow query (%.1fms, %d rows): %s %r\n%s',
+                seconds * 1000,
+                rows,
+                key,
+                params,
+                self.explain(connection, sql, params),
+            )
+        else:
+            logger.warning(
+                'Slow query (%.1fms, %d rows): %s',
+                seconds * 1000,
+                rows,
+                key,
+            )
+
+    def explain(self, connection, sql, params):
+        """Returns the query plan for a statement, formatted as a tree."""
+        # Use a plain cursor, so that this doesn't get instrumented itself.
+        cursor = sqlite3.Cursor(connection)
+        try:
+            rows = cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            depths = {0: 0}
+            lines = []
+            for id_, parent, _, detail in rows:
+                depths[id_] = depths.get(parent, 0) + 1
+                lines.append('{}{}'.format('  ' * depths[id_], detail))
+            return '\n'.join(lines)
+        except sqlite3.Error as e:
+            return '  (no query plan: {})'.format(e)
+        finally:
+            cursor.close()
+
+    def log_report(self):
+        if self.stats:
+            logger.info('Cache statements:\n%s', self.report())
+
+    def report(self):
+        """Returns a per-statement summary, slowest statements first."""
+        header = '{:>6} {:>10} {:>10} {:>8}  {}  {}'.format(
+            'calls',
+            'total',
+            'max',
+            'rows',
+            ' '.join('{:>7}'.format(_bucket_label(b)) for b in BUCKETS),
+            'statement',
+        )
+        lines = [header]
+        stats = sorted(
+            self.stats.values(),
+            key=lambda s: s.seconds,
+            reverse=True,
+        )
+        for stat in stats:
+            lines.append(
+                '{:>6} {:>8.2f}ms {:>8.2f}ms {:>8}  {}  {}'.format(
+                    stat.count,
+                    stat.seconds * 1000,
+                    stat.max_seconds * 1000,
+                    stat.rows,
+                    ' '.join('{:>7}'.format(n) for n in stat.histogram),
+                    stat.sql,
+                )
+            )
+        return '\n'.join(lines)
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """
+    A cursor that times its statements, including fetching their results.
+
+    Statements that return rows are recorded once all rows have been fetched,
+    when ``fetchone`` is used (which is how single-row queries are run), or
+    when the cursor is closed or discarded.
+    """
+
+    _pending = None
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        start = time.perf_counter()
+        super().execute(sql, parameters)
+        self._pending = [sql, parameters, time.perf_counter() - start, 0]
+        if self.description is None:
+            self._pending[3] = max(self.rowcount, 0)
+            self._finish()
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        start = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        # Parameters are not kept, since they may be a (consumed) iterator.
+        self._pending = [
+            sql,
+            None,
+            time.perf_counter() - start,
+            max(self.rowcount, 0),
+        ]
+        self._finish()
+        return self
+
+    def _finish(self):
+        if self._pending:
+            sql, params, seconds, rows = self._pending
+            self._pending = None
+            self.connection.query_log.record(
+                self.connection, sql, params, seconds, rows
+            )
+
+    def _timed(self, fetch, *args):
+        start = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            if self._pending:
+                self._pending[2] += time.perf_counter() - start
+
+    def __next__(self):
+        try:
+            row = self._timed(super().__next__)
+        except StopIteration:
+            self._finish()
+            raise
+        if self._pending:
+            self._pending[3] += 1
+        return row
+
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        if self._pending and row is not None:
+            self._pending[3] += 1
+        self._finish()
+        return row
+
+    def fetchall(self):
+        rows = self._timed(super().fetchall)
+        if self._pending:
+            self._pending[3] += len(rows)
+        self._finish()
+        return rows
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        self._finish()
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """
+    A connection whose cursors are instrumented.
+
+    The ``query_log`` attribute must be set before running any statements.
+    """
+
+    query_log = None
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
@@ -0,0 +1,178 @@
+"""
+Concurrent cache refreshes, for lists on high-latency filesystems.
+
+On network filesystems (eg: NFS or SSHFS), each ``stat`` and ``open`` costs a
+round trip, so scanning lists one file at a time is slow. The scanner runs
+those operations in a thread pool, driven by asyncio, with a bounded amount of
+them in flight at once. Files are parsed and cached as soon as they've been
+read, while others are still being read.
+"""
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from todoman import exceptions
+from todoman.model import _getmtime, List
+
+logger = logging.getLogger(name=__name__)
+
+#: How many filesystem operations may be in flight at once.
+CONCURRENCY = 16
+
+
+class Filesystem:
+    """
+    The filesystem operations used by the scanner.
+
+    These are run in worker threads. Tests may replace them, eg: to add
+    latency to each call.
+    """
+
+    def list_metadata(self, path):
+        """Returns a list's ``(mtime, name, colour)``."""
+        return (
+            List.mtime_for_path(path),
+            List.name_for_path(path),
+            List.colour_for_path(path),
+        )
+
+    def listdir(self, path):
+        return os.listdir(path)
+
+    def getmtime(self, path):
+        return _getmtime(path)
+
+    def read(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+
+class Scanner:
+    """
+    Refreshes a database's cache, running filesystem operations concurrently.
+
+    This does the same as :meth:`Database.update_cache`, and records the same
+    timing phases, except that (since they overlap) reading files counts
+    towards the ``parse`` phase.
+
+    :param Database database: The database whose cache is refreshed.
+    :param int concurrency: How many filesystem operations may be in flight
+        at once.
+    :param Filesystem filesystem: The filesystem operations to use.
+    """
+
+    def __init__(self, database, concurrency=CONCURRENCY, filesystem=None):
+        self.database = database
+        self.concurrency = concurrency
+        self.filesystem = filesystem or Filesystem()
+
+    def run(self, paths=None):
+        """
+        Refreshes the cache. The cache is not committed.
+
+        :param list paths: Only rescan the lists at these paths. By default,
+            all lists are rescanned.
+        """
+        loop = asyncio.new_event_loop()
+        executor = ThreadPoolExecutor(self.concurrency)
+        try:
+            loop.run_until_complete(
+                self._run(loop, executor, paths or self.database.paths)
+            )
+        finally:
+            executor.shutdown()
+            loop.close()
+
+    async def _run(self, loop, executor, paths):
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def call(function, *args):
+            async with semaphore:
+                return await loop.run_in_executor(executor, function, *args)
+
+        partial = paths != self.database.paths
+        list_names = await self._update_lists(call, paths, partial)
+        paths_to_mtime, paths_to_list_name = await self._stat_files(
+            call,
+            list_names,
+        )
+
+        with self.database.timings.phase('expire') as phase:
+            phase.count += self.database.cache.expire_files(
+                paths_to_mtime,
+                list(list_names.values()) if partial else None,
+            )
+
+        await self._parse_files(call, paths_to_mtime, paths_to_list_name)
+
+    async def _update_lists(self, call, paths, partial):
+        cache = self.database.cache
+
+        with self.database.timings.phase('lists', len(paths)):
+            metadata = await asyncio.gather(*[
+                call(self.filesystem.list_metadata, path) for path in paths
+            ])
+            metadata = dict(zip(paths, metadata))
+
+        with self.database.timings.phase('expire'):
+            cache.expire_lists(
+                {path: mtime for path, (mtime, _, _) in metadata.items()},
+                partial,
+            )
+
+        with self.database.timings.phase('lists'):
+            return {
+                path: cache.add_list(name, path, colour, mtime)
+                for path, (mtime, name, colour) in metadata.items()
+            }
+
+    async def _stat_files(self, call, list_names):
+        paths_to_list_name = {}
+
+        with self.database.timings.phase('scan') as phase:
+            entries = await asyncio.gather(*[
+                call(self.filesystem.listdir, path) for path in list_names
+            ])
+            for path, names in zip(list_names, entries):
+                for name in names:
+                    if name.endswith('.ics'):
+                        paths_to_list_name[os.path.join(path, name)] = \
+                            list_names[path]
+
+            mtimes = await asyncio.gather(*[
+                call(self.filesystem.getmtime, path)
+                for path in paths_to_list_name
+            ])
+            paths_to_mtime = dict(zip(paths_to_list_name, mtimes))
+            phase.count += len(paths_to_mtime)
+
+        return paths_to_mtime, paths_to_list_name
+
+    async def _parse_files(self, call, paths_to_mtime, paths_to_list_name):
+        cache = self.database.cache
+
+        async def read(path):
+            try:
+                return path, await call(self.filesystem.read, path)
+            except Exception as e:
+                self.database._file_failed(path, e)
+                return path, None
+
+        with self.database.timings.phase('parse') as phase:
+            reads = []
+            for path, mtime in paths_to_mtime.items():
+                try:
+                    cache.add_file(paths_to_list_name[path], path, mtime)
+                except exceptions.AlreadyExists:
+                    logger.debug('File already in cache: %s', path)
+                    continue
+                reads.append(read(path))
+            phase.count += len(reads)
+
+            # Files are parsed as soon as they've been read, while the rest
+            # are still being read.
+            for future in asyncio.as_completed(reads):
+                path, data = await future
+                if data is not None:
+                    self.database._parse_file(path, data)
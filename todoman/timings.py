@@ -0,0 +1,85 @@
+"""
+Lightweight timing of the different phases of a run.
+"""
+import json
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class Phase:
+    def __init__(self, name):
+        self.name = name
+        self.seconds = 0.0
+        self.count = 0
+
+
+class Timings:
+    """
+    Records how long each phase of a run takes, and how many items it
+    processed.
+
+    Phases may be entered repeatedly (eg: when refreshing the cache more than
+    once), in which case their durations and counts add up.
+    """
+
+    def __init__(self):
+        self.phases = OrderedDict()
+
+    def get(self, name):
+        """Returns the phase named ``name``, creating it if needed."""
+        if name not in self.phases:
+            self.phases[name] = Phase(name)
+        return self.phases[name]
+
+    @contextmanager
+    def phase(self, name, count=0):
+        """
+        Times the wrapped code as part of the phase named ``name``.
+
+        :param int count: The amount of items processed. Alternatively, the
+            ``count`` attribute of the yielded phase may be incremented.
+        """
+        phase = self.get(name)
+        phase.count += count
+        start = time.perf_counter()
+        try:
+            yield phase
+        finally:
+            phase.seconds += time.perf_counter() - start
+
+    @property
+    def total(self):
+        return sum(phase.seconds for phase in self.phases.values())
+
+    def as_dict(self):
+        return OrderedDict([
+            (
+                'phases',
+                [
+                    OrderedDict([
+                        ('name', phase.name),
+                        ('seconds', phase.seconds),
+                        ('count', phase.count),
+                    ]) for phase in self.phases.values()
+                ],
+            ),
+            ('total', self.total),
+        ])
+
+    def format(self):
+        """Returns a compact, human readable, breakdown."""
+        lines = []
+        for phase in self.phases.values():
+            lines.append(
+                '{:<10} {:>9.1f}ms {:>8}'.format(
+                    phase.name,
+                    phase.seconds * 1000,
+                    phase.count or '',
+                ).rstrip()
+            )
+        lines.append('{:<10} {:>9.1f}ms'.format('total', self.total * 1000))
+        return '\n'.join(lines)
+
+    def format_json(self):
+        return json.dumps(self.as_dict(), indent=4)
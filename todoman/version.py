@@ -0,0 +1 @@
+version = '3.9.0'
@@ -172,3 +172,12 @@ class PrioritySelector(urwid.Button):
     @property
     def priority(self):
         return self._priority
+
+
+class SelectableText(urwid.Text):
+    """A text widget that can take focus, eg: to be highlighted in a list."""
+
+    _selectable = True
+
+    def keypress(self, size, key):
+        return key